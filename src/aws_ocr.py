@@ -1,18 +1,27 @@
 import base64
+import functools
 import io
-import json
 import os
-import boto3
-import pandas as pd
 
 from typing import Dict, List
-from botocore.config import Config
 from PIL import Image
-from dotenv import load_dotenv
-
-load_dotenv()
-AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
+from batch_ocr import run_batch
+from ingestion import PDF_RENDER_DPI, iter_pages, merge_page_results
+from clients import get_textract_client
+from ocr_cache import get_ocr_cache, make_ocr_cache_key
+from geometry import WordBoxIndex
+from image_prep import PreparedImage, prepare_image
+from metrics import estimate_ocr_cost, span
+from near_duplicates import reuse_near_duplicate
+from table_detection import detect_tables, has_tables
+from text_layout import layout_text, layout_text_batch
+from textract_parser import ParsedTextract, parse_textract_response, parse_textract_stream
+from result_io import write_result
+from settings import setting, settings_getattr
+
+TABLE_ENGINES = ("provider", "local", "prescreen")
+# read on first use so importing this module needs neither boto3 nor the credentials
+__getattr__ = settings_getattr(__name__, ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"))
 
 
 def convert_aws_geometry_bounding_box_to_system_bbox(block: dict, page_width: int, page_height: int):
@@ -30,27 +39,7 @@ def convert_aws_geometry_bounding_box_to_system_bbox(block: dict, page_width: in
 
 
 def sort_words_to_pretty_text(words_with_boxes: list[dict] = [], space_height_threshold=5, space_width_threshold=4):
-    botoms = list(set([t["bbox"]["b"] for t in words_with_boxes]))
-    botoms = sorted(botoms)
-    text_df = pd.DataFrame([{"text": t["text"], "left": t["bbox"]["l"], "right": t["bbox"]["r"], "top": t["bbox"]["t"], "bottom": t["bbox"]["b"]} for t in words_with_boxes])
-    used_botoms = []
-    line_message: str = ""
-    for btm in botoms:
-        lines: pd.DataFrame = text_df[~text_df.index.isin(used_botoms) & (text_df["bottom"] <= btm + space_height_threshold) & (text_df["bottom"] >= btm - space_height_threshold)]
-        if not lines.empty:
-            used_botoms.extend(lines.index)
-            lines = lines.sort_values(by="left")
-            prev_word = lines.iloc[0]
-            line_message += prev_word["text"]
-            for _, word in lines[1:].iterrows():
-                join_text = ""
-                if word["left"] - prev_word["right"] > space_width_threshold:
-                    join_text = " "
-                line_message += join_text + word["text"]
-                prev_word = word
-            line_message += "\n"
-
-    return line_message
+    return layout_text(words_with_boxes, space_height_threshold=space_height_threshold, space_width_threshold=space_width_threshold)
 
 
 def is_inside(A, B):
@@ -69,11 +58,16 @@ def word_bbox_coordinates(word):
     ]
 
 
-def get_rows_columns_map(table_result, blocks_map, words: List[Dict] = None, page_width: int = 0, page_height: int = 0):
+def get_rows_columns_map(table_result, blocks_map, words: List[Dict] = None, page_width: int = 0, page_height: int = 0, word_index: WordBoxIndex = None):
+    if word_index is None:
+        word_index = WordBoxIndex(words or [])
+
     rows: Dict[int, List] = {}
     merged_cells: Dict[int, List] = {}
     scores: Dict[int, List] = {}
     polygon: Dict[int, List] = {}
+    cell_words: List[List[Dict]] = []
+    cell_slots: List[tuple] = []
 
     for relationship in table_result["Relationships"]:
         if relationship["Type"] in ["CHILD", "MERGED_CELL"]:
@@ -103,14 +97,13 @@ def get_rows_columns_map(table_result, blocks_map, words: List[Dict] = None, pag
                     polygon_block: List[Dict] = geometry.get("Polygon")
                     polygon_block_calculated = [{"X": int(pgb.get("X", 0) * page_width), "Y": int(pgb.get("Y", 0) * page_height)} for pgb in polygon_block]
                     polygon[row_index].append(polygon_block_calculated)
-                    words_inside = [word for word in words if is_inside(A=[tuple(plg.values()) for plg in polygon_block_calculated], B=word_bbox_coordinates(word))]
+                    words_inside = word_index.words_inside([tuple(plg.values()) for plg in polygon_block_calculated])
 
-                    # get cell text
-                    pretty_text = "-"
+                    # cell text is laid out for all cells at once below
+                    rows[row_index].append("-")
                     if words_inside:
-                        pretty_text = sort_words_to_pretty_text(words_inside)
-
-                    rows[row_index].append(pretty_text.strip())
+                        cell_slots.append((row_index, len(rows[row_index]) - 1))
+                        cell_words.append(words_inside)
 
                 elif cell["BlockType"] == "MERGED_CELL":
                     if row_index not in merged_cells:
@@ -124,27 +117,25 @@ def get_rows_columns_map(table_result, blocks_map, words: List[Dict] = None, pag
                             "column_span": column_span,
                         }
                     )
-    return rows, scores, merged_cells, polygon
 
+    for (row_index, column_position), pretty_text in zip(cell_slots, layout_text_batch(cell_words)):
+        rows[row_index][column_position] = pretty_text.strip()
+
+    return rows, scores, merged_cells, polygon
 
-def get_data_table(aws_analyze_data: dict, words: List[Dict] = None, page_width: int = 0, page_height: int = 0):
 
-    response = aws_analyze_data
-    # Get the text blocks
-    blocks: List[Dict] = response.get("Blocks", [])
-    blocks_map = {}
-    table_blocks = []
-    for block in blocks:
-        blocks_map[block.get("Id")] = block
-        if block.get("BlockType") == "TABLE":
-            table_blocks.append(block)
+def get_data_table(aws_analyze_data: dict, words: List[Dict] = None, page_width: int = 0, page_height: int = 0, parsed: ParsedTextract = None):
+    if parsed is None:
+        parsed = parse_textract_response(aws_analyze_data, page_width=page_width, page_height=page_height)
+    table_blocks = parsed.table_blocks
 
     if len(table_blocks) <= 0:
         return table_blocks
 
     tables: List[Dict] = []
+    word_index = WordBoxIndex(parsed.words if words is None else words)
     for index, table in enumerate(table_blocks):
-        rows, scores, merged_cells, polygon = get_rows_columns_map(table, blocks_map, words=words, page_width=page_width, page_height=page_height)
+        rows, scores, merged_cells, polygon = get_rows_columns_map(table, parsed.blocks_map, page_width=page_width, page_height=page_height, word_index=word_index)
         column_count = max(len(row) for row in rows.values())
         table_data = {
             "id": f"table-{index+1}",
@@ -160,86 +151,126 @@ def get_data_table(aws_analyze_data: dict, words: List[Dict] = None, page_width:
     return tables
 
 
-def get_aws_textannotations_formatedtext(response: dict, page_width=0, page_height=0):
-    # deep copy
-    blocks_str = json.dumps(response["Blocks"], ensure_ascii=False)
-    blocks: list[Dict] = json.loads(blocks_str)
+def get_aws_textannotations_formatedtext(response: dict, page_width=0, page_height=0, parsed: ParsedTextract = None, as_columns=False):
+    """``text_annotations`` are plain dicts, or a columnar ``WordBoxes`` with ``as_columns=True``."""
+    if parsed is None:
+        parsed = parse_textract_response(response, page_width=page_width, page_height=page_height, with_tables=False)
+    return {"text_annotations": parsed.words if as_columns else parsed.words.to_list(), "format_text": parsed.format_text}
+
+
+def get_aws_textract_result(response: dict, page_width=0, page_height=0, use_extract_table=False, as_columns=False):
+    with span("postprocess", "aws-textract"):
+        parsed = parse_textract_response(response, page_width=page_width, page_height=page_height, with_tables=use_extract_table)
+        result = get_aws_textannotations_formatedtext(response, parsed=parsed, as_columns=as_columns)
+    if use_extract_table:
+        with span("table_extraction", "aws-textract"):
+            result["tables"] = get_data_table(aws_analyze_data=response, page_width=page_width, page_height=page_height, parsed=parsed)
+    return result
+
+
+def get_aws_textract_result_from_stream(source, page_width=0, page_height=0, use_extract_table=False, as_columns=False):
+    """Same result as ``get_aws_textract_result`` for a response streamed from a path or readable file/socket."""
+    parsed = parse_textract_stream(source, page_width=page_width, page_height=page_height, with_tables=use_extract_table)
+    result = get_aws_textannotations_formatedtext(None, parsed=parsed, as_columns=as_columns)
+    if use_extract_table:
+        result["tables"] = get_data_table(aws_analyze_data=None, page_width=page_width, page_height=page_height, parsed=parsed)
+    return result
+
 
-    format_text = ""
-    text_annotations = []
-    text_lines = []
+def _postprocess_textract_response(response: dict, image_data, use_extract_table=False, as_columns=False):
+    if isinstance(image_data, PreparedImage):
+        width, height = image_data.width, image_data.height
+    else:
+        if type(image_data) == str:
+            image_data = base64.b64decode(image_data)
+        width, height = Image.open(io.BytesIO(image_data)).size
+    return get_aws_textract_result(response, page_width=width, page_height=height, use_extract_table=use_extract_table, as_columns=as_columns)
+
+
+def aws_textract_batch(images, use_extract_table=False, ocr=None, **batch_kwargs):
+    """Textract many images concurrently, see ``batch_ocr.run_batch``; ``ocr`` replaces the Textract call, e.g. with a replay provider."""
+    if ocr is None:
+        ocr = functools.partial(aws_textract_image, use_extract_table=use_extract_table)
+    return run_batch(images, ocr, functools.partial(_postprocess_textract_response, use_extract_table=use_extract_table), **batch_kwargs)
 
-    for block in blocks:
-        bbox_data = {"bbox": None, "text": None}
-        try:
-            if str(block.get("BlockType", "PAGE")).lower() != "page":
-                bbox_data = convert_aws_geometry_bounding_box_to_system_bbox(block, page_width, page_height)
-        except:
-            pass
 
-        if block["BlockType"] == "WORD":
-            text_annotations.append(bbox_data)
+def aws_textract_document(source, use_extract_table=False, dpi=PDF_RENDER_DPI, ocr=None, **batch_kwargs):
+    """Textract a multi-page TIFF/PDF page by page, decoding pages lazily, and merge the pages into one result."""
+    return merge_page_results(aws_textract_batch(iter_pages(source, dpi=dpi), use_extract_table=use_extract_table, ocr=ocr, **batch_kwargs))
 
-        elif block["BlockType"] == "LINE":
-            block.update({"bbox_data": bbox_data})
-            text_lines.append(block)
 
-    sorted_lines = sorted(text_lines, key=lambda x: (x["Geometry"]["BoundingBox"]["Top"], x["Geometry"]["BoundingBox"]["Left"]))
-    for line in sorted_lines:
-        format_text += "{}\n".format(line["Text"])
+def aws_textract_tables(image_data, table_engine="prescreen", use_cache=True, as_columns=False):
+    """Text and tables for one image, the tables from ``table_engine``:
 
-    return {"text_annotations": text_annotations, "format_text": format_text}
+    ``provider`` always pays for ``analyze_document`` TABLES, ``local`` infers the tables from the
+    words of the cheap ``detect_document_text`` call and ``prescreen`` makes the cheap call and
+    only pays for ``analyze_document`` when the words contain a tabular region.
+    """
+    if table_engine not in TABLE_ENGINES:
+        raise ValueError(f"table_engine must be one of {TABLE_ENGINES}")
 
+    if table_engine != "provider":
+        result = _postprocess_textract_response(aws_textract_image(image_data, use_extract_table=False, use_cache=use_cache), image_data, as_columns=True)
+        words = result["text_annotations"]
+        if table_engine == "local" or not has_tables(words):
+            result["tables"] = detect_tables(words) if table_engine == "local" else []
+            if not as_columns:
+                result["text_annotations"] = words.to_list()
+            return result
 
-def aws_textract_image(image_data, use_extract_table=False):
+    return _postprocess_textract_response(aws_textract_image(image_data, use_extract_table=True, use_cache=use_cache), image_data, use_extract_table=True, as_columns=as_columns)
 
-    if type(image_data) == str:
+
+def aws_textract_image(image_data, use_extract_table=False, use_cache=True):
+
+    if isinstance(image_data, PreparedImage):
+        image_data = image_data.data
+    elif type(image_data) == str:
         image_data = base64.b64decode(image_data)
 
-    image = Image.open(io.BytesIO(image_data))
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-        image_io = io.BytesIO()
-        image.save(image_io, "JPEG")
-        image_data = image_io.getvalue()
+    if not use_cache:
+        return _aws_textract_request(image_data, use_extract_table)
 
-    boto3_config = Config(retries={"max_attempts": 10, "mode": "standard"})
-    client = boto3.client(
-        "textract",
-        region_name="ap-southeast-1",
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        config=boto3_config,
-    )
+    cache_key = make_ocr_cache_key(image_data, "aws-textract", "analyze_document-tables" if use_extract_table else "detect_document_text")
+    # Textract geometry is relative to the page, so a rescanned page reuses it unchanged
+    return get_ocr_cache().get_or_compute(cache_key, lambda: reuse_near_duplicate(image_data, cache_key, lambda: _aws_textract_request(image_data, use_extract_table)))
 
-    if not use_extract_table:
-        return client.detect_document_text(Document={"Bytes": image_data})
-    else:
-        return client.analyze_document(Document={"Bytes": image_data}, FeatureTypes=["TABLES"])
 
+def _aws_textract_request(image_data: bytes, use_extract_table=False):
+    with span("image_prep", "aws-textract"):
+        image_data = prepare_image(image_data, provider="aws-textract").data
+
+    client = get_textract_client(
+        region_name="ap-southeast-1",
+        aws_access_key_id=setting("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=setting("AWS_SECRET_ACCESS_KEY"),
+    )
 
-# Without table AWS_TEXTRACT 1.50 / 1000
-# With table AWS_TABLE 15 / 1000
+    # prices per 1000 pages are in metrics.OCR_PRICES
+    mode = "analyze_document-tables" if use_extract_table else "detect_document_text"
+    with span("ocr_request", "aws-textract", mode=mode) as request_span:
+        request_span.set(bytes_sent=len(image_data), pages=1, cost_usd=estimate_ocr_cost("aws-textract", mode))
+        if not use_extract_table:
+            return client.detect_document_text(Document={"Bytes": image_data})
+        else:
+            return client.analyze_document(Document={"Bytes": image_data}, FeatureTypes=["TABLES"])
 
 if __name__ == "__main__":
-    image_bin = open(os.path.join("images", "test-1.png"), "rb").read()
-    width, height = Image.open(io.BytesIO(image_bin)).size
+    image_bin = prepare_image(open(os.path.join("images", "test-1.png"), "rb").read(), provider="aws-textract")
+    width, height = image_bin.width, image_bin.height
 
     # without table
     without_table_result: dict = {}
     without_table_result = aws_textract_image(image_bin, use_extract_table=False)
-    with open("python/results/aws-original-textract-without-table.json", "w") as writer:
-        writer.write(json.dumps(without_table_result, indent=2, ensure_ascii=False))
+    write_result("python/results/aws-original-textract-without-table.json", without_table_result)
 
     without_table_result = get_aws_textannotations_formatedtext(without_table_result, page_width=width, page_height=height)
-    with open("python/results/aws-textract-without-table.json", "w") as writer:
-        writer.write(json.dumps(without_table_result, indent=2, ensure_ascii=False))
+    write_result("python/results/aws-textract-without-table.json", without_table_result)
 
     # with table
     with_table_result: dict = {}
     with_table_result_raw = aws_textract_image(image_bin, use_extract_table=True)
-    with open("python/results/aws-original-textract-with-table.json", "w") as writer:
-        writer.write(json.dumps(with_table_result_raw, indent=2, ensure_ascii=False))
+    write_result("python/results/aws-original-textract-with-table.json", with_table_result_raw)
 
     with_table_result = get_aws_textannotations_formatedtext(with_table_result_raw, page_width=width, page_height=height)
     with_table_result.update(
@@ -252,5 +283,4 @@ if __name__ == "__main__":
             )
         }
     )
-    with open("python/results/aws-textract-with-table.json", "w") as writer:
-        writer.write(json.dumps(with_table_result, indent=2, ensure_ascii=False))
+    write_result("python/results/aws-textract-with-table.json", with_table_result)
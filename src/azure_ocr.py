@@ -1,20 +1,29 @@
 import base64
+import bisect
+import functools
 import io
-import json
 import os
-import requests
-import requests
-import base64
+from typing import TYPE_CHECKING
+
+from PIL import Image, UnidentifiedImageError
 
-from PIL import Image
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.formrecognizer import DocumentAnalysisClient, DocumentWord, DocumentTableCell, DocumentTable, DocumentParagraph
-from dotenv import load_dotenv
+from batch_ocr import run_batch
+from ingestion import PDF_RENDER_DPI, iter_pages, merge_page_results
+from clients import get_document_analysis_client
+from ocr_cache import get_ocr_cache, make_ocr_cache_key
+from geometry import PolygonIndex
+from image_prep import prepare_image
+from metrics import estimate_ocr_cost, span
+from near_duplicates import rescale_analyze_result, reuse_near_duplicate
+from result_io import write_result
+from settings import setting, settings_getattr
+from word_boxes import WordBoxes
 
-load_dotenv()
+if TYPE_CHECKING:
+    from azure.ai.formrecognizer import AnalyzeResult, DocumentWord, DocumentTableCell, DocumentTable, DocumentParagraph
 
-AZURE_FORMREGONIZER_ENDPOINT = os.environ["AZURE_FORMREGONIZER_ENDPOINT"]
-AZURE_FORMREGONIZER_KEY = os.environ["AZURE_FORMREGONIZER_KEY"]
+# read on first use so importing this module needs neither the SDK nor the credentials
+__getattr__ = settings_getattr(__name__, ("AZURE_FORMREGONIZER_ENDPOINT", "AZURE_FORMREGONIZER_KEY"))
 
 
 def is_point_inside_polygon(point, polygon):
@@ -38,26 +47,38 @@ def is_point_inside_polygon(point, polygon):
     return inside
 
 
-def is_within_table(paragraph: DocumentParagraph, tables: list[DocumentTable]):
+def get_table_polygons(tables: "list[DocumentTable]"):
+    """Precompute the table polygons once per document."""
+    return PolygonIndex([[(point.x, point.y) for point in table.bounding_regions[0].polygon] for table in tables])
+
+
+def is_within_table(paragraph: "DocumentParagraph", tables: "list[DocumentTable]", table_polygons: PolygonIndex = None):
     """Check if a paragraph is within any of the tables."""
-    for table in tables:
-        table_polygon = [(point.x, point.y) for point in table.bounding_regions[0].polygon]
-        for point in paragraph.bounding_regions[0].polygon:
-            if is_point_inside_polygon((point.x, point.y), table_polygon):
-                return True
-    return False
+    if table_polygons is None:
+        table_polygons = get_table_polygons(tables)
+    return table_polygons.contains_any([(point.x, point.y) for point in paragraph.bounding_regions[0].polygon])
+
 
+def get_word_box(word: "DocumentWord"):
+    """``(left, top, right, bottom)`` of the word's polygon, which need not start at its top-left corner."""
+    x_list = [point.x for point in word.polygon]
+    y_list = [point.y for point in word.polygon]
+    return min(x_list), min(y_list), max(x_list), max(y_list)
 
-def get_text_annotation(word: DocumentWord):
-    point1 = list(word.polygon[0])
-    point2 = list(word.polygon[2])
+
+def get_text_annotation(word: "DocumentWord"):
+    left, top, right, bottom = get_word_box(word)
+    point1 = (left, top)
+    point2 = (right, bottom)
     bbox = {"pt1": point1, "pt2": point2, "l": point1[0], "t": point1[-1], "r": point2[0], "b": point2[-1]}
     text_annotation = {"bbox": bbox, "text": word.content}
     return text_annotation
 
 
-def get_azure_textannotations_formatedtext(response_dict: dict):
+def get_azure_textannotations_formatedtext(response_dict: dict, as_columns=False):
+    """``text_annotations`` are plain dicts, or a columnar ``WordBoxes`` with ``as_columns=True``."""
     text_annotations = []
+    word_columns = ([], [], [], [], [])
     format_text = ""
 
     for block in response_dict["readResult"]["blocks"]:
@@ -70,42 +91,113 @@ def get_azure_textannotations_formatedtext(response_dict: dict):
                 y_list = [c["y"] for c in bounding_box]
                 point1 = (min(x_list), min(y_list))
                 point2 = (max(x_list), max(y_list))
-                bbox = {"pt1": point1, "pt2": point2, "l": point1[0], "t": point1[-1], "r": point2[0], "b": point2[-1]}
-                bbox_result = {"bbox": bbox, "text": word["text"]}
-                text_annotations.append(bbox_result)
+                if as_columns:
+                    for column, value in zip(word_columns, (*point1, *point2, word["text"])):
+                        column.append(value)
+                else:
+                    bbox = {"pt1": point1, "pt2": point2, "l": point1[0], "t": point1[-1], "r": point2[0], "b": point2[-1]}
+                    text_annotations.append({"bbox": bbox, "text": word["text"]})
     return {
-        "text_annotations": text_annotations,
+        "text_annotations": WordBoxes.from_columns(*word_columns) if as_columns else text_annotations,
         "format_text": format_text,
     }
 
 
-def azure_extracttext(image_data: str | bytes, use_extract_table=False):
-    tables = []
+def prepare_document(image_data: bytes):
+    """Upload bytes for Form Recognizer and the ``(scale_x, scale_y)`` from them back to the original page.
+
+    PDFs, multi-page TIFFs and anything PIL cannot decode are sent unchanged, as Form Recognizer
+    reads them itself; the scale is None whenever the pixels sent are the original ones.
+    """
+    if image_data[:5] == b"%PDF-":
+        return image_data, None
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        if getattr(image, "n_frames", 1) > 1:
+            return image_data, None
+        prepared = prepare_image(image_data, provider="azure-formrecognizer")
+    except UnidentifiedImageError:
+        return image_data, None
+    if (prepared.width, prepared.height) == image.size:
+        return prepared.data, None
+    return prepared.data, (image.width / prepared.width, image.height / prepared.height)
+
+
+def azure_analyze_document(image_data: bytes, model_id: str, use_cache=True) -> "AnalyzeResult":
+    from azure.ai.formrecognizer import AnalyzeResult
+
+    def analyze():
+        with span("image_prep", "azure-formrecognizer"):
+            document, scale = prepare_document(image_data)
+
+        document_analysis_client = get_document_analysis_client(setting("AZURE_FORMREGONIZER_ENDPOINT"), setting("AZURE_FORMREGONIZER_KEY"))
+        with span("ocr_request", "azure-formrecognizer", mode=model_id) as request_span:
+            request_span.set(bytes_sent=len(document))
+            result = document_analysis_client.begin_analyze_document(model_id, document).result()
+            request_span.set(pages=len(result.pages), cost_usd=estimate_ocr_cost("azure-formrecognizer", model_id, len(result.pages)))
+        if scale is not None:
+            # polygons of a downscaled upload are mapped back to the caller's pixels
+            result = AnalyzeResult.from_dict(rescale_analyze_result(result.to_dict(), *scale))
+        return result
+
+    if not use_cache:
+        return analyze()
+
+    cache_key = make_ocr_cache_key(image_data, "azure-formrecognizer", model_id)
+    return AnalyzeResult.from_dict(
+        get_ocr_cache().get_or_compute(cache_key, lambda: reuse_near_duplicate(image_data, cache_key, lambda: analyze().to_dict(), rescale=rescale_analyze_result))
+    )
+
+
+def azure_extracttext(image_data: str | bytes, use_extract_table=False, use_cache=True, as_columns=False):
     if type(image_data) == str:
         image_data = base64.b64decode(image_data)
 
-    document_analysis_client = DocumentAnalysisClient(
-        endpoint=AZURE_FORMREGONIZER_ENDPOINT,
-        credential=AzureKeyCredential(AZURE_FORMREGONIZER_KEY),
-    )
+    result = azure_analyze_document(image_data, "prebuilt-layout" if use_extract_table else "prebuilt-read", use_cache=use_cache)
+    with span("postprocess", "azure-formrecognizer"):
+        return get_azure_formatedresult(result, as_columns=as_columns)
+
+
+def get_cell_score(cell: "DocumentTableCell", word_offsets: list, word_confidences: list) -> float:
+    """Mean confidence of the words in the cell's spans on Textract's 0-100 scale; Azure has no cell confidence. 0 for an empty cell."""
+    confidences = []
+    for span in cell.spans:
+        start = bisect.bisect_left(word_offsets, span.offset)
+        end = bisect.bisect_left(word_offsets, span.offset + span.length)
+        confidences.extend(word_confidences[start:end])
+    return 100 * sum(confidences) / len(confidences) if confidences else 0.0
 
-    poller = document_analysis_client.begin_analyze_document("prebuilt-layout" if use_extract_table else "prebuilt-read", image_data)
-    result = poller.result()
+
+def get_azure_formatedresult(result: "AnalyzeResult", as_columns=False):
+    """``text_annotations`` are plain dicts, or a columnar ``WordBoxes`` with ``as_columns=True``."""
+    tables = []
     text_annotations = []
+    word_columns = ([], [], [], [], [])
     text_content = ""
 
     for page in result.pages:
         for word in page.words:
-            if word.polygon:
+            if not word.polygon:
+                continue
+            if as_columns:
+                for column, value in zip(word_columns, (*get_word_box(word), word.content)):
+                    column.append(value)
+            else:
                 text_annotations.append(get_text_annotation(word))
 
+    table_polygons = get_table_polygons(result.tables)
     for i, paragraph in enumerate(result.paragraphs):
-        if not is_within_table(paragraph, result.tables):
+        if not is_within_table(paragraph, result.tables, table_polygons=table_polygons):
             paragraph_content = (paragraph.content).replace("\n", "").strip()
             text_content += "{}\n".format(paragraph_content)
 
+    # word confidences in ``result.content`` order, to score the cells that hold the words
+    page_words = sorted((word.span.offset, word.confidence) for page in result.pages for word in page.words if word.span is not None)
+    word_offsets = [offset for offset, _ in page_words]
+    word_confidences = [confidence for _, confidence in page_words]
+
     for table_idx, table in enumerate(result.tables):
-        table_cells: list[DocumentTableCell] = table.cells
+        table_cells: "list[DocumentTableCell]" = table.cells
         table_dict = {
             "id": f"Table {table_idx+1}",
             "merged_cells": {},
@@ -125,28 +217,56 @@ def azure_extracttext(image_data: str | bytes, use_extract_table=False):
 
             table_dict["polygon"][str(cell.row_index)].append([list(b.polygon) for b in cell.bounding_regions])
             table_dict["rows"][str(cell.row_index)].append(cell.content)
+            table_dict["scores"].setdefault(str(cell.row_index), []).append(get_cell_score(cell, word_offsets, word_confidences))
+            if (cell.row_span or 1) > 1 or (cell.column_span or 1) > 1:
+                table_dict["merged_cells"].setdefault(str(cell.row_index), {})[str(cell.column_index)] = {
+                    "row_span": cell.row_span or 1,
+                    "column_span": cell.column_span or 1,
+                }
 
         tables.append(table_dict)
 
     return {
-        "text_annotations": text_annotations,
+        "text_annotations": WordBoxes.from_columns(*word_columns) if as_columns else text_annotations,
         "format_text": text_content,
         "tables": tables,
     }
 
 
+def _analyze_document_dict(image_data: str | bytes, use_extract_table=False):
+    if type(image_data) == str:
+        image_data = base64.b64decode(image_data)
+    return azure_analyze_document(image_data, "prebuilt-layout" if use_extract_table else "prebuilt-read").to_dict()
+
+
+def _postprocess_analyze_result(result_dict: dict, image_data=None, as_columns=False):
+    from azure.ai.formrecognizer import AnalyzeResult
+
+    with span("postprocess", "azure-formrecognizer"):
+        return get_azure_formatedresult(AnalyzeResult.from_dict(result_dict), as_columns=as_columns)
+
+
+def azure_extracttext_batch(images, use_extract_table=False, ocr=None, **batch_kwargs):
+    """Analyze many images concurrently, see ``batch_ocr.run_batch``; ``ocr`` must return ``AnalyzeResult.to_dict()`` output."""
+    if ocr is None:
+        ocr = functools.partial(_analyze_document_dict, use_extract_table=use_extract_table)
+    return run_batch(images, ocr, _postprocess_analyze_result, **batch_kwargs)
+
+
+def azure_extracttext_document(source, use_extract_table=False, dpi=PDF_RENDER_DPI, ocr=None, **batch_kwargs):
+    """Analyze a multi-page TIFF/PDF page by page, decoding pages lazily, and merge the pages into one result."""
+    return merge_page_results(azure_extracttext_batch(iter_pages(source, dpi=dpi), use_extract_table=use_extract_table, ocr=ocr, **batch_kwargs))
+
+
 if __name__ == "__main__":
     image_bin = open(os.path.join("images", "test-5.png"), "rb").read()
-    width, height = Image.open(io.BytesIO(image_bin)).size
 
     # without table
     without_table_result: dict = {}
     without_table_result = azure_extracttext(image_bin, use_extract_table=False)
-    with open("python/results/azure-textract-without-table.json", "w") as writer:
-        writer.write(json.dumps(without_table_result, indent=2, ensure_ascii=False))
+    write_result("python/results/azure-textract-without-table.json", without_table_result)
 
     # with table
     with_table_result: dict = {}
     with_table_result_raw = azure_extracttext(image_bin, use_extract_table=True)
-    with open("python/results/azure-textract-with-table.json", "w") as writer:
-        writer.write(json.dumps(with_table_result_raw, indent=2, ensure_ascii=False))
+    write_result("python/results/azure-textract-with-table.json", with_table_result_raw)
@@ -1,9 +1,10 @@
-import base64
 import io
-from typing import List
+import itertools
+import warnings
+from typing import Iterable, Iterator
 
 from PIL import Image
-from azure_ocr import azure_extracttext
+from vision_payload import build_vision_content
 
 EXTRACTION_PROMPT = """You`re helpful to extract fields from document text.
 You response will be in json format that fit for python json loads
@@ -50,42 +51,46 @@ Value Conditions:
 """
 
 import json
-import os
-from dotenv import load_dotenv
-import requests
+import time
+from clients import get_http_session
+from llm_cache import get_llm_cache
+from llm_stream import iter_sse_content, stream_json_fields
+from metrics import estimate_llm_cost, span
+from rate_limit import THROTTLED_STATUS, estimate_request_tokens, get_rate_limiter, parse_retry_after
+from result_io import write_result
+from settings import setting, settings_getattr
 
-load_dotenv()
-
-OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE")
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-OPENAI_API_TYPE = os.environ.get("OPENAI_API_TYPE")
-OPENAI_API_VERSION = os.environ.get("OPENAI_API_VERSION")
+# read on first use, not at import
+__getattr__ = settings_getattr(__name__, ("OPENAI_API_BASE", "OPENAI_API_KEY", "OPENAI_API_TYPE", "OPENAI_API_VERSION", "OPENAI_VISION_URL"))
 
+# attempts per chat-completions request while the deployment answers 429
+LLM_MAX_ATTEMPTS = 5
 
 GPT35TURBO = "gpt-35-turbo-16k"
 GPT4TURBO = "gpt-4-turbo"
 GPT4VISION = "gpt-4-vision"
 
 
-def extract_data_from_images(
-    images: List[Image.Image] = [],
+def build_images_request(
+    images: Iterable[Image.Image] = [],
     document_description: str = "None",
     format_instructions: dict = {},
     prompt: str = EXTRACTION_PROMPT_VISION,
+    max_images: int = 10,
+    image_token_budget: int = None,
+    stream: bool = False,
 ):
     messages = [{"type": "text", "text": "Extract infomation from document image."}]
-    # max 10 pages
-    for idx, image in enumerate(images[:10]):
-        image_binary = io.BytesIO()
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-
-        image.save(image_binary, format="JPEG", optimize=True)
-        image_binary = image_binary.getvalue()
-        image_base64 = base64.b64encode(image_binary).decode("utf-8")
-        messages.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}})
-
-    url = f"https://cogopenaiscgjwddocutil1.openai.azure.com/openai/deployments/gpt-4-vision/chat/completions?api-version=2024-02-15-preview"
+    # only the first max_images pages of a lazy ingestion.iter_page_images() are ever decoded
+    images = iter(images)
+    with span("image_prep", GPT4VISION) as prep_span:
+        image_messages, payload_stats = build_vision_content(list(itertools.islice(images, max_images)), image_token_budget=image_token_budget)
+        prep_span.set(pages=payload_stats["pages"])
+    messages.extend(image_messages)
+
+    if next(images, None) is not None:
+        warnings.warn(f"extract_data_from_images only sends the first {max_images} pages")
+
     payload = {
         "enhancements": {"ocr": {"enabled": True}, "grounding": {"enabled": False}},
         "messages": [
@@ -109,23 +114,23 @@ def extract_data_from_images(
         "temperature": 0,
         "top_p": 0,
         "max_tokens": 4096,
-        "stream": False,
+        "stream": stream,
     }
 
-    headers = {"api-key": OPENAI_API_KEY, "content-type": "application/json"}
-    response = requests.request("POST", url, json=payload, headers=headers)
-    return response.json()
+    headers = {"api-key": setting("OPENAI_API_KEY"), "content-type": "application/json"}
+    return {"url": setting("OPENAI_VISION_URL"), "json": payload, "headers": headers}, payload_stats
 
 
-def extract_data_from_plaintext(
+def build_plaintext_request(
     text: str,
     engine="gpt-35-turbo-16k",
     document_description: str = "None",
     format_instructions: dict = {},
     prompt: str = EXTRACTION_PROMPT,
+    stream: bool = False,
 ):
-    url = "{baseurl}/deployments/{model}/chat/completions".format(baseurl=OPENAI_API_BASE, model=engine)
-    querystring = {"api-version": OPENAI_API_VERSION}
+    url = "{baseurl}/deployments/{model}/chat/completions".format(baseurl=setting("OPENAI_API_BASE"), model=engine)
+    querystring = {"api-version": setting("OPENAI_API_VERSION")}
     payload = {
         "messages": [
             {
@@ -145,15 +150,125 @@ def extract_data_from_plaintext(
         "temperature": 0,
         "top_p": 0,
         "max_tokens": 4096,
-        "stream": False,
+        "stream": stream,
     }
 
-    headers = {"api-key": OPENAI_API_KEY, "content-type": "application/json"}
-    response = requests.request("POST", url, json=payload, headers=headers, params=querystring)
-    return response.json()
+    headers = {"api-key": setting("OPENAI_API_KEY"), "content-type": "application/json"}
+    return {"url": url, "json": payload, "headers": headers, "params": querystring}
+
+
+def _post(engine: str, request: dict, stream: bool = False, image_tokens: int = 0):
+    """POST within the deployment's RPM and TPM quotas, retrying throttled answers after their Retry-After."""
+    limiters = [
+        (limiter, cost)
+        for limiter, cost in ((get_rate_limiter("openai-requests", engine), 1), (get_rate_limiter("openai-tokens", engine), estimate_request_tokens(request["json"], image_tokens)))
+        if limiter is not None
+    ]
+    for attempt in range(LLM_MAX_ATTEMPTS):
+        for limiter, cost in limiters:
+            limiter.acquire(cost)
+        response = get_http_session("openai").request("POST", stream=stream, **request)
+        if response.status_code not in THROTTLED_STATUS:
+            if response.ok:
+                for limiter, _ in limiters:
+                    limiter.on_success()
+            return response
+        if attempt == LLM_MAX_ATTEMPTS - 1:
+            return response
+
+        retry_after = parse_retry_after(response.headers)
+        response.close()
+        for limiter, _ in limiters:
+            limiter.on_throttle(retry_after)
+        if not limiters:
+            time.sleep(retry_after if retry_after is not None else 2**attempt)
+
+
+def _send_request(engine: str, request: dict, use_cache=True, bytes_sent: int = 0, image_tokens: int = 0) -> dict:
+    def send():
+        with span("llm_request", engine) as request_span:
+            response = _post(engine, request, image_tokens=image_tokens).json()
+            usage = response.get("usage") or {}
+            prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+            request_span.set(
+                bytes_sent=bytes_sent,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cost_usd=estimate_llm_cost(engine, prompt_tokens, completion_tokens),
+            )
+            return response
+
+    if not use_cache:
+        return send()
+    return get_llm_cache().get_or_request(engine, request, send)
+
+
+def _stream_request(request: dict, engine: str = "", image_tokens: int = 0) -> Iterator[dict]:
+    started = time.perf_counter()
+    with span("llm_stream", engine), _post(engine, request, stream=True, image_tokens=image_tokens) as response:
+        response.raise_for_status()
+        yield from stream_json_fields(iter_sse_content(response.iter_lines()), started=started)
+
+
+def extract_data_from_images(
+    images: Iterable[Image.Image] = [],
+    document_description: str = "None",
+    format_instructions: dict = {},
+    prompt: str = EXTRACTION_PROMPT_VISION,
+    max_images: int = 10,
+    image_token_budget: int = None,
+    use_cache=True,
+):
+    request, payload_stats = build_images_request(images, document_description, format_instructions, prompt, max_images, image_token_budget)
+    result = _send_request(
+        GPT4VISION, request, use_cache=use_cache, bytes_sent=payload_stats["payload_bytes"], image_tokens=payload_stats["estimated_image_tokens"]
+    )
+    result["payload_stats"] = payload_stats
+    return result
+
+
+def stream_extract_data_from_images(
+    images: Iterable[Image.Image] = [],
+    document_description: str = "None",
+    format_instructions: dict = {},
+    prompt: str = EXTRACTION_PROMPT_VISION,
+    max_images: int = 10,
+    image_token_budget: int = None,
+) -> Iterator[dict]:
+    """Streaming ``extract_data_from_images``: yields ``field`` events as values complete, then a ``done`` event."""
+    request, payload_stats = build_images_request(images, document_description, format_instructions, prompt, max_images, image_token_budget, stream=True)
+    for event in _stream_request(request, GPT4VISION, image_tokens=payload_stats["estimated_image_tokens"]):
+        if event["type"] == "done":
+            event["payload_stats"] = payload_stats
+        yield event
+
+
+def extract_data_from_plaintext(
+    text: str,
+    engine="gpt-35-turbo-16k",
+    document_description: str = "None",
+    format_instructions: dict = {},
+    prompt: str = EXTRACTION_PROMPT,
+    use_cache=True,
+):
+    request = build_plaintext_request(text, engine, document_description, format_instructions, prompt)
+    return _send_request(engine, request, use_cache=use_cache)
+
+
+def stream_extract_data_from_plaintext(
+    text: str,
+    engine="gpt-35-turbo-16k",
+    document_description: str = "None",
+    format_instructions: dict = {},
+    prompt: str = EXTRACTION_PROMPT,
+) -> Iterator[dict]:
+    """Streaming ``extract_data_from_plaintext``: yields ``field`` events as values complete, then a ``done`` event."""
+    yield from _stream_request(build_plaintext_request(text, engine, document_description, format_instructions, prompt, stream=True), engine)
 
 
 if __name__ == "__main__":
+    from azure_ocr import azure_extracttext
+
     image = open("images/test-5.png", "rb").read()
     json_format = {
         "quotation_no": "String",
@@ -167,8 +282,7 @@ if __name__ == "__main__":
         format_instructions=json_format,
     )
     print("gpt_35_result", gpt_35_result["choices"][0]["message"])
-    with open("src/results/gpt_35_result.json", "w") as writer:
-        writer.write(json.dumps(gpt_35_result, indent=2, ensure_ascii=False))
+    write_result("src/results/gpt_35_result.json", gpt_35_result)
 
     gpt_4vision_result = extract_data_from_images(
         images=[Image.open(io.BytesIO(image))],
@@ -176,5 +290,4 @@ if __name__ == "__main__":
         format_instructions=json_format,
     )
     print("gpt_4vision_result", gpt_4vision_result["choices"][0]["message"])
-    with open("src/results/gpt_4vision_result.json", "w") as writer:
-        writer.write(json.dumps(gpt_4vision_result, indent=2, ensure_ascii=False))
+    write_result("src/results/gpt_4vision_result.json", gpt_4vision_result)
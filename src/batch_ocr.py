@@ -0,0 +1,139 @@
+import concurrent.futures
+import itertools
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+
+import metrics
+
+# batches up to this many images post-process on threads: a process pool costs more to feed than it saves
+SMALL_BATCH_ITEMS = 4
+
+_executors: Dict[Tuple[str, int], concurrent.futures.Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_postprocess_executor(kind: str = "process", max_workers: int = 2) -> concurrent.futures.Executor:
+    """Long-lived ``process`` or ``thread`` pool shared by every batch, created on first use.
+
+    Pool processes are spawned, not forked: workers start while OCR threads run, and a fork
+    taken then could inherit a lock one of them held, e.g. the metrics registry's or a
+    logging handler's, and hang on it.
+    """
+    key = (kind, max_workers)
+    with _executors_lock:
+        executor = _executors.get(key)
+        # a process pool whose worker died refuses new work; replace it
+        if executor is None or getattr(executor, "_broken", False):
+            if kind == "process":
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="postprocess")
+            _executors[key] = executor
+        return executor
+
+
+def shutdown_postprocess_executors(wait: bool = True):
+    """Shut the shared pools down, e.g. on worker shutdown; later batches create new ones."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _postprocess_in_process(postprocess: Callable, collect_metrics: bool, raw_response, image_data):
+    """``(result, error, metric records)`` of ``postprocess`` in a pool process, whose spans the parent cannot see."""
+    if collect_metrics:
+        metrics.enable_metrics()
+        # a reused worker may hold spans of an earlier task that did not collect them
+        metrics.registry.drain()
+    try:
+        result, error = postprocess(raw_response, image_data), None
+    except Exception as exc:
+        result, error = None, exc
+    return result, error, metrics.registry.drain() if collect_metrics else None
+
+
+def run_batch(
+    images: Iterable,
+    ocr: Callable,
+    postprocess: Callable = None,
+    max_in_flight: int = 8,
+    postprocess_workers: int = 2,
+    postprocess_executor: concurrent.futures.Executor = None,
+) -> Iterator[dict]:
+    """Run ``ocr(image_data)`` over many images concurrently and yield results as they finish.
+
+    At most ``max_in_flight`` provider calls run at once and ``images`` is only pulled as
+    slots free up, counting the post-processing backlog, so it can be a lazy stream.
+    ``postprocess(raw_response, image_data)`` runs on ``postprocess_executor``, by default
+    the shared thread pool for batches of up to ``SMALL_BATCH_ITEMS`` images and the shared
+    process pool (so it has to be picklable) for larger ones. Every item yields
+    ``{"index", "result", "error", "stage", "elapsed"}``; a failing item reports its
+    exception in ``error`` and the batch carries on. Spans recorded in a process pool are
+    merged into this process's ``metrics.registry``.
+    """
+    image_iterator = enumerate(images)
+    if postprocess is not None and postprocess_executor is None:
+        # look ahead just far enough to tell a small batch from a large one or a stream
+        head = list(itertools.islice(image_iterator, SMALL_BATCH_ITEMS + 1))
+        kind = "thread" if len(head) <= SMALL_BATCH_ITEMS else "process"
+        # created before this batch starts its OCR threads
+        postprocess_executor = get_postprocess_executor(kind, postprocess_workers)
+        image_iterator = itertools.chain(head, image_iterator)
+
+    in_process = isinstance(postprocess_executor, concurrent.futures.ProcessPoolExecutor)
+    ocr_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight)
+    pending = {}
+    ocr_in_flight = 0
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and ocr_in_flight < max_in_flight and len(pending) < max_in_flight + postprocess_workers:
+                try:
+                    index, image_data = next(image_iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[ocr_executor.submit(ocr, image_data)] = ("ocr", index, image_data, time.perf_counter())
+                ocr_in_flight += 1
+
+            if not pending:
+                break
+
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stage, index, image_data, started = pending.pop(future)
+                if stage == "ocr":
+                    ocr_in_flight -= 1
+
+                error = future.exception()
+                if error is None and stage == "ocr" and postprocess is not None:
+                    if in_process:
+                        postprocess_future = postprocess_executor.submit(_postprocess_in_process, postprocess, metrics.metrics_enabled(), future.result(), image_data)
+                    else:
+                        postprocess_future = postprocess_executor.submit(postprocess, future.result(), image_data)
+                    pending[postprocess_future] = ("postprocess", index, None, started)
+                    continue
+
+                result = future.result() if error is None else None
+                if error is None and stage == "postprocess" and in_process:
+                    result, error, records = result
+                    if records is not None:
+                        metrics.registry.merge(records)
+
+                yield {
+                    "index": index,
+                    "result": result,
+                    "error": error,
+                    "stage": stage,
+                    "elapsed": time.perf_counter() - started,
+                }
+    finally:
+        ocr_executor.shutdown(wait=False, cancel_futures=True)
+        # the post-processing pool outlives the batch; drop whatever this batch still queued on it
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,211 @@
+"""Offline post-processing benchmarks over the recorded responses in ``src/results`` and synthetic pages.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2
+
+Needs no network or credentials. With ``--baseline`` every case whose fastest run grew by
+more than ``--threshold`` and by more than the noise of both runs is reported and the exit
+status is 1.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import aws_ocr
+import azure_ocr
+from azure_openai import build_plaintext_request
+from chunked_extraction import chunk_blocks, layout_blocks
+from fake_providers import synthetic_analyze_result, synthetic_page_layout, synthetic_textract_response
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# size of images/test-1.png, the page the recorded Textract responses belong to
+RECORDED_PAGE_SIZE = (1062, 1484)
+SYNTHETIC_SIZES = (10000, 100000)
+REPEAT = 20
+# fast cases are called in a loop until one run takes this long, so timer jitter stays small
+MIN_RUN_MS = 20.0
+# a case is only a regression when its fastest run got slower by this many milliseconds and by
+# NOISE_SPREADS times the larger run-to-run spread (median absolute deviation) of the two runs
+MIN_REGRESSION_MS = 0.1
+NOISE_SPREADS = 3
+
+
+def _reference_workload(values=np.random.default_rng(0).random(20000)):
+    """Fixed mix of interpreter and NumPy work, timed next to every case to measure the machine's current speed."""
+    words = [{"l": value, "t": value * 2, "text": str(index)} for index, value in enumerate(values[:2000].tolist())]
+    sorted(words, key=lambda word: (word["t"], word["l"]))
+    np.sort(values)
+
+
+def _calls_per_run(func: Callable) -> int:
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - started) * 1000
+        if elapsed >= MIN_RUN_MS or number >= 1000:
+            return number
+        number = min(number * max(2, int(MIN_RUN_MS / max(elapsed, 0.001))), 1000)
+
+
+def _time_run(func: Callable, number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) * 1000 / number
+
+
+def time_case(func: Callable, repeat: int = REPEAT, warmup: int = 1) -> Dict:
+    """Per-call milliseconds over ``repeat`` runs; the minimum is the figure least disturbed by the machine.
+
+    Every run is paired with a run of ``_reference_workload`` so a comparison can discount a
+    machine that is slower or faster as a whole, e.g. from CPU frequency or neighbours' load.
+    """
+    for _ in range(warmup):
+        func()
+    number = _calls_per_run(func)
+    reference_number = _calls_per_run(_reference_workload)
+    runs = []
+    reference_runs = []
+    # as in timeit, a collection triggered by earlier cases' garbage is not charged to this one
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            reference_runs.append(_time_run(_reference_workload, reference_number))
+            runs.append(_time_run(func, number))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    median = statistics.median(runs)
+    return {
+        "min_ms": min(runs),
+        "median_ms": median,
+        "mean_ms": statistics.fmean(runs),
+        "spread_ms": statistics.median(abs(run - median) for run in runs),
+        "reference_ms": min(reference_runs),
+        "runs": repeat,
+        "calls_per_run": number,
+    }
+
+
+def _aws_cases(name: str, response: dict, page_width: int, page_height: int) -> Dict[str, Callable]:
+    words = aws_ocr.get_aws_textannotations_formatedtext(response, page_width=page_width, page_height=page_height)["text_annotations"]
+    return {
+        f"aws.textannotations.{name}": lambda: aws_ocr.get_aws_textannotations_formatedtext(response, page_width=page_width, page_height=page_height),
+        f"aws.data_table.{name}": lambda: aws_ocr.get_data_table(response, words=words, page_width=page_width, page_height=page_height),
+        f"aws.pretty_text.{name}": lambda: aws_ocr.sort_words_to_pretty_text(words),
+        f"aws.result.{name}": lambda: aws_ocr.get_aws_textract_result(response, page_width=page_width, page_height=page_height, use_extract_table=True),
+    }
+
+
+def _prompt_cases(name: str, ocr_result: dict) -> Dict[str, Callable]:
+    return {
+        f"prompt.plaintext.{name}": lambda: build_plaintext_request(ocr_result["format_text"]),
+        f"prompt.chunks.{name}": lambda: chunk_blocks(layout_blocks(ocr_result, include_tables=False)),
+    }
+
+
+def build_cases(sizes: List[int] = SYNTHETIC_SIZES) -> Dict[str, Callable]:
+    from azure.ai.formrecognizer import AnalyzeResult
+
+    cases = {}
+    page_width, page_height = RECORDED_PAGE_SIZE
+    with open(os.path.join(RESULTS_DIR, "aws-original-textract-with-table.json")) as reader:
+        recorded = json.load(reader)
+    cases.update(_aws_cases("recorded", recorded, page_width, page_height))
+    cases.update(_prompt_cases("recorded", aws_ocr.get_aws_textract_result(recorded, page_width, page_height, use_extract_table=True)))
+
+    for size in sizes:
+        # a few hundred table cells at every size, more on the bigger pages
+        layout = synthetic_page_layout(size, table_cells=min(size // 50, 1200))
+        name = "synthetic-{}k".format(size // 1000)
+        response = synthetic_textract_response(layout)
+        cases.update(_aws_cases(name, response, layout["width"], layout["height"]))
+        analyze_result = synthetic_analyze_result(layout)
+        cases[f"azure.postprocess.{name}"] = lambda analyze_result=analyze_result: azure_ocr._postprocess_analyze_result(analyze_result)
+        parsed_result = AnalyzeResult.from_dict(analyze_result)
+        cases[f"azure.formatedresult.{name}"] = lambda parsed_result=parsed_result: azure_ocr.get_azure_formatedresult(parsed_result)
+        cases.update(_prompt_cases(name, aws_ocr.get_aws_textract_result(response, layout["width"], layout["height"])))
+    return cases
+
+
+def run_benchmarks(cases: Dict[str, Callable], repeat: int = REPEAT, warmup: int = 1, log=sys.stderr) -> Dict:
+    results = {}
+    for name, func in cases.items():
+        results[name] = time_case(func, repeat=repeat, warmup=warmup)
+        print("{:<40} {:>10.3f} ms (median {:.3f} ms)".format(name, results[name]["min_ms"], results[name]["median_ms"]), file=log)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "cases": results,
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float = 0.2) -> List[Dict]:
+    """Cases whose fastest run grew by more than ``threshold`` (a fraction) against ``baseline``.
+
+    Baseline times are scaled by the change in the case's reference workload time, and a
+    slowdown within ``MIN_REGRESSION_MS`` or ``NOISE_SPREADS`` times either run's spread is
+    treated as noise.
+    """
+    regressions = []
+    for name, result in current["cases"].items():
+        previous = baseline["cases"].get(name)
+        if previous is None:
+            continue
+        baseline_ms = previous["min_ms"]
+        if result.get("reference_ms") and previous.get("reference_ms"):
+            # the baseline at the speed the machine ran this case at
+            baseline_ms *= result["reference_ms"] / previous["reference_ms"]
+        change = result["min_ms"] / baseline_ms - 1 if baseline_ms else 0.0
+        noise_ms = max(MIN_REGRESSION_MS, NOISE_SPREADS * max(result.get("spread_ms", 0.0), previous.get("spread_ms", 0.0)))
+        if change > threshold and result["min_ms"] - baseline_ms > noise_ms:
+            regressions.append({"case": name, "baseline_ms": baseline_ms, "min_ms": result["min_ms"], "change": change})
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline OCR post-processing benchmarks")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a results file written by --output")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before a case counts as a regression (0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(SYNTHETIC_SIZES), help="synthetic page word counts")
+    parser.add_argument("--case", help="only run cases whose name contains this text")
+    args = parser.parse_args(argv)
+
+    cases = build_cases(args.sizes)
+    if args.case:
+        cases = {name: func for name, func in cases.items() if args.case in name}
+    results = run_benchmarks(cases, repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as writer:
+            json.dump(results, writer, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as reader:
+        regressions = compare_results(results, json.load(reader), threshold=args.threshold)
+    for regression in regressions:
+        print("REGRESSION {case}: {baseline_ms:.3f} ms -> {min_ms:.3f} ms ({change:+.0%})".format(**regression), file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
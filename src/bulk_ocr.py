@@ -0,0 +1,274 @@
+"""Bulk OCR, and optionally field extraction, over a directory or a JSONL manifest.
+
+    python bulk_ocr.py images/ --output results.ndjson.gz --provider aws --workers 16
+    python bulk_ocr.py manifest.jsonl --output results.ndjson --extract fields.json
+
+A manifest holds one ``{"path": ..., "id": ...}`` object per line (``id`` defaults to the
+path; relative paths are resolved against the manifest's folder). Every finished document
+is appended to ``--output`` (a ``result_io.NDJSONSink``) as soon as it completes, and that
+file is also the checkpoint: rerunning the same command skips every document already in
+it, so a crashed or killed run neither redoes nor re-bills finished work. With
+``--extract`` each document's OCR result is also written to ``--ocr-checkpoint`` before
+extraction starts, so a document whose extraction failed is retried without paying for
+its OCR again. Failed documents go to ``--errors`` and are retried on the next run.
+Progress with docs/s, pages/s and an ETA is written to stderr.
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List
+
+from batch_ocr import run_batch
+from ingestion import PDF_RENDER_DPI, iter_pages
+from result_io import NDJSONReader, NDJSONSink
+
+DOCUMENT_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp", ".pdf")
+PROVIDERS = ("aws", "azure", "hedged")
+PROGRESS_INTERVAL = 5.0
+
+
+def iter_directory(path: str) -> Iterator[Dict]:
+    """Documents under ``path`` in a stable order, identified by their path relative to it."""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                file_path = os.path.join(root, name)
+                yield {"id": os.path.relpath(file_path, path).replace(os.sep, "/"), "path": file_path}
+
+
+def iter_manifest(path: str) -> Iterator[Dict]:
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as reader:
+        for line in reader:
+            if not line.strip():
+                continue
+            document = json.loads(line)
+            document["path"] = os.path.join(base_dir, document["path"])
+            document.setdefault("id", os.path.relpath(document["path"], base_dir).replace(os.sep, "/"))
+            yield document
+
+
+def iter_documents(source: str) -> Iterator[Dict]:
+    if os.path.isdir(source):
+        return iter_directory(source)
+    return iter_manifest(source)
+
+
+def make_provider(name: str, use_extract_table=False) -> Callable:
+    """``image -> normalized result`` for ``--provider``; ``hedged`` calls Azure when Textract runs past its p95."""
+    from ocr_frontend import HedgedOCR, aws_provider, azure_provider
+
+    if name == "aws":
+        return aws_provider(use_extract_table=use_extract_table)
+    if name == "azure":
+        return azure_provider(use_extract_table=use_extract_table)
+    if name == "hedged":
+        return HedgedOCR([("aws-textract", aws_provider(use_extract_table)), ("azure-formrecognizer", azure_provider(use_extract_table))])
+    raise ValueError(f"unknown provider {name!r}, expected one of {PROVIDERS}")
+
+
+def make_extractor(format_instructions: dict, engine: str = "gpt-35-turbo-16k", document_description: str = "None") -> Callable:
+    """``format_text -> fields`` through ``azure_openai.extract_data_from_plaintext``."""
+    from azure_openai import extract_data_from_plaintext
+    from chunked_extraction import parse_completion_json
+
+    def extract(text: str):
+        response = extract_data_from_plaintext(text, engine=engine, document_description=document_description, format_instructions=format_instructions)
+        fields = parse_completion_json(response)
+        # an answer without a JSON object is kept as it came
+        return fields if fields is not None else response["choices"][0]["message"]["content"]
+
+    return extract
+
+
+class OCRCheckpoint:
+    """OCR records written before extraction, read back when a document's extraction is retried."""
+
+    def __init__(self, path: str):
+        self.sink = NDJSONSink(path)
+        # records of earlier runs; this run only writes
+        self.reader = NDJSONReader(path)
+        self._lock = threading.Lock()
+
+    def get(self, doc_id) -> Dict | None:
+        with self._lock:
+            return self.reader.get(doc_id)
+
+    def write(self, doc_id, record: Dict):
+        self.sink.write(doc_id, record)
+
+    def close(self):
+        self.reader.close()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def process_document(document: Dict, provider: Callable, extract: Callable = None, dpi: int = PDF_RENDER_DPI, ocr_checkpoint: OCRCheckpoint = None) -> Dict:
+    """OCR every page of one document in order; any failing page fails the whole document so it is retried.
+
+    Single-page images reach ``provider`` as the file's bytes, so they share OCR cache entries
+    with direct provider calls on the same files. With an ``ocr_checkpoint`` the OCR record is
+    taken from it when present, or saved to it before ``extract`` runs.
+    """
+    started = time.perf_counter()
+    record = ocr_checkpoint.get(document["id"]) if ocr_checkpoint is not None else None
+    if record is None:
+        pages = [{"page_index": page_index, **provider(page)} for page_index, page in enumerate(iter_pages(document["path"], dpi=dpi))]
+        record = {
+            "source": document["path"],
+            "page_count": len(pages),
+            "pages": pages,
+            "format_text": "".join(page.get("format_text", "") for page in pages),
+        }
+        if ocr_checkpoint is not None:
+            ocr_checkpoint.write(document["id"], record)
+    if extract is not None:
+        record["extraction"] = extract(record["format_text"])
+    record["elapsed"] = time.perf_counter() - started
+    return record
+
+
+class Progress:
+    """Throughput and ETA of the documents processed in this run; resumed ones only count towards the total."""
+
+    def __init__(self, total: int, skipped: int = 0, interval: float = PROGRESS_INTERVAL, log=sys.stderr):
+        self.total = total
+        self.skipped = skipped
+        self.interval = interval
+        self.log = log
+        self.done = 0
+        self.failed = 0
+        self.pages = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def update(self, pages: int = 0, failed: bool = False):
+        self.done += 1
+        self.failed += failed
+        self.pages += pages
+        if time.perf_counter() - self._reported >= self.interval:
+            self.report()
+
+    def snapshot(self) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        docs_per_second = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - self.skipped - self.done
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "done": self.done,
+            "failed": self.failed,
+            "pages": self.pages,
+            "elapsed": elapsed,
+            "docs_per_second": docs_per_second,
+            "pages_per_second": self.pages / elapsed if elapsed else 0.0,
+            "eta_seconds": remaining / docs_per_second if docs_per_second else None,
+        }
+
+    def report(self):
+        self._reported = time.perf_counter()
+        stats = self.snapshot()
+        eta = "--:--:--" if stats["eta_seconds"] is None else time.strftime("%H:%M:%S", time.gmtime(stats["eta_seconds"]))
+        print(
+            "{completed}/{total} docs ({failed} failed) | {docs_per_second:.2f} docs/s {pages_per_second:.2f} pages/s | ETA {eta}".format(
+                completed=stats["skipped"] + stats["done"], eta=eta, **stats
+            ),
+            file=self.log,
+        )
+
+
+def run_bulk(
+    documents: List[Dict],
+    output: str,
+    provider: Callable,
+    extract: Callable = None,
+    errors: str = None,
+    workers: int = 8,
+    dpi: int = PDF_RENDER_DPI,
+    progress_interval: float = PROGRESS_INTERVAL,
+    log=sys.stderr,
+    ocr_checkpoint: str = None,
+) -> Dict:
+    """Process every document not yet in ``output`` with ``workers`` documents in flight; returns the final progress snapshot.
+
+    With ``extract``, OCR records are checkpointed to ``ocr_checkpoint`` (default:
+    ``<output>.ocr.ndjson``, gzipped like ``output``) before extraction.
+    """
+    stem = os.path.splitext(output[:-3] if output.endswith(".gz") else output)[0]
+    errors = errors or stem + ".errors.ndjson"
+    if extract is not None:
+        ocr_checkpoint = ocr_checkpoint or stem + ".ocr.ndjson" + (".gz" if output.endswith(".gz") else "")
+    ocr_records = OCRCheckpoint(ocr_checkpoint) if extract is not None else contextlib.nullcontext()
+    with NDJSONSink(output) as sink, NDJSONSink(errors) as error_sink, ocr_records as checkpoint:
+        todo = [document for document in documents if document["id"] not in sink]
+        progress = Progress(len(documents), skipped=len(documents) - len(todo), interval=progress_interval, log=log)
+        progress.report()
+
+        process = functools.partial(process_document, provider=provider, extract=extract, dpi=dpi, ocr_checkpoint=checkpoint)
+        for item in run_batch(todo, process, max_in_flight=workers):
+            document = todo[item["index"]]
+            if item["error"] is None:
+                sink.write(document["id"], item["result"])
+                progress.update(pages=item["result"]["page_count"])
+            else:
+                error_sink.write(document["id"], {"source": document["path"], "error": repr(item["error"]), "elapsed": item["elapsed"]})
+                progress.update(failed=True)
+        progress.report()
+    return progress.snapshot()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Resumable bulk OCR over a directory or a JSONL manifest")
+    parser.add_argument("source", help="a directory of images/PDFs or a JSONL manifest")
+    parser.add_argument("--output", required=True, help="NDJSON results and checkpoint (.gz for per-record gzip)")
+    parser.add_argument("--errors", help="NDJSON file of failed documents (default: <output>.errors.ndjson)")
+    parser.add_argument("--provider", choices=PROVIDERS, default="aws")
+    parser.add_argument("--tables", action="store_true", help="also extract tables")
+    parser.add_argument("--workers", type=int, default=8, help="documents in flight")
+    parser.add_argument("--dpi", type=int, default=PDF_RENDER_DPI, help="PDF render resolution")
+    parser.add_argument("--extract", help="JSON file of format instructions; runs extract_data_from_plaintext on each document")
+    parser.add_argument("--ocr-checkpoint", help="NDJSON file of OCR results kept for --extract retries (default: <output>.ocr.ndjson)")
+    parser.add_argument("--engine", default="gpt-35-turbo-16k")
+    parser.add_argument("--description", default="None", help="document description for the extraction prompt")
+    parser.add_argument("--progress-interval", type=float, default=PROGRESS_INTERVAL, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    extract = None
+    if args.extract:
+        with open(args.extract, "r", encoding="utf-8") as reader:
+            extract = make_extractor(json.load(reader), engine=args.engine, document_description=args.description)
+
+    provider = make_provider(args.provider, use_extract_table=args.tables)
+    try:
+        stats = run_bulk(
+            list(iter_documents(args.source)),
+            args.output,
+            provider,
+            extract=extract,
+            errors=args.errors,
+            workers=args.workers,
+            dpi=args.dpi,
+            progress_interval=args.progress_interval,
+            ocr_checkpoint=args.ocr_checkpoint,
+        )
+    finally:
+        # HedgedOCR keeps a thread pool for its requests
+        close = getattr(provider, "close", None)
+        if close is not None:
+            close()
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
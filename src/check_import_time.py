@@ -0,0 +1,87 @@
+"""Import-time budget for the pipeline modules.
+
+    python check_import_time.py
+    python check_import_time.py --budget-ms 300 --module aws_ocr
+
+Every module is imported in a fresh interpreter under ``python -X importtime`` with the
+provider credentials removed from the environment. A module fails when the import raises,
+when it loads a provider SDK (or pandas) before the first provider call, or when its
+cumulative import time, the best of ``--repeat`` runs, exceeds the budget. The exit status
+is 1 on any failure.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = ("aws_ocr", "azure_ocr", "azure_openai", "ocr_frontend", "chunked_extraction", "result_io", "table_detection", "bulk_ocr", "clients", "near_duplicates")
+# top-level packages that may only be imported on first use
+DEFERRED_PACKAGES = ("azure", "boto3", "botocore", "pandas", "dotenv")
+# generous enough for a cold laptop; numpy, PIL and requests make up most of it
+IMPORT_TIME_BUDGET_MS = 400.0
+SETTING_PREFIXES = ("AWS_", "AZURE_", "OPENAI_")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def _clean_env() -> Dict[str, str]:
+    env = {key: value for key, value in os.environ.items() if not key.startswith(SETTING_PREFIXES)}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def measure_import(module: str) -> Dict:
+    """Import ``module`` in a fresh interpreter; cumulative milliseconds and the deferred packages it loaded."""
+    code = "import sys, {0}; print(','.join(sorted({{name.split('.')[0] for name in sys.modules}})))".format(module)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=SRC_DIR, env=_clean_env(), capture_output=True, text=True)
+    if process.returncode != 0:
+        return {"module": module, "error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "exit status {}".format(process.returncode)}
+
+    cumulative_us = 0
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # top-level entries only: their cumulative time already contains every nested import;
+        # site belongs to interpreter startup, not to the module
+        if match and len(match.group(3)) == 1 and match.group(4) != "site":
+            cumulative_us += int(match.group(2))
+    loaded = set(process.stdout.strip().split(","))
+    return {"module": module, "cumulative_ms": cumulative_us / 1000, "deferred_loaded": sorted(loaded.intersection(DEFERRED_PACKAGES))}
+
+
+def check_modules(modules: List[str] = MODULES, budget_ms: float = IMPORT_TIME_BUDGET_MS, repeat: int = 3) -> List[Dict]:
+    results = []
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        failed = [run for run in runs if "error" in run]
+        result = failed[0] if failed else min(runs, key=lambda run: run["cumulative_ms"])
+        problems = []
+        if "error" in result:
+            problems.append("import failed: {}".format(result["error"]))
+        else:
+            if result["deferred_loaded"]:
+                problems.append("loads {} at import".format(", ".join(result["deferred_loaded"])))
+            if result["cumulative_ms"] > budget_ms:
+                problems.append("{:.1f} ms exceeds the {:.0f} ms budget".format(result["cumulative_ms"], budget_ms))
+        results.append({**result, "problems": problems})
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check that pipeline modules import fast and without provider SDKs or credentials")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per module; the fastest counts")
+    parser.add_argument("--module", action="append", help="check only this module (repeatable)")
+    args = parser.parse_args(argv)
+
+    results = check_modules(args.module or list(MODULES), budget_ms=args.budget_ms, repeat=args.repeat)
+    for result in results:
+        timing = "{:>8.1f} ms".format(result["cumulative_ms"]) if "cumulative_ms" in result else "{:>11}".format("-")
+        print("{:<20} {}  {}".format(result["module"], timing, "; ".join(result["problems"]) or "ok"))
+    return 1 if any(result["problems"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
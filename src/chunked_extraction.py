@@ -0,0 +1,183 @@
+import concurrent.futures
+import json
+import math
+from collections import Counter
+from typing import Dict, List
+
+from azure_openai import EXTRACTION_PROMPT, GPT35TURBO, extract_data_from_plaintext
+
+# room for one chunk in gpt-35-turbo-16k once the prompt template and max_tokens=4096 are taken out
+CHUNK_TOKEN_BUDGET = 8000
+CHUNK_WORKERS = 16
+CONFLICT_POLICIES = ("first", "last", "most_common", "all")
+# providers whose format_text keeps every line, table cells included
+TABLES_IN_FORMAT_TEXT = ("aws-textract",)
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Upper-bound token estimate: 3 ASCII characters per token and one token per other character.
+
+    English runs about 4 characters per token, while Thai and CJK text costs one token for
+    every 1 to 1.5 characters, so counting those per character keeps a Thai page within budget.
+    """
+    ascii_characters = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_characters / 3) + len(text) - ascii_characters
+
+
+def render_table(table: dict) -> str:
+    return "\n".join(" | ".join(str(cell) for cell in cells) for cells in table.get("rows", {}).values())
+
+
+def tables_in_format_text(ocr_result: dict) -> bool:
+    """Whether ``format_text`` already holds the table lines: true for Textract, false for Azure."""
+    if "provider" in ocr_result:
+        return ocr_result["provider"] in TABLES_IN_FORMAT_TEXT
+    # results that were not normalized: Textract (and local detection) tables are "table-N", Azure's "Table N"
+    return any(str(table.get("id", "")).startswith("table-") for table in ocr_result.get("tables") or [])
+
+
+def layout_blocks(ocr_result: dict | str, include_tables: bool = None) -> List[str]:
+    """Split an OCR result into the units a chunk must not cut: text lines and whole tables.
+
+    Azure ``format_text`` leaves table paragraphs out, so its tables are appended as blocks;
+    AWS ``format_text`` already holds the table lines, so its tables are not sent twice. The
+    default ``include_tables=None`` decides by ``tables_in_format_text``.
+    """
+    if isinstance(ocr_result, str):
+        ocr_result = {"format_text": ocr_result}
+
+    blocks = [line for line in ocr_result.get("format_text", "").split("\n") if line.strip()]
+    if include_tables is None:
+        include_tables = not tables_in_format_text(ocr_result)
+    if include_tables:
+        blocks.extend(render_table(table) for table in ocr_result.get("tables", []) or [])
+    return blocks
+
+
+def _split_block(block: str, token_budget: int) -> List[str]:
+    pieces = []
+    piece = []
+    for word in block.split(" "):
+        if piece and estimate_text_tokens(" ".join([*piece, word])) > token_budget:
+            pieces.append(" ".join(piece))
+            piece = []
+        piece.append(word)
+    if piece:
+        pieces.append(" ".join(piece))
+    return pieces
+
+
+def chunk_blocks(blocks: List[str], token_budget: int = CHUNK_TOKEN_BUDGET) -> List[str]:
+    """Pack consecutive blocks into chunks of at most ``token_budget`` tokens, keeping document order."""
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for block in blocks:
+        block_tokens = estimate_text_tokens(block) + 1
+        if block_tokens > token_budget:
+            pieces = _split_block(block, token_budget)
+        else:
+            pieces = [block]
+
+        for piece in pieces:
+            piece_tokens = estimate_text_tokens(piece) + 1
+            if chunk and chunk_tokens + piece_tokens > token_budget:
+                chunks.append("\n".join(chunk) + "\n")
+                chunk = []
+                chunk_tokens = 0
+            chunk.append(piece)
+            chunk_tokens += piece_tokens
+
+    if chunk:
+        chunks.append("\n".join(chunk) + "\n")
+    return chunks
+
+
+def parse_completion_json(response: dict) -> Dict | None:
+    """The JSON object in a chat-completion response, or ``None`` when there is none."""
+    try:
+        content = response["choices"][0]["message"]["content"]
+        return json.loads(content[content.index("{") : content.rindex("}") + 1])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def merge_field_results(results: List[Dict | None], conflict_policy: str = "first"):
+    """Merge per-chunk field dicts (in document order) into one result plus the conflicting fields.
+
+    ``null`` values count as missing. On conflicts ``first``/``last`` keep the earliest/latest
+    chunk's value, ``most_common`` votes (ties go to the earliest) and ``all`` keeps every
+    distinct value in order.
+    """
+    if conflict_policy not in CONFLICT_POLICIES:
+        raise ValueError(f"conflict_policy must be one of {CONFLICT_POLICIES}")
+
+    values: Dict[str, List] = {}
+    for result in results:
+        for field, value in (result or {}).items():
+            values.setdefault(field, [])
+            if value is not None:
+                values[field].append(value)
+
+    merged = {}
+    conflicts = {}
+    for field, field_values in values.items():
+        distinct = []
+        for value in field_values:
+            if value not in distinct:
+                distinct.append(value)
+        if len(distinct) > 1:
+            conflicts[field] = distinct
+
+        if not distinct:
+            merged[field] = None
+        elif conflict_policy == "first":
+            merged[field] = field_values[0]
+        elif conflict_policy == "last":
+            merged[field] = field_values[-1]
+        elif conflict_policy == "most_common":
+            counts = Counter(json.dumps(value, sort_keys=True, ensure_ascii=False) for value in field_values)
+            merged[field] = max(distinct, key=lambda value: counts[json.dumps(value, sort_keys=True, ensure_ascii=False)])
+        else:
+            merged[field] = distinct
+
+    return merged, conflicts
+
+
+def extract_data_from_long_text(
+    ocr_result: dict | str,
+    engine=GPT35TURBO,
+    document_description: str = "None",
+    format_instructions: dict = {},
+    prompt: str = EXTRACTION_PROMPT,
+    token_budget: int = CHUNK_TOKEN_BUDGET,
+    conflict_policy: str = "first",
+    include_tables: bool = None,
+    max_workers: int = CHUNK_WORKERS,
+):
+    """Map-reduce ``extract_data_from_plaintext`` over layout-aligned chunks of a long OCR result.
+
+    Chunks are extracted concurrently, so wall-clock time follows the slowest chunk; the
+    field results are merged in document order with ``conflict_policy``.
+    """
+    chunks = chunk_blocks(layout_blocks(ocr_result, include_tables=include_tables), token_budget=token_budget)
+
+    def extract(chunk: str):
+        return extract_data_from_plaintext(
+            text=chunk,
+            engine=engine,
+            document_description=document_description,
+            format_instructions=format_instructions,
+            prompt=prompt,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = list(executor.map(extract, chunks))
+
+    result, conflicts = merge_field_results([parse_completion_json(response) for response in responses], conflict_policy=conflict_policy)
+    return {
+        "result": result,
+        "conflicts": conflicts,
+        "chunk_count": len(chunks),
+        "responses": responses,
+    }
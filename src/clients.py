@@ -0,0 +1,213 @@
+import functools
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import THROTTLED_STATUS, AdaptiveRateLimiter, get_rate_limiter, parse_retry_after
+from settings import setting
+
+
+def _pool_setting(value: int | None, name: str) -> int:
+    return setting(name) if value is None else value
+
+
+class ConnectionStats:
+    """Thread-safe counters of HTTP requests and newly opened connections per provider."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, provider: str, counter: str):
+        with self._lock:
+            counts = self._counts.setdefault(provider, {"requests": 0, "new_connections": 0})
+            counts[counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                provider: {
+                    **counts,
+                    "reused_connections": max(counts["requests"] - counts["new_connections"], 0),
+                }
+                for provider, counts in self._counts.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+connection_stats = ConnectionStats()
+
+
+class _CountingPoolMixin:
+    provider = ""
+
+    def _new_conn(self):
+        connection_stats.record(self.provider, "new_connections")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        connection_stats.record(self.provider, "requests")
+        return super()._make_request(*args, **kwargs)
+
+
+def _counting_pool_classes(pool_classes_by_scheme: dict, provider: str):
+    return {scheme: type(pool_cls.__name__, (_CountingPoolMixin, pool_cls), {"provider": provider}) for scheme, pool_cls in pool_classes_by_scheme.items()}
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report to ``connection_stats``.
+
+    With a ``rate_limiter`` every attempt with one of ``limited_methods``, SDK retries included,
+    waits for its quota and throttling answers slow the limiter down. Only POSTs are charged by
+    default: the Form Recognizer quota counts analyze calls, not the long-running-operation
+    GETs that poll for their results.
+    """
+
+    def __init__(self, provider: str, rate_limiter: AdaptiveRateLimiter = None, limited_methods=("POST",), **kwargs):
+        self.provider = provider
+        self.rate_limiter = rate_limiter
+        self.limited_methods = limited_methods
+        super().__init__(**kwargs)
+
+    def send(self, request, *args, **kwargs):
+        if self.rate_limiter is None or request.method not in self.limited_methods:
+            return super().send(request, *args, **kwargs)
+        self.rate_limiter.acquire()
+        response = super().send(request, *args, **kwargs)
+        if response.status_code in THROTTLED_STATUS:
+            self.rate_limiter.on_throttle(parse_retry_after(response.headers))
+        elif response.status_code < 400:
+            self.rate_limiter.on_success()
+        return response
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self.poolmanager.pool_classes_by_scheme, self.provider)
+
+
+_lock = threading.RLock()
+_clients = {}
+
+
+def _get_or_create(key: tuple, factory):
+    with _lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def get_http_session(provider: str, pool_connections: int = None, pool_maxsize: int = None) -> requests.Session:
+    """Long-lived keep-alive ``requests.Session`` shared by every caller of ``provider``."""
+    pool_connections = _pool_setting(pool_connections, "HTTP_POOL_CONNECTIONS")
+    pool_maxsize = _pool_setting(pool_maxsize, "HTTP_POOL_MAXSIZE")
+
+    def factory():
+        session = requests.Session()
+        adapter = PooledHTTPAdapter(provider, rate_limiter=get_rate_limiter(provider), pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    return _get_or_create(("session", provider, pool_connections, pool_maxsize), factory)
+
+
+TEXTRACT_THROTTLING_CODES = {"ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException"}
+
+
+def _acquire_before_send(limiter: AdaptiveRateLimiter, **kwargs):
+    # botocore sends whatever a before-send handler returns instead of the request, so return None
+    limiter.acquire()
+    return None
+
+
+def _report_attempt(limiter: AdaptiveRateLimiter, response=None, **kwargs):
+    if response is None:
+        return None
+    http_response, parsed = response
+    if http_response.status_code in THROTTLED_STATUS or parsed.get("Error", {}).get("Code") in TEXTRACT_THROTTLING_CODES:
+        limiter.on_throttle()
+    elif http_response.status_code < 400:
+        limiter.on_success()
+    return None
+
+
+def get_textract_client(
+    region_name: str = "ap-southeast-1",
+    aws_access_key_id: str = None,
+    aws_secret_access_key: str = None,
+    max_attempts: int = 10,
+    pool_maxsize: int = None,
+):
+    """Shared boto3 Textract client; boto3 clients are safe to use from several threads."""
+    pool_maxsize = _pool_setting(pool_maxsize, "HTTP_POOL_MAXSIZE")
+
+    def factory():
+        import boto3
+        from botocore.config import Config
+
+        boto3_config = Config(
+            retries={"max_attempts": max_attempts, "mode": "standard"},
+            max_pool_connections=pool_maxsize,
+            tcp_keepalive=True,
+        )
+        client = boto3.client(
+            "textract",
+            region_name=region_name,
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            config=boto3_config,
+        )
+        http_session = getattr(client._endpoint, "http_session", None)
+        if hasattr(http_session, "_pool_classes_by_scheme"):
+            http_session._pool_classes_by_scheme = _counting_pool_classes(http_session._pool_classes_by_scheme, "textract")
+            http_session._manager.pool_classes_by_scheme = http_session._pool_classes_by_scheme
+
+        # boto's own retries stay in place; the limiter spaces out every attempt across processes
+        limiter = get_rate_limiter("textract", region_name)
+        if limiter is not None:
+            client.meta.events.register("before-send.textract", functools.partial(_acquire_before_send, limiter))
+            client.meta.events.register("needs-retry.textract", functools.partial(_report_attempt, limiter))
+        return client
+
+    return _get_or_create(("textract", region_name, aws_access_key_id, aws_secret_access_key, max_attempts, pool_maxsize), factory)
+
+
+def get_document_analysis_client(
+    endpoint: str,
+    key: str,
+    pool_connections: int = None,
+    pool_maxsize: int = None,
+):
+    """Shared Form Recognizer client running on a pooled keep-alive session."""
+    pool_connections = _pool_setting(pool_connections, "HTTP_POOL_CONNECTIONS")
+    pool_maxsize = _pool_setting(pool_maxsize, "HTTP_POOL_MAXSIZE")
+
+    def factory():
+        from azure.core.credentials import AzureKeyCredential
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.ai.formrecognizer import DocumentAnalysisClient
+
+        session = get_http_session("formrecognizer", pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        return DocumentAnalysisClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(key),
+            transport=RequestsTransport(session=session, session_owner=False),
+        )
+
+    return _get_or_create(("formrecognizer", endpoint, key, pool_connections, pool_maxsize), factory)
+
+
+def close_clients():
+    """Close every pooled client and session, e.g. on worker shutdown."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is not None:
+            close()
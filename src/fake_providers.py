@@ -0,0 +1,258 @@
+import copy
+import http.server
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from typing import Callable, Dict, List
+
+
+class ReplayProvider:
+    """Offline stand-in for a provider call that replays a recorded response from ``src/results``.
+
+    ``response_path`` may also be the response itself. ``delay`` is seconds or a callable
+    returning seconds per call, e.g. ``lambda: random.lognormvariate(-1, 0.5)`` for a latency
+    tail. ``fail_on`` lists the call numbers (starting at 0) that raise instead of answering.
+    """
+
+    def __init__(self, response_path: str | dict, delay: float | Callable[[], float] = 0.0, fail_on: set = None):
+        if isinstance(response_path, dict):
+            self.response = response_path
+        else:
+            with open(response_path, "r") as reader:
+                self.response = json.load(reader)
+        self.delay = delay
+        self.fail_on = set(fail_on or [])
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, image_data, *args, **kwargs):
+        with self._lock:
+            call_number = self.calls
+            self.calls += 1
+        delay = self.delay() if callable(self.delay) else self.delay
+        if delay:
+            time.sleep(delay)
+        if call_number in self.fail_on:
+            raise RuntimeError(f"replayed failure on call {call_number}")
+        return copy.deepcopy(self.response)
+
+
+SYNTHETIC_WORDS = ["INVOICE", "ใบแจ้งหนี้", "Total", "รวม", "VAT", "7%", "06/10/2021", "Qty", "Price", "1,250.00", "บริษัท", "จำกัด"]
+SYNTHETIC_PAGE_WIDTH = 2480
+SYNTHETIC_LINE_HEIGHT = 40
+SYNTHETIC_WORDS_PER_LINE = 10
+SYNTHETIC_TABLE_COLUMNS = 6
+
+
+def synthetic_page_layout(word_count: int, table_cells: int = 0, seed: int = 0) -> Dict:
+    """Pixel layout of a scaled-up page: a ``table_cells`` grid with two words per cell, then text lines.
+
+    The page grows downwards so ``word_count`` can go far beyond a real page.
+    """
+    rng = random.Random(seed)
+    column_width = SYNTHETIC_PAGE_WIDTH // SYNTHETIC_TABLE_COLUMNS
+    cells = []
+    for cell_index in range(table_cells):
+        row, column = divmod(cell_index, SYNTHETIC_TABLE_COLUMNS)
+        left, top = column * column_width, row * SYNTHETIC_LINE_HEIGHT * 2
+        words = [
+            (rng.choice(SYNTHETIC_WORDS), left + 10 + 80 * position, top + 10, left + 80 + 80 * position, top + 40)
+            for position in range(2)
+        ]
+        cells.append({"row": row, "column": column, "box": (left, top, left + column_width, top + SYNTHETIC_LINE_HEIGHT * 2), "words": words})
+
+    lines = []
+    y = (math.ceil(table_cells / SYNTHETIC_TABLE_COLUMNS) * 2 + 1) * SYNTHETIC_LINE_HEIGHT
+    remaining = max(word_count - 2 * table_cells, 0)
+    while remaining > 0:
+        x = 40
+        words = []
+        for _ in range(min(SYNTHETIC_WORDS_PER_LINE, remaining)):
+            text = rng.choice(SYNTHETIC_WORDS)
+            width = 12 * len(text) + rng.randint(0, 8)
+            bottom = y + 28 + rng.randint(-2, 2)
+            words.append((text, x, y + rng.randint(-2, 2), x + width, bottom))
+            x += width + 15
+        lines.append(words)
+        remaining -= len(words)
+        y += SYNTHETIC_LINE_HEIGHT
+    return {"width": SYNTHETIC_PAGE_WIDTH, "height": y + SYNTHETIC_LINE_HEIGHT, "cells": cells, "lines": lines}
+
+
+def _textract_geometry(left, top, right, bottom, width, height) -> Dict:
+    x0, y0, x1, y1 = left / width, top / height, right / width, bottom / height
+    return {
+        "BoundingBox": {"Width": x1 - x0, "Height": y1 - y0, "Left": x0, "Top": y0},
+        "Polygon": [{"X": x0, "Y": y0}, {"X": x1, "Y": y0}, {"X": x1, "Y": y1}, {"X": x0, "Y": y1}],
+    }
+
+
+def synthetic_textract_response(layout: Dict) -> Dict:
+    """``analyze_document`` response (TABLES feature) for a ``synthetic_page_layout``."""
+    width, height = layout["width"], layout["height"]
+    block_ids = ("block-{}".format(number) for number in itertools.count())
+    blocks = [{"BlockType": "PAGE", "Geometry": _textract_geometry(0, 0, width, height, width, height), "Id": next(block_ids)}]
+
+    def add_line(words):
+        word_ids = []
+        for text, left, top, right, bottom in words:
+            word_ids.append(next(block_ids))
+            blocks.append({"BlockType": "WORD", "Confidence": 99.0, "Text": text, "TextType": "PRINTED", "Geometry": _textract_geometry(left, top, right, bottom, width, height), "Id": word_ids[-1]})
+        box = (min(w[1] for w in words), min(w[2] for w in words), max(w[3] for w in words), max(w[4] for w in words))
+        blocks.append({"BlockType": "LINE", "Confidence": 99.0, "Text": " ".join(w[0] for w in words), "Geometry": _textract_geometry(*box, width, height), "Id": next(block_ids), "Relationships": [{"Type": "CHILD", "Ids": word_ids}]})
+        return word_ids
+
+    cell_ids = []
+    cell_blocks = []
+    for cell in layout["cells"]:
+        cell_ids.append(next(block_ids))
+        cell_blocks.append(
+            {
+                "BlockType": "CELL",
+                "Confidence": 90.0,
+                "RowIndex": cell["row"] + 1,
+                "ColumnIndex": cell["column"] + 1,
+                "RowSpan": 1,
+                "ColumnSpan": 1,
+                "Geometry": _textract_geometry(*cell["box"], width, height),
+                "Id": cell_ids[-1],
+                "Relationships": [{"Type": "CHILD", "Ids": add_line(cell["words"])}],
+            }
+        )
+    if cell_blocks:
+        table_box = (0, 0, max(c["box"][2] for c in layout["cells"]), max(c["box"][3] for c in layout["cells"]))
+        blocks.append({"BlockType": "TABLE", "Confidence": 90.0, "Geometry": _textract_geometry(*table_box, width, height), "Id": next(block_ids), "Relationships": [{"Type": "CHILD", "Ids": cell_ids}]})
+        blocks.extend(cell_blocks)
+
+    for words in layout["lines"]:
+        add_line(words)
+    return {"DocumentMetadata": {"Pages": 1}, "Blocks": blocks}
+
+
+def _azure_polygon(left, top, right, bottom) -> List[Dict]:
+    return [{"x": left, "y": top}, {"x": right, "y": top}, {"x": right, "y": bottom}, {"x": left, "y": bottom}]
+
+
+def _azure_region(left, top, right, bottom) -> List[Dict]:
+    return [{"page_number": 1, "polygon": _azure_polygon(left, top, right, bottom)}]
+
+
+def synthetic_analyze_result(layout: Dict) -> Dict:
+    """``AnalyzeResult.to_dict()`` output of ``prebuilt-layout`` for a ``synthetic_page_layout``."""
+    words = []
+    paragraphs = []
+    offset = 0
+    for line in [cell["words"] for cell in layout["cells"]] + layout["lines"]:
+        for text, left, top, right, bottom in line:
+            words.append({"content": text, "polygon": _azure_polygon(left, top, right, bottom), "span": {"offset": offset, "length": len(text)}, "confidence": 0.99})
+            offset += len(text) + 1
+        box = (min(w[1] for w in line), min(w[2] for w in line), max(w[3] for w in line), max(w[4] for w in line))
+        content = " ".join(w[0] for w in line)
+        paragraphs.append({"content": content, "role": None, "bounding_regions": _azure_region(*box), "spans": [{"offset": offset - len(content) - 1, "length": len(content)}]})
+
+    tables = []
+    if layout["cells"]:
+        # the first paragraphs are the cells'
+        cells = [
+            {
+                "kind": "content",
+                "row_index": cell["row"],
+                "column_index": cell["column"],
+                "row_span": 1,
+                "column_span": 1,
+                "content": paragraph["content"],
+                "bounding_regions": _azure_region(*cell["box"]),
+                "spans": paragraph["spans"],
+            }
+            for cell, paragraph in zip(layout["cells"], paragraphs)
+        ]
+        table_box = (0, 0, max(c["box"][2] for c in layout["cells"]), max(c["box"][3] for c in layout["cells"]))
+        tables.append({"row_count": cells[-1]["row_index"] + 1, "column_count": SYNTHETIC_TABLE_COLUMNS, "cells": cells, "bounding_regions": _azure_region(*table_box), "spans": []})
+
+    page = {"page_number": 1, "angle": 0, "width": layout["width"], "height": layout["height"], "unit": "pixel", "words": words, "lines": [], "spans": [], "selection_marks": [], "barcodes": [], "formulas": []}
+    return {
+        "api_version": "2023-07-31",
+        "model_id": "prebuilt-layout",
+        "content": "\n".join(paragraph["content"] for paragraph in paragraphs),
+        "pages": [page],
+        "paragraphs": paragraphs,
+        "tables": tables,
+        "key_value_pairs": [],
+        "styles": [],
+        "languages": [],
+        "documents": [],
+    }
+
+
+class StubChatCompletionsServer:
+    """Local chat-completions endpoint that replays ``content_chunks`` as a server-sent event stream.
+
+    Non-streaming requests get the joined chunks as one completion. Use as a context manager
+    and point ``OPENAI_API_BASE`` (or a request URL) at ``base_url``. The first
+    ``throttled_requests`` requests are answered with a 429 and ``Retry-After: retry_after``,
+    like a deployment over its quota.
+    """
+
+    def __init__(self, content_chunks: List[str], chunk_delay: float = 0.0, throttled_requests: int = 0, retry_after: float = 1.0):
+        self.content_chunks = content_chunks
+        self.chunk_delay = chunk_delay
+        self.throttled_requests = throttled_requests
+        self.retry_after = retry_after
+        self.requests = []
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                stub.requests.append({"path": self.path, "payload": payload, "time": time.time()})
+                if len(stub.requests) <= stub.throttled_requests:
+                    error = {"code": "429", "message": "Requests to the ChatCompletions_Create Operation have exceeded the token rate limit."}
+                    self._send_json({"error": error}, status=429, headers={"retry-after": str(stub.retry_after)})
+                elif payload.get("stream"):
+                    self._stream()
+                else:
+                    message = {"role": "assistant", "content": "".join(stub.content_chunks)}
+                    self._send_json({"choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+
+            def _send_json(self, body: dict, status: int = 200, headers: dict = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+                events = [{"choices": [{"index": 0, "delta": {"content": chunk}}]} for chunk in stub.content_chunks]
+                for event in [*events, "[DONE]"]:
+                    data = "data: {}\n\n".format(event if event == "[DONE]" else json.dumps(event)).encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                    if stub.chunk_delay:
+                        time.sleep(stub.chunk_delay)
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,87 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from word_boxes import WordBoxes
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """Ray casting test of every point against one polygon at once.
+
+    Same edge rules as ``azure_ocr.is_point_inside_polygon``: an edge counts when
+    ``min(y1, y2) < y <= max(y1, y2)`` and the point lies left of the crossing.
+    """
+    x = points[:, 0:1]
+    y = points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+
+    crosses_y = (y > np.minimum(y1, y2)) & (y <= np.maximum(y1, y2)) & (x <= np.maximum(x1, x2))
+    dy = np.where(y1 != y2, y2 - y1, 1.0)
+    x_intersection = (y - y1) * (x2 - x1) / dy + x1
+    crossings = crosses_y & ((x1 == x2) | (x <= x_intersection))
+    return np.count_nonzero(crossings, axis=1) % 2 == 1
+
+
+class PolygonIndex:
+    """Polygons precomputed once as vertex arrays plus their bounding boxes."""
+
+    def __init__(self, polygons: List[Sequence[Tuple[float, float]]]):
+        self.polygons = [np.asarray(polygon, dtype=float).reshape(-1, 2) for polygon in polygons]
+        self.bounds = np.array([[*polygon.min(axis=0), *polygon.max(axis=0)] for polygon in self.polygons]).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def contains_any(self, points: Sequence[Tuple[float, float]]) -> bool:
+        """True when any point lies inside any polygon."""
+        if not self.polygons:
+            return False
+
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        x = points[:, 0:1]
+        y = points[:, 1:2]
+        in_bounds = (x >= self.bounds[:, 0]) & (x <= self.bounds[:, 2]) & (y >= self.bounds[:, 1]) & (y <= self.bounds[:, 3])
+        for polygon_index in np.flatnonzero(in_bounds.any(axis=0)).tolist():
+            if points_in_polygon(points[in_bounds[:, polygon_index]], self.polygons[polygon_index]).any():
+                return True
+        return False
+
+
+class WordBoxIndex:
+    """Sorted interval index over word bboxes, built once per page.
+
+    Words are ordered by their left edge so a rectangle query only visits the words whose
+    left edge falls between the rectangle's left and right sides.
+    """
+
+    def __init__(self, words: List[Dict] | WordBoxes):
+        self.words = words
+        if isinstance(words, WordBoxes):
+            self.left, self.top, self.right, self.bottom = words.left, words.top, words.right, words.bottom
+        else:
+            self.left = np.asarray([word["bbox"]["l"] for word in words])
+            self.top = np.asarray([word["bbox"]["t"] for word in words])
+            self.right = np.asarray([word["bbox"]["r"] for word in words])
+            self.bottom = np.asarray([word["bbox"]["b"] for word in words])
+        self._order = np.argsort(self.left, kind="stable")
+        self._sorted_left = self.left[self._order]
+
+    def __len__(self):
+        return len(self.words)
+
+    def indices_inside(self, rect: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """Indices, in input order, of the words fully inside ``rect`` (same corner order as ``aws_ocr.is_inside``)."""
+        (x_min, y_min), (x_max, _), (_, y_max) = rect[0], rect[1], rect[2]
+        start = np.searchsorted(self._sorted_left, x_min, side="left")
+        end = np.searchsorted(self._sorted_left, x_max, side="right")
+        candidates = self._order[start:end]
+        right = self.right[candidates]
+        top = self.top[candidates]
+        bottom = self.bottom[candidates]
+        inside = (x_min <= right) & (right <= x_max) & (y_min <= top) & (top <= y_max) & (y_min <= bottom) & (bottom <= y_max)
+        return np.sort(candidates[inside])
+
+    def words_inside(self, rect: Sequence[Tuple[float, float]]) -> List[Dict] | WordBoxes:
+        if isinstance(self.words, WordBoxes):
+            return self.words.take(self.indices_inside(rect))
+        return [self.words[index] for index in self.indices_inside(rect).tolist()]
@@ -0,0 +1,69 @@
+import base64
+import io
+from typing import NamedTuple
+
+from PIL import Image
+
+JPEG_QUALITY = 75
+MIN_JPEG_QUALITY = 40
+
+# per-provider upload limits; "modes" None means any color mode is accepted as-is
+PROVIDER_LIMITS = {
+    "aws-textract": {"max_bytes": 10 * 1024 * 1024, "max_side": 10000, "formats": {"JPEG", "PNG"}, "modes": {"RGB"}},
+    "azure-formrecognizer": {"max_bytes": 500 * 1024 * 1024, "max_side": 10000, "formats": {"JPEG", "PNG", "BMP", "TIFF"}, "modes": None},
+    "gpt-4-vision": {"max_bytes": 20 * 1024 * 1024, "max_side": 2048, "formats": {"JPEG"}, "modes": {"RGB"}},
+}
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    width: int
+    height: int
+    format: str
+
+
+def _is_compliant(image: Image.Image, size: int, limits: dict) -> bool:
+    return (
+        image.format in limits["formats"]
+        and (limits["modes"] is None or image.mode in limits["modes"])
+        and size <= limits["max_bytes"]
+        and max(image.size) <= limits["max_side"]
+    )
+
+
+def encode_image(image: Image.Image, provider: str = "aws-textract", jpeg_quality: int = JPEG_QUALITY) -> PreparedImage:
+    """Encode a decoded image as JPEG, downscaling and lowering quality until it fits ``provider``'s limits."""
+    limits = PROVIDER_LIMITS[provider]
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    scale = min(1.0, limits["max_side"] / max(image.size))
+    quality = jpeg_quality
+    while True:
+        resized = image
+        if scale < 1.0:
+            resized = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+        image_io = io.BytesIO()
+        resized.save(image_io, "JPEG", quality=quality, optimize=True)
+        if image_io.tell() <= limits["max_bytes"]:
+            return PreparedImage(image_io.getvalue(), resized.width, resized.height, "JPEG")
+
+        if quality > MIN_JPEG_QUALITY:
+            quality = max(MIN_JPEG_QUALITY, quality - 15)
+        else:
+            scale *= 0.75
+
+
+def prepare_image(image_data: str | bytes, provider: str = "aws-textract", jpeg_quality: int = JPEG_QUALITY) -> PreparedImage:
+    """Read the image once and return upload bytes plus dimensions for ``provider``.
+
+    Only the header is parsed for inputs that already meet the provider's limits, and their
+    bytes are returned as-is; anything else is decoded once and re-encoded by ``encode_image``.
+    """
+    if type(image_data) == str:
+        image_data = base64.b64decode(image_data)
+
+    image = Image.open(io.BytesIO(image_data))
+    if _is_compliant(image, len(image_data), PROVIDER_LIMITS[provider]):
+        return PreparedImage(image_data, image.width, image.height, image.format)
+    return encode_image(image, provider=provider, jpeg_quality=jpeg_quality)
@@ -0,0 +1,116 @@
+import io
+from typing import BinaryIO, Iterable, Iterator
+
+from PIL import Image
+
+PDF_RENDER_DPI = 200
+# modes PNG can store as-is; anything else (CMYK, YCbCr, ...) is converted to RGB
+PNG_MODES = {"1", "L", "LA", "P", "RGB", "RGBA", "I"}
+
+
+def _open_source(source: str | bytes | BinaryIO):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+def _read_source(source: str | bytes | BinaryIO) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, "rb") as reader:
+            return reader.read()
+    return source.read()
+
+
+def _is_single_image(source: str | bytes | BinaryIO) -> bool:
+    position = None if isinstance(source, (str, bytes, bytearray)) else source.tell()
+    try:
+        with Image.open(_open_source(source)) as image:
+            return getattr(image, "n_frames", 1) == 1
+    finally:
+        if position is not None:
+            source.seek(position)
+
+
+def _is_pdf(source: str | bytes | BinaryIO) -> bool:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source[:5]) == b"%PDF-"
+    if isinstance(source, str):
+        with open(source, "rb") as reader:
+            return reader.read(5) == b"%PDF-"
+    position = source.tell()
+    header = source.read(5)
+    source.seek(position)
+    return header == b"%PDF-"
+
+
+def _iter_pdf_page_images(source: str | bytes | BinaryIO, dpi: int) -> Iterator[Image.Image]:
+    try:
+        import pymupdf
+    except ImportError as e:
+        raise ImportError("PDF ingestion needs PyMuPDF, install it with `pip install pymupdf`") from e
+
+    if isinstance(source, str):
+        document = pymupdf.open(source)
+    else:
+        document = pymupdf.open(stream=source if isinstance(source, (bytes, bytearray)) else source.read(), filetype="pdf")
+
+    with document:
+        for page in document:
+            pixmap = page.get_pixmap(dpi=dpi)
+            yield Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def iter_page_images(source: str | bytes | BinaryIO, dpi: int = PDF_RENDER_DPI) -> Iterator[Image.Image]:
+    """Lazily decode the pages of an image, multi-page TIFF or PDF, one page at a time.
+
+    Only the page being yielded is held decoded; PDF pages are rendered at ``dpi``.
+    """
+    if _is_pdf(source):
+        yield from _iter_pdf_page_images(source, dpi)
+        return
+
+    with Image.open(_open_source(source)) as image:
+        for frame in range(getattr(image, "n_frames", 1)):
+            image.seek(frame)
+            yield image.copy()
+
+
+def iter_pages(source: str | bytes | BinaryIO, dpi: int = PDF_RENDER_DPI) -> Iterator[bytes]:
+    """Lazily yield each page of ``source`` as bytes ready for ``aws_textract_image``/``azure_extracttext``.
+
+    A single-page image is yielded unchanged, so its upload stays the size of the file and its
+    OCR cache key matches a direct call on the same bytes; only multi-page TIFF and PDF pages
+    are split out and encoded as PNG.
+    """
+    if not _is_pdf(source) and _is_single_image(source):
+        yield _read_source(source)
+        return
+
+    for image in iter_page_images(source, dpi=dpi):
+        if image.mode not in PNG_MODES:
+            image = image.convert("RGB")
+        image_io = io.BytesIO()
+        image.save(image_io, "PNG")
+        yield image_io.getvalue()
+
+
+def merge_page_results(page_results: Iterable[dict]) -> dict:
+    """Merge ``batch_ocr.run_batch`` items of one document into a single result ordered by page index."""
+    pages = []
+    errors = []
+    for item in page_results:
+        if item["error"] is not None:
+            errors.append({"page_index": item["index"], "stage": item["stage"], "error": repr(item["error"])})
+        else:
+            pages.append({"page_index": item["index"], **item["result"]})
+
+    pages.sort(key=lambda page: page["page_index"])
+    errors.sort(key=lambda error: error["page_index"])
+    return {
+        "page_count": len(pages) + len(errors),
+        "pages": pages,
+        "format_text": "".join(page.get("format_text", "") for page in pages),
+        "errors": errors,
+    }
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+
+from ocr_cache import OCRResultCache
+from settings import setting
+
+
+def _canonical(value):
+    """``value`` with whole floats as ints, so ``"temperature": 0.0`` and ``0`` hash alike."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def make_llm_cache_key(request: dict) -> str:
+    """Canonical hash of the fully rendered request: url, query params and payload (never headers)."""
+    canonical = json.dumps(
+        _canonical({"url": request["url"], "params": request.get("params") or {}, "payload": request["json"]}),
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(request: dict) -> bool:
+    payload = request["json"]
+    return payload.get("temperature") == 0 and not payload.get("stream")
+
+
+class LLMResponseCache(OCRResultCache):
+    """Chat-completion responses in the same LRU + sqlite tiers as OCR results, with per-engine hit counters."""
+
+    table_name = "llm_responses"
+
+    def __init__(self, path: str = None, memory_items: int = None, ttl_seconds: int = None, max_bytes: int = None):
+        super().__init__(
+            path=path,
+            memory_items=setting("LLM_CACHE_MEMORY_ITEMS") if memory_items is None else memory_items,
+            ttl_seconds=setting("LLM_CACHE_TTL_SECONDS") if ttl_seconds is None else ttl_seconds,
+            max_bytes=setting("LLM_CACHE_MAX_BYTES") if max_bytes is None else max_bytes,
+        )
+        self._engine_stats = {}
+
+    def _record(self, engine: str, counter: str):
+        with self._lock:
+            self._engine_stats.setdefault(engine, {"hits": 0, "misses": 0})[counter] += 1
+
+    def get_or_request(self, engine: str, request: dict, send):
+        """Serve a deterministic ``request`` from the cache or call ``send()``; only responses with ``choices`` are stored."""
+        if not is_deterministic(request):
+            return send()
+
+        key = make_llm_cache_key(request)
+        response = self.get(key)
+        if response is not None:
+            self._record(engine, "hits")
+            return response
+
+        self._record(engine, "misses")
+        response = send()
+        if isinstance(response, dict) and response.get("choices"):
+            self.set(key, response)
+        return response
+
+    def engine_stats(self):
+        with self._lock:
+            return {
+                engine: {**counts, "hit_rate": counts["hits"] / (counts["hits"] + counts["misses"])}
+                for engine, counts in self._engine_stats.items()
+            }
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Process-wide cache; the disk tier is enabled by setting ``LLM_CACHE_DIR``."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            cache_dir = setting("LLM_CACHE_DIR")
+            _llm_cache = LLMResponseCache(path=os.path.join(cache_dir, "llm_responses.sqlite3") if cache_dir else None)
+        return _llm_cache
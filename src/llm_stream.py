@@ -0,0 +1,151 @@
+import json
+import time
+from typing import Any, Iterable, Iterator, List, Tuple
+
+WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONFieldParser:
+    """Parse a streamed JSON object and return each top-level field once its value is complete.
+
+    Text before the opening ``{`` (e.g. a ```json fence) is skipped. String, object and array
+    values complete on their closing character; numbers and literals on the next delimiter.
+    A value that is not valid JSON sets ``failed`` and the rest of the text is ignored.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self.failed = False
+        self._state = "start"
+        self._token = []
+        self._key = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def _scan_string(self, char: str) -> bool:
+        """Track string escapes; True when ``char`` closes the string."""
+        if self._escape:
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            return True
+        return False
+
+    def _emit(self, fields: List[Tuple[str, Any]]):
+        value = json.loads("".join(self._token))
+        self.fields[self._key] = value
+        fields.append((self._key, value))
+        self._token = []
+        self._state = "after_value"
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        fields = []
+        try:
+            self._feed(text, fields)
+        except json.JSONDecodeError:
+            self.failed = True
+        return fields
+
+    def _feed(self, text: str, fields: List[Tuple[str, Any]]):
+        for char in text:
+            if self.done or self.failed:
+                break
+
+            if self._state == "start":
+                if char == "{":
+                    self._state = "key"
+            elif self._state in ("key", "after_value"):
+                if char == '"':
+                    self._state, self._in_string, self._token = "key_string", True, [char]
+                elif char == "}":
+                    self.done = True
+            elif self._state == "key_string":
+                self._token.append(char)
+                if self._scan_string(char):
+                    self._key = json.loads("".join(self._token))
+                    self._token = []
+                    self._state = "colon"
+            elif self._state == "colon":
+                if char == ":":
+                    self._state = "value"
+            elif self._state == "value":
+                if char in WHITESPACE and not self._token:
+                    continue
+
+                if self._token and self._token[0] not in '"{[' and (char in ",}" or char in WHITESPACE):
+                    self._emit(fields)
+                    self.done = char == "}"
+                    continue
+
+                self._token.append(char)
+                if self._in_string:
+                    if self._scan_string(char) and self._depth == 0:
+                        self._emit(fields)
+                elif char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._emit(fields)
+
+
+def iter_sse_content(lines: Iterable[bytes | str]) -> Iterator[str]:
+    """Yield the ``delta.content`` pieces of a chat-completions server-sent event stream."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            continue
+
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            break
+
+        for choice in json.loads(data).get("choices", []):
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def stream_json_fields(content_pieces: Iterable[str], started: float = None) -> Iterator[dict]:
+    """Turn streamed completion text into ``field`` events and one final ``done`` event.
+
+    The ``done`` event carries the whole parsed object (``None`` when the text was not a
+    complete JSON object), the raw text and time-to-first-token/field metrics.
+    """
+    started = time.perf_counter() if started is None else started
+    parser = IncrementalJSONFieldParser()
+    text = []
+    first_token = None
+    first_field = None
+    for content in content_pieces:
+        if first_token is None:
+            first_token = time.perf_counter() - started
+        text.append(content)
+        for field, value in parser.feed(content):
+            elapsed = time.perf_counter() - started
+            if first_field is None:
+                first_field = elapsed
+            yield {"type": "field", "field": field, "value": value, "elapsed": elapsed}
+
+    content = "".join(text)
+    result = None
+    if parser.done:
+        result = parser.fields
+    yield {
+        "type": "done",
+        "result": result,
+        "content": content,
+        "metrics": {
+            "time_to_first_token": first_token,
+            "time_to_first_field": first_field,
+            "total_time": time.perf_counter() - started,
+            "fields": len(parser.fields),
+        },
+    }
@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from settings import setting
+
+# METRICS_ENABLED and METRICS_LOG are read on the first span, after .env is loaded, unless
+# enable_metrics()/disable_metrics() decided first
+_enabled = None
+_log = None
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# list prices in USD, used for estimates only: OCR per 1000 pages, LLMs per 1000 tokens
+OCR_PRICES = {
+    ("aws-textract", "detect_document_text"): 1.5,
+    ("aws-textract", "analyze_document-tables"): 15.0,
+    ("azure-formrecognizer", "prebuilt-read"): 1.5,
+    ("azure-formrecognizer", "prebuilt-layout"): 10.0,
+}
+LLM_PRICES = {
+    "gpt-35-turbo-16k": {"prompt": 0.003, "completion": 0.004},
+    "gpt-4-turbo": {"prompt": 0.01, "completion": 0.03},
+    "gpt-4-vision": {"prompt": 0.01, "completion": 0.03},
+}
+
+logger = logging.getLogger("ocr_pipeline.metrics")
+
+
+def estimate_ocr_cost(provider: str, mode: str, pages: int = 1) -> float:
+    return OCR_PRICES.get((provider, mode), 0.0) * pages / 1000
+
+
+def estimate_llm_cost(engine: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> float:
+    prices = LLM_PRICES.get(engine)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]) / 1000
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe counters and latency histograms keyed by metric name and labels."""
+
+    def __init__(self, buckets: Tuple[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple, float] = {}
+        self._histograms: Dict[Tuple, list] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # per-bucket counts, then sum and count
+            histogram = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._counters.items()],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "buckets": dict(zip(self.buckets, values[:-2])), "sum": values[-2], "count": values[-1]}
+                    for (name, labels), values in self._histograms.items()
+                ],
+            }
+
+    def drain(self) -> Tuple[Dict, Dict]:
+        """Take every counter and histogram out of the registry, e.g. to hand a pool worker's records to its parent."""
+        with self._lock:
+            counters, histograms = self._counters, self._histograms
+            self._counters, self._histograms = {}, {}
+        return counters, histograms
+
+    def merge(self, records: Tuple[Dict, Dict]):
+        """Add the ``drain()`` output of a registry with the same buckets."""
+        counters, histograms = records
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, values in histograms.items():
+                histogram = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+                for index, value in enumerate(values):
+                    histogram[index] += value
+
+    def to_prometheus(self) -> str:
+        """The registry in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), values in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, values[:-2]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Atomically write ``to_prometheus()`` to ``path``, e.g. for the node_exporter textfile collector."""
+        with open(path + ".tmp", "w") as writer:
+            writer.write(self.to_prometheus())
+        os.replace(path + ".tmp", path)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class Span:
+    """One timed pipeline stage; ``set`` attaches bytes, pages, tokens and cost to it."""
+
+    __slots__ = ("stage", "provider", "attributes", "_started")
+
+    def __init__(self, stage: str, provider: str, attributes: dict):
+        self.stage = stage
+        self.provider = provider
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        elapsed = time.perf_counter() - self._started
+        labels = {"stage": self.stage, "provider": self.provider}
+        registry.observe("ocr_pipeline_stage_seconds", elapsed, **labels)
+        if exc_type is not None:
+            registry.inc("ocr_pipeline_errors_total", **labels)
+
+        attributes = self.attributes
+        if attributes.get("bytes_sent"):
+            registry.inc("ocr_pipeline_bytes_sent_total", attributes["bytes_sent"], **labels)
+        if attributes.get("pages"):
+            registry.inc("ocr_pipeline_pages_total", attributes["pages"], **labels)
+        for kind in ("prompt", "completion"):
+            if attributes.get(f"{kind}_tokens"):
+                registry.inc("ocr_pipeline_tokens_total", attributes[f"{kind}_tokens"], provider=self.provider, kind=kind)
+        if attributes.get("cost_usd"):
+            registry.inc("ocr_pipeline_cost_usd_total", attributes["cost_usd"], provider=self.provider)
+
+        if _log_enabled():
+            record = {"stage": self.stage, "provider": self.provider, "seconds": round(elapsed, 6), "error": exc_type.__name__ if exc_type else None, **attributes}
+            logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def metrics_enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        _enabled = setting("METRICS_ENABLED")
+    return _enabled
+
+
+def _log_enabled() -> bool:
+    global _log
+    if _log is None:
+        _log = setting("METRICS_LOG")
+    return _log
+
+
+def span(stage: str, provider: str = "", **attributes):
+    """``with span("ocr_request", "aws-textract") as s: ...; s.set(bytes_sent=...)``; a shared no-op when metrics are off."""
+    if not metrics_enabled():
+        return _NOOP_SPAN
+    return Span(stage, provider, attributes)
+
+
+def enable_metrics(log: bool = None):
+    """Turn instrumentation on at runtime; ``log=True`` also emits one JSON log record per span."""
+    global _enabled, _log
+    _enabled = True
+    if log is not None:
+        _log = log
+
+
+def disable_metrics():
+    global _enabled
+    _enabled = False
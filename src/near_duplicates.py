@@ -0,0 +1,292 @@
+import array
+import io
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+import metrics
+from ocr_cache import get_ocr_cache
+from settings import setting
+
+# a prior result is only reused for a page of (almost) the same aspect ratio
+NEAR_DUPLICATE_MAX_ASPECT_CHANGE = 0.02
+
+HASH_SIZE = 32
+HASH_BITS = 64
+MIH_CHUNKS = 4
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    k = np.arange(size)
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(HASH_SIZE)
+_BIT_WEIGHTS = 1 << np.arange(HASH_BITS - 1, -1, -1, dtype=np.uint64)
+
+
+class PageHash(NamedTuple):
+    value: int
+    width: int
+    height: int
+
+
+class NearDuplicate(NamedTuple):
+    key: str
+    width: int
+    height: int
+    distance: int
+
+
+def page_hash(image_data: bytes | Image.Image) -> PageHash:
+    """64-bit DCT perceptual hash of a page plus its pixel size.
+
+    The page is reduced to 32x32 grey and each bit tells whether one of the 64 lowest DCT
+    frequencies after the DC term lies above their median.
+    """
+    image = image_data if isinstance(image_data, Image.Image) else Image.open(io.BytesIO(image_data))
+    width, height = image.size
+    # JPEG pages decode straight at a reduced scale
+    image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+    pixels = np.asarray(image.convert("L").resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR), dtype=np.float64)
+    frequencies = (_DCT @ pixels @ _DCT.T)[:8, :9].ravel()[1:HASH_BITS + 1]
+    bits = (frequencies > np.median(frequencies)).astype(np.uint64)
+    return PageHash(int((bits * _BIT_WEIGHTS).sum()), width, height)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    # numpy < 2.0
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class MultiIndexHash:
+    """Hamming-distance search over 64-bit hashes by multi-index hashing.
+
+    Every hash is split into ``chunks`` substrings, each with its own table. Two hashes within
+    distance ``r`` agree to within ``r // chunks`` bits on at least one substring, so a search
+    only probes the substrings that close to the query's and checks the full distance of the
+    candidates found in one vectorized pass, whatever the number of hashes indexed.
+    """
+
+    def __init__(self, bits: int = HASH_BITS, chunks: int = MIH_CHUNKS):
+        self.bits = bits
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self._chunk_mask = (1 << self.chunk_bits) - 1
+        # positions per substring as int64 arrays, read by numpy without copying
+        self._tables: List[Dict[int, array.array]] = [{} for _ in range(chunks)]
+        self._values = np.zeros(1024, dtype=np.uint64)
+        self._size = 0
+        self._flips: Dict[int, List[int]] = {}
+
+    def __len__(self):
+        return self._size
+
+    def _chunks(self, value: int) -> List[int]:
+        return [(value >> (self.chunk_bits * index)) & self._chunk_mask for index in range(self.chunks)]
+
+    def _flip_masks(self, radius: int) -> List[int]:
+        if radius not in self._flips:
+            self._flips[radius] = [
+                sum(1 << bit for bit in positions) for distance in range(radius + 1) for positions in itertools.combinations(range(self.chunk_bits), distance)
+            ]
+        return self._flips[radius]
+
+    def add(self, value: int) -> int:
+        position = self._size
+        if position == len(self._values):
+            self._values = np.concatenate((self._values, np.zeros_like(self._values)))
+        self._values[position] = value
+        self._size += 1
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table.get(chunk)
+            if bucket is None:
+                bucket = table[chunk] = array.array("q")
+            bucket.append(position)
+        return position
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """``(position, distance)`` of every indexed hash within ``max_distance``, nearest first."""
+        flips = self._flip_masks(max_distance // self.chunks)
+        buckets = []
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for flip in flips:
+                bucket = table.get(chunk ^ flip)
+                if bucket is not None:
+                    buckets.append(np.frombuffer(bucket, dtype=np.int64))
+        if not buckets:
+            return []
+
+        candidates = np.concatenate(buckets)
+        distances = _popcount(self._values[candidates] ^ np.uint64(value))
+        close = distances <= max_distance
+        # a hash close on several substrings is found once per substring
+        positions, first = np.unique(candidates[close], return_index=True)
+        distances = distances[close][first]
+        order = np.argsort(distances, kind="stable")
+        return list(zip(positions[order].tolist(), distances[order].tolist()))
+
+
+class NearDuplicateIndex:
+    """Perceptual hashes of OCRed pages pointing at their raw responses in the OCR cache.
+
+    Entries are kept in a ``MultiIndexHash`` in memory and, with a ``path``, in sqlite so
+    the index survives restarts; it is loaded back on construction.
+    """
+
+    def __init__(self, path: str = None, max_distance: int = None, max_aspect_change: float = NEAR_DUPLICATE_MAX_ASPECT_CHANGE):
+        self.path = path
+        self.max_distance = setting("NEAR_DUPLICATE_MAX_DISTANCE") if max_distance is None else max_distance
+        self.max_aspect_change = max_aspect_change
+        self._lock = threading.Lock()
+        self._hashes = MultiIndexHash()
+        # None where a key was discarded; the hash stays in the MultiIndexHash but is skipped
+        self._entries: List[Tuple[str, int, int] | None] = []
+        self._positions: Dict[str, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "stale": 0}
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS page_hashes (key TEXT PRIMARY KEY, hash INTEGER NOT NULL, width INTEGER NOT NULL, height INTEGER NOT NULL, created_at REAL NOT NULL)")
+            self._db.commit()
+            for key, value, width, height in self._db.execute("SELECT key, hash, width, height FROM page_hashes ORDER BY rowid"):
+                # sqlite integers are signed
+                self._insert(key, PageHash(value & 0xFFFFFFFFFFFFFFFF, width, height))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _insert(self, key: str, page: PageHash):
+        self._positions[key] = len(self._entries)
+        self._entries.append((key, page.width, page.height))
+        self._hashes.add(page.value)
+
+    def add(self, key: str, page: PageHash):
+        with self._lock:
+            if key in self._positions:
+                return
+            self._insert(key, page)
+            self._stats["writes"] += 1
+            if self._db is not None:
+                signed = page.value - (1 << 64) if page.value >= 1 << 63 else page.value
+                self._db.execute("INSERT OR REPLACE INTO page_hashes (key, hash, width, height, created_at) VALUES (?, ?, ?, ?, ?)", (key, signed, page.width, page.height, time.time()))
+                self._db.commit()
+
+    def lookup(self, page: PageHash, key_prefix: str = "") -> NearDuplicate | None:
+        """Nearest indexed page with the same ``key_prefix`` (provider and mode) and aspect ratio, or None."""
+        aspect = page.width / page.height
+        with self._lock:
+            for position, distance in self._hashes.search(page.value, self.max_distance):
+                entry = self._entries[position]
+                if entry is None:
+                    continue
+                key, width, height = entry
+                if key.startswith(key_prefix) and abs(width / height / aspect - 1) <= self.max_aspect_change:
+                    self._stats["hits"] += 1
+                    return NearDuplicate(key, width, height, distance)
+            self._stats["misses"] += 1
+        return None
+
+    def discard(self, key: str):
+        """Forget a page whose response is no longer in the OCR cache; the lookup that found it is counted as stale, not as a hit."""
+        with self._lock:
+            position = self._positions.pop(key, None)
+            if position is None:
+                return
+            self._entries[position] = None
+            self._stats["hits"] -= 1
+            self._stats["stale"] += 1
+            if self._db is not None:
+                self._db.execute("DELETE FROM page_hashes WHERE key = ?", (key,))
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats, pages=len(self._positions))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index() -> NearDuplicateIndex | None:
+    """Process-wide index, None unless ``NEAR_DUPLICATE_ENABLED``; persisted next to the OCR cache when ``OCR_CACHE_DIR`` is set."""
+    global _index
+    if not setting("NEAR_DUPLICATE_ENABLED"):
+        return None
+    with _index_lock:
+        if _index is None:
+            cache_dir = setting("OCR_CACHE_DIR")
+            _index = NearDuplicateIndex(path=os.path.join(cache_dir, "near_duplicates.sqlite3") if cache_dir else None)
+        return _index
+
+
+def _scale_polygons(value, scale_x: float, scale_y: float):
+    if isinstance(value, dict):
+        if set(value) == {"x", "y"}:
+            return {"x": value["x"] * scale_x, "y": value["y"] * scale_y}
+        return {key: _scale_polygons(item, scale_x, scale_y) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_scale_polygons(item, scale_x, scale_y) for item in value]
+    return value
+
+
+def rescale_analyze_result(result: dict, scale_x: float, scale_y: float) -> dict:
+    """``AnalyzeResult.to_dict()`` output with pixel polygons and page sizes scaled to another scan of the page."""
+    if not any(page.get("unit") == "pixel" for page in result.get("pages", [])):
+        return result
+    scaled = _scale_polygons(result, scale_x, scale_y)
+    for page in scaled["pages"]:
+        page["width"], page["height"] = page["width"] * scale_x, page["height"] * scale_y
+    return scaled
+
+
+def reuse_near_duplicate(image_data: bytes, cache_key: str, compute: Callable, rescale: Callable = None):
+    """``compute()`` unless a near-duplicate of the page already has a cached response for the same provider and mode.
+
+    ``cache_key`` is the page's ``make_ocr_cache_key``. A reused response goes through
+    ``rescale(response, scale_x, scale_y)`` when the provider reports pixel coordinates;
+    Textract geometry is relative to the page and needs none.
+    """
+    index = get_near_duplicate_index()
+    if index is None:
+        return compute()
+
+    provider = cache_key.split(":", 1)[0]
+    try:
+        with metrics.span("near_duplicate_lookup", provider):
+            page = page_hash(image_data)
+            key_prefix = cache_key.rsplit(":", 1)[0] + ":"
+            match = index.lookup(page, key_prefix=key_prefix)
+            prior = get_ocr_cache().get(match.key) if match is not None else None
+            while match is not None and prior is None:
+                # the response left the OCR cache (TTL or size eviction) after its page was indexed
+                index.discard(match.key)
+                match = index.lookup(page, key_prefix=key_prefix)
+                prior = get_ocr_cache().get(match.key) if match is not None else None
+    except UnidentifiedImageError:
+        # PDFs and other documents the provider reads itself have no single page to hash
+        return compute()
+    if prior is not None:
+        if metrics.metrics_enabled():
+            metrics.registry.inc("ocr_pipeline_near_duplicate_hits_total", provider=provider)
+        return rescale(prior, page.width / match.width, page.height / match.height) if rescale else prior
+
+    response = compute()
+    index.add(cache_key, page)
+    return response
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from settings import setting
+
+
+def make_ocr_cache_key(image_data: bytes, provider: str, mode: str) -> str:
+    """Content address of one OCR call: image bytes hash + provider + mode."""
+    return "{}:{}:{}".format(provider, mode, hashlib.sha256(image_data).hexdigest())
+
+
+class OCRResultCache:
+    """Raw provider responses in a bounded in-memory LRU backed by an optional sqlite store.
+
+    Values are kept as compressed JSON so every hit returns a fresh copy the caller may mutate.
+    Both tiers drop entries older than ``ttl_seconds``; the disk store also evicts the least
+    recently used ones once it grows past ``max_bytes``.
+    """
+
+    table_name = "ocr_results"
+
+    def __init__(self, path: str = None, memory_items: int = None, ttl_seconds: int = None, max_bytes: int = None):
+        self.path = path
+        self.memory_items = setting("OCR_CACHE_MEMORY_ITEMS") if memory_items is None else memory_items
+        self.ttl_seconds = setting("OCR_CACHE_TTL_SECONDS") if ttl_seconds is None else ttl_seconds
+        self.max_bytes = setting("OCR_CACHE_MAX_BYTES") if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        # key -> (compressed value, created_at)
+        self._memory = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.table_name} (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {self.table_name}_accessed_at ON {self.table_name} (accessed_at)")
+            self._db.commit()
+
+    def _remember(self, key: str, value: bytes, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            now = time.time()
+            value = None
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                value = entry[0]
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+            elif entry is not None:
+                del self._memory[key]
+                # otherwise the disk row has the same created_at and its deletion below is counted
+                if self._db is None:
+                    self._stats["evictions"] += 1
+            if value is None and self._db is not None:
+                row = self._db.execute(f"SELECT value, created_at FROM {self.table_name} WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    value = row[0]
+                    self._db.execute(f"UPDATE {self.table_name} SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, value, row[1])
+                    self._stats["disk_hits"] += 1
+                elif row:
+                    self._db.execute(f"DELETE FROM {self.table_name} WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["evictions"] += 1
+
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+
+        return json.loads(zlib.decompress(value))
+
+    def set(self, key: str, response: dict):
+        value = zlib.compress(json.dumps(response, ensure_ascii=False, default=str).encode("utf-8"))
+        with self._lock:
+            now = time.time()
+            self._remember(key, value, now)
+            self._stats["writes"] += 1
+            if self._db is not None:
+                self._db.execute(f"INSERT OR REPLACE INTO {self.table_name} (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now))
+                self._evict(now)
+                self._db.commit()
+
+    def _evict(self, now: float):
+        expired = self._db.execute(f"DELETE FROM {self.table_name} WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        self._stats["evictions"] += max(expired, 0)
+        total_size = self._db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table_name}").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        for key, size in self._db.execute(f"SELECT key, size FROM {self.table_name} ORDER BY accessed_at").fetchall():
+            if total_size <= self.max_bytes:
+                break
+            self._db.execute(f"DELETE FROM {self.table_name} WHERE key = ?", (key,))
+            total_size -= size
+            self._stats["evictions"] += 1
+
+    def get_or_compute(self, key: str, compute):
+        """Return the cached response for ``key`` or call ``compute()`` and store its result."""
+        response = self.get(key)
+        if response is None:
+            response = compute()
+            self.set(key, response)
+        return response
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_items"], stats["disk_bytes"] = self._db.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table_name}").fetchone()
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table_name}")
+                self._db.commit()
+
+
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRResultCache:
+    """Process-wide cache; the disk tier is enabled by setting ``OCR_CACHE_DIR``."""
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            cache_dir = setting("OCR_CACHE_DIR")
+            _ocr_cache = OCRResultCache(path=os.path.join(cache_dir, "ocr_results.sqlite3") if cache_dir else None)
+        return _ocr_cache
@@ -0,0 +1,271 @@
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from word_boxes import WordBoxes
+
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+# hedge delay until a provider has HEDGE_MIN_SAMPLES latencies on record
+DEFAULT_HEDGE_DELAY = 2.0
+LATENCY_WINDOW = 500
+
+
+def _pixel(value) -> int:
+    return value if type(value) is int else int(round(value))
+
+
+def _normalize_polygon(polygon) -> List[Dict]:
+    """AWS ``{"X", "Y"}`` dicts, Azure ``Point`` objects or ``[x, y]`` pairs as ``[{"X", "Y"}, ...]`` of whole pixels."""
+    points = []
+    for point in polygon:
+        if isinstance(point, dict):
+            x, y = point["X"], point["Y"]
+        elif hasattr(point, "x"):
+            x, y = point.x, point.y
+        else:
+            x, y = point[0], point[1]
+        points.append({"X": _pixel(x), "Y": _pixel(y)})
+    return points
+
+
+def _normalize_word(word: Dict) -> Dict:
+    bbox = word["bbox"]
+    left, top, right, bottom = bbox["l"], bbox["t"], bbox["r"], bbox["b"]
+    if type(left) is int and type(top) is int and type(right) is int and type(bottom) is int and left <= right and top <= bottom and type(bbox["pt1"]) is tuple:
+        return word
+    left, right = sorted((_pixel(left), _pixel(right)))
+    top, bottom = sorted((_pixel(top), _pixel(bottom)))
+    return {"bbox": {"pt1": (left, top), "pt2": (right, bottom), "l": left, "t": top, "r": right, "b": bottom}, "text": word["text"]}
+
+
+def _normalize_word_boxes(words: WordBoxes) -> WordBoxes:
+    if words.left.dtype.kind == "i" and words.top.dtype.kind == "i":
+        return words
+    left, top, right, bottom = (np.rint(column).astype(np.int32) for column in (words.left, words.top, words.right, words.bottom))
+    return WordBoxes(np.minimum(left, right), np.minimum(top, bottom), np.maximum(left, right), np.maximum(top, bottom), words.text_table, words.text_start, words.text_end)
+
+
+def _normalize_table(table: Dict, index: int) -> Dict:
+    """One table with 1-based int row and column keys, ``table-N`` ids and one ``[{"X", "Y"}, ...]`` polygon per cell."""
+    # Azure rows and columns are 0-based string keys and every cell holds a list of bounding regions
+    zero_based = any(isinstance(row_index, str) for row_index in table["rows"])
+    offset = 1 if zero_based else 0
+
+    def row_key(row_index):
+        return int(row_index) + offset
+
+    polygon = {}
+    for row_index, cells in table.get("polygon", {}).items():
+        polygon[row_key(row_index)] = [_normalize_polygon(cell[0] if zero_based else cell) for cell in cells]
+
+    return {
+        "id": f"table-{index + 1}",
+        "rows": {row_key(row_index): list(cells) for row_index, cells in table["rows"].items()},
+        "scores": {row_key(row_index): [float(score) for score in scores] for row_index, scores in table.get("scores", {}).items()},
+        "merged_cells": {
+            row_key(row_index): {int(column_index) + offset: dict(span) for column_index, span in columns.items()}
+            for row_index, columns in table.get("merged_cells", {}).items()
+        },
+        "polygon": polygon,
+        "row_count": table["row_count"],
+        "column_count": table["column_count"],
+    }
+
+
+def normalize_result(result: Dict, provider: str, as_columns=False) -> Dict:
+    """Provider-agnostic OCR result: pixel word boxes, reading-order text and tables keyed the same way.
+
+    Row and ``merged_cells`` column keys are 1-based ints for both providers, cell polygons are
+    ``[{"X", "Y"}, ...]`` and scores are one float per cell on a 0-100 scale. Word boxes are
+    whole pixels as Textract reports them: ``l``/``t``/``r``/``b`` are the box's bounds and
+    ``pt1``/``pt2`` its top-left and bottom-right ``(x, y)`` tuples. Words are plain dicts, or a
+    columnar ``WordBoxes`` with ``as_columns=True``.
+    """
+    words = result.get("text_annotations", [])
+    if isinstance(words, WordBoxes):
+        words = _normalize_word_boxes(words)
+        if not as_columns:
+            words = words.to_list()
+    else:
+        words = [_normalize_word(word) for word in words]
+        if as_columns:
+            words = WordBoxes.from_dicts(words)
+    return {
+        "provider": provider,
+        "text_annotations": words,
+        "format_text": result.get("format_text", ""),
+        "tables": [_normalize_table(table, index) for index, table in enumerate(result.get("tables") or [])],
+    }
+
+
+def aws_provider(use_extract_table=False, ocr: Callable = None, as_columns=False) -> Callable:
+    """``image -> normalized result`` through Textract; ``ocr`` replaces the Textract call, e.g. with a replay provider."""
+    import aws_ocr
+
+    ocr = ocr or (lambda image_data: aws_ocr.aws_textract_image(image_data, use_extract_table=use_extract_table))
+
+    def run(image_data):
+        response = ocr(image_data)
+        result = aws_ocr._postprocess_textract_response(response, image_data, use_extract_table=use_extract_table, as_columns=as_columns)
+        return normalize_result(result, "aws-textract", as_columns=as_columns)
+
+    return run
+
+
+def azure_provider(use_extract_table=False, ocr: Callable = None, as_columns=False) -> Callable:
+    """``image -> normalized result`` through Form Recognizer; ``ocr`` must return ``AnalyzeResult.to_dict()`` output."""
+    import azure_ocr
+
+    ocr = ocr or (lambda image_data: azure_ocr._analyze_document_dict(image_data, use_extract_table=use_extract_table))
+
+    def run(image_data):
+        return normalize_result(azure_ocr._postprocess_analyze_result(ocr(image_data), as_columns=as_columns), "azure-formrecognizer", as_columns=as_columns)
+
+    return run
+
+
+class LatencyTracker:
+    """Sliding window of recent successful latencies and error counts per provider."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, collections.deque] = {}
+        self._errors: Dict[str, int] = {}
+
+    def record(self, provider: str, seconds: float, error: bool = False):
+        with self._lock:
+            if error:
+                self._errors[provider] = self._errors.get(provider, 0) + 1
+            else:
+                self._latencies.setdefault(provider, collections.deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, provider: str, q: float, min_samples: int = HEDGE_MIN_SAMPLES) -> float | None:
+        with self._lock:
+            latencies = list(self._latencies.get(provider, ()))
+        if len(latencies) < min_samples:
+            return None
+        return float(np.quantile(latencies, q))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            providers = set(self._latencies) | set(self._errors)
+            latencies = {provider: list(self._latencies.get(provider, ())) for provider in providers}
+            errors = dict(self._errors)
+        return {
+            provider: {
+                "count": len(values),
+                "errors": errors.get(provider, 0),
+                "p50": float(np.quantile(values, 0.5)) if values else None,
+                "p95": float(np.quantile(values, 0.95)) if values else None,
+            }
+            for provider, values in latencies.items()
+        }
+
+
+class HedgedOCR:
+    """Call the primary provider and, if it has not answered by its p95 latency, also the next one.
+
+    ``providers`` is an ordered list of ``(name, image -> normalized result)`` pairs. The first
+    answer that passes ``accept`` wins; a slower request keeps running in the background so its
+    latency is still recorded. If no answer is accepted the first successful one is returned,
+    and if every provider fails the last error is raised.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[Tuple[str, Callable]],
+        hedge_delay: float = None,
+        percentile: float = HEDGE_PERCENTILE,
+        default_delay: float = DEFAULT_HEDGE_DELAY,
+        accept: Callable[[Dict], bool] = None,
+        tracker: LatencyTracker = None,
+        max_workers: int = 16,
+    ):
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.accept = accept or (lambda result: len(result["text_annotations"]) > 0 or bool(result["format_text"].strip()))
+        self.tracker = tracker or LatencyTracker()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "hedged": 0, "wins": {}}
+
+    def current_hedge_delay(self, provider: str) -> float:
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        delay = self.tracker.quantile(provider, self.percentile)
+        return self.default_delay if delay is None else delay
+
+    def _submit(self, name: str, provider: Callable, image_data):
+        def run():
+            started = time.perf_counter()
+            try:
+                result = provider(image_data)
+            except Exception:
+                self.tracker.record(name, time.perf_counter() - started, error=True)
+                raise
+            elapsed = time.perf_counter() - started
+            self.tracker.record(name, elapsed)
+            return {**result, "latency": elapsed}
+
+        return self._executor.submit(run)
+
+    def __call__(self, image_data) -> Dict:
+        started = time.perf_counter()
+        pending = {}
+        waiting = collections.deque(self.providers)
+        hedged = False
+        fallback = None
+        error = None
+
+        name, provider = waiting.popleft()
+        pending[self._submit(name, provider, image_data)] = name
+        # measured from the latest launch, so a failure or rejection in between does not restart the wait
+        hedge_at = started + self.current_hedge_delay(name)
+        while pending:
+            timeout = max(hedge_at - time.perf_counter(), 0.0) if waiting else None
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                winner = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if self.accept(result):
+                    return self._finish(winner, result, started, hedged)
+                fallback = fallback or (winner, result)
+
+            # hedge on timeout; fail over at once when every running request failed or was rejected
+            if waiting and (not done or not pending):
+                hedged = hedged or not done
+                name, provider = waiting.popleft()
+                pending[self._submit(name, provider, image_data)] = name
+                hedge_at = time.perf_counter() + self.current_hedge_delay(name)
+
+        if fallback is not None:
+            return self._finish(*fallback, started, hedged)
+        raise error
+
+    def _finish(self, winner: str, result: Dict, started: float, hedged: bool) -> Dict:
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["hedged"] += hedged
+            self._stats["wins"][winner] = self._stats["wins"].get(winner, 0) + 1
+        return {**result, "hedged": hedged, "elapsed": time.perf_counter() - started}
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = {"requests": self._stats["requests"], "hedged": self._stats["hedged"], "wins": dict(self._stats["wins"])}
+        stats["latency"] = self.tracker.snapshot()
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,215 @@
+import math
+import os
+import re
+import struct
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Tuple
+
+import metrics
+from settings import setting
+
+# AIMD: halve the rate on a throttling response, win back 5% of the quota per success
+RATE_DECREASE = 0.5
+RATE_INCREASE = 0.05
+MIN_RATE_SHARE = 0.05
+# throttles within this many seconds of the last decrease belong to the same burst
+DECREASE_COOLDOWN = 1.0
+# pause after a throttling answer that carries no Retry-After
+DEFAULT_RETRY_AFTER = 1.0
+THROTTLED_STATUS = (429, 503)
+# tokens, last refill, current rate, blocked until, last decrease
+_STATE = struct.Struct("<5d")
+
+
+def rate_limits() -> Dict[str, Tuple[float, float]]:
+    """``kind -> (units per second at full quota, seconds of burst)``; a rate of 0, the default, turns the limiter off."""
+    return {
+        "textract": (setting("TEXTRACT_MAX_TPS"), 1.0),
+        "formrecognizer": (setting("FORMRECOGNIZER_MAX_TPS"), 1.0),
+        # Azure OpenAI enforces its per-minute quotas over 10 second windows
+        "openai-requests": (setting("OPENAI_MAX_RPM") / 60, 10.0),
+        "openai-tokens": (setting("OPENAI_MAX_TPM") / 60, 10.0),
+    }
+
+
+class _MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def transact(self, update: Callable):
+        with self._lock:
+            self._state, result = update(self._state)
+            return result
+
+
+class _FileBackend:
+    """Limiter state in a 40 byte file, read and rewritten under ``flock`` so every process shares one bucket."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+
+    def _file(self) -> int:
+        # a forked child must not share the parent's open file, flock would not tell them apart
+        if self._fd is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def transact(self, update: Callable):
+        import fcntl
+
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(fd, _STATE.size, 0)
+                state, result = update(_STATE.unpack(data) if len(data) == _STATE.size else None)
+                os.pwrite(fd, _STATE.pack(*state), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            return result
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate follows AIMD: cut on throttling, grown back on success.
+
+    ``acquire(cost)`` blocks until ``cost`` units (requests or LLM tokens) are available. A
+    cost above the burst size waits for a full bucket and then runs the bucket into debt, so
+    large requests still pass at the average rate. ``on_throttle`` also pauses everyone
+    sharing the bucket for the provider's ``Retry-After``.
+    """
+
+    def __init__(self, name: str, max_rate: float, burst_seconds: float = 1.0, backend=None):
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = max_rate * MIN_RATE_SHARE
+        self.capacity = max(max_rate * burst_seconds, 1.0)
+        self._backend = backend or _MemoryBackend()
+
+    def _current(self, state, now: float) -> list:
+        if state is None:
+            return [self.capacity, now, self.max_rate, 0.0, 0.0]
+        tokens, updated, rate, blocked_until, last_decrease = state
+        rate = min(max(rate, self.min_rate), self.max_rate)
+        return [min(self.capacity, tokens + max(now - updated, 0.0) * rate), now, rate, blocked_until, last_decrease]
+
+    def _take(self, state, cost: float):
+        now = time.time()
+        state = self._current(state, now)
+        if now < state[3]:
+            return state, state[3] - now
+        needed = min(cost, self.capacity)
+        if state[0] < needed:
+            return state, (needed - state[0]) / state[2]
+        state[0] -= cost
+        return state, 0.0
+
+    def acquire(self, cost: float = 1.0) -> float:
+        """Block until ``cost`` units are granted; returns the seconds spent waiting."""
+        started = time.perf_counter()
+        while True:
+            wait = self._backend.transact(lambda state: self._take(state, cost))
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        waited = time.perf_counter() - started
+        if waited and metrics.metrics_enabled():
+            metrics.registry.inc("ocr_pipeline_rate_limit_wait_seconds_total", waited, limiter=self.name)
+        return waited
+
+    def on_success(self):
+        def update(state):
+            state = self._current(state, time.time())
+            state[2] = min(state[2] + self.max_rate * RATE_INCREASE, self.max_rate)
+            return state, None
+
+        self._backend.transact(update)
+
+    def on_throttle(self, retry_after: float = None):
+        def update(state):
+            now = time.time()
+            state = self._current(state, now)
+            if now - state[4] >= DECREASE_COOLDOWN:
+                state[2] = max(state[2] * RATE_DECREASE, self.min_rate)
+                state[4] = now
+            state[3] = max(state[3], now + (DEFAULT_RETRY_AFTER if retry_after is None else retry_after))
+            return state, None
+
+        self._backend.transact(update)
+        if metrics.metrics_enabled():
+            metrics.registry.inc("ocr_pipeline_throttled_total", limiter=self.name)
+
+    def state(self) -> Dict:
+        def read(state):
+            current = self._current(state, time.time())
+            return current, current
+
+        tokens, _, rate, blocked_until, _ = self._backend.transact(read)
+        return {"name": self.name, "tokens": tokens, "rate": rate, "max_rate": self.max_rate, "blocked_for": max(blocked_until - time.time(), 0.0)}
+
+
+_lock = threading.Lock()
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_rate_limiter(kind: str, endpoint: str = "") -> AdaptiveRateLimiter | None:
+    """Shared limiter for one quota of ``kind`` (a ``rate_limits()`` key) at ``endpoint``, None when unlimited."""
+    max_rate, burst_seconds = rate_limits().get(kind, (0, 0))
+    if max_rate <= 0:
+        return None
+
+    name = f"{kind}:{endpoint}" if endpoint else kind
+    with _lock:
+        if name not in _limiters:
+            backend = None
+            state_dir = setting("RATE_LIMIT_DIR")
+            if state_dir:
+                backend = _FileBackend(os.path.join(state_dir, re.sub(r"[^\w.-]", "_", name) + ".bucket"))
+            _limiters[name] = AdaptiveRateLimiter(name, max_rate, burst_seconds, backend=backend)
+        return _limiters[name]
+
+
+def parse_retry_after(headers) -> float | None:
+    """Seconds from ``retry-after-ms`` (Azure OpenAI) or ``Retry-After`` as seconds or an HTTP date."""
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(payload: dict, image_tokens: int = 0) -> int:
+    """Tokens a chat-completions request counts against the quota: the prompt estimate plus ``max_tokens``.
+
+    Azure OpenAI charges ``max_tokens`` up front, so the estimate is not refunded after the
+    response. Text is estimated at about 3 characters per token; images are not visible in
+    the payload and come in as ``image_tokens``.
+    """
+    characters = 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                characters += len(part.get("text", ""))
+    return math.ceil(characters / 3) + image_tokens + int(payload.get("max_tokens") or 0)
@@ -0,0 +1,243 @@
+import gzip
+import json
+import os
+import threading
+import zlib
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from word_boxes import json_default
+
+STREAM_CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+
+
+def _json_dumps(result) -> bytes:
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+
+def _json_pretty_dumps(result) -> bytes:
+    return json.dumps(result, ensure_ascii=False, indent=2, default=json_default).encode("utf-8")
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ImportError("msgpack output needs msgpack, install it with `pip install msgpack`") from e
+    return msgpack
+
+
+def _msgpack_dumps(result) -> bytes:
+    return _msgpack().packb(result, default=json_default, use_bin_type=True)
+
+
+def _msgpack_loads(data: bytes):
+    return _msgpack().unpackb(data, raw=False, strict_map_key=False)
+
+
+# name -> (dumps, loads); dumps returns bytes
+FORMATS: Dict[str, Tuple[Callable, Callable]] = {
+    "json": (_json_dumps, json.loads),
+    "json-pretty": (_json_pretty_dumps, json.loads),
+    "msgpack": (_msgpack_dumps, _msgpack_loads),
+}
+COMPRESSIONS: Dict[str, Tuple[Callable, Callable]] = {
+    "gzip": (lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), gzip.decompress),
+}
+
+
+def register_format(name: str, dumps: Callable, loads: Callable):
+    """Add an output format; ``dumps(result) -> bytes`` and ``loads(bytes) -> result``."""
+    FORMATS[name] = (dumps, loads)
+
+
+def guess_format(path: str) -> Tuple[str, str | None]:
+    """``(format, compression)`` from a file name such as ``page.json``, ``page.msgpack`` or ``batch.ndjson.gz``."""
+    name = os.path.basename(path)
+    compression = None
+    if name.endswith(".gz"):
+        compression, name = "gzip", name[: -len(".gz")]
+    return ("msgpack" if name.endswith((".msgpack", ".mp")) else "json"), compression
+
+
+def dumps_result(result, fmt: str = "json", compression: str = None) -> bytes:
+    data = FORMATS[fmt][0](result)
+    if compression:
+        data = COMPRESSIONS[compression][0](data)
+    return data
+
+
+def loads_result(data: bytes, fmt: str = "json", compression: str = None):
+    if compression:
+        data = COMPRESSIONS[compression][1](data)
+    return FORMATS[fmt][1](data)
+
+
+def write_result(path: str, result, fmt: str = None, compression: str = None):
+    """Write one result; format and compression default to what the file name suggests (compact JSON otherwise)."""
+    guessed_format, guessed_compression = guess_format(path)
+    with open(path, "wb") as writer:
+        writer.write(dumps_result(result, fmt or guessed_format, compression or guessed_compression))
+
+
+def read_result(path: str, fmt: str = None, compression: str = None):
+    guessed_format, guessed_compression = guess_format(path)
+    with open(path, "rb") as reader:
+        return loads_result(reader.read(), fmt or guessed_format, compression or guessed_compression)
+
+
+def _index_path(path: str) -> str:
+    return path + ".idx"
+
+
+def _scan_plain(reader) -> List[Tuple]:
+    entries = []
+    offset = 0
+    for line in reader:
+        if not line.endswith(b"\n"):
+            break
+        entries.append((json.loads(line)["id"], offset, len(line)))
+        offset += len(line)
+    return entries
+
+
+def _scan_gzip(reader) -> List[Tuple]:
+    entries = []
+    offset = 0
+    pending = b""
+    while True:
+        decompressor = zlib.decompressobj(wbits=31)
+        chunks = []
+        length = 0
+        data = pending
+        while not decompressor.eof:
+            if not data:
+                data = reader.read(STREAM_CHUNK_SIZE)
+                if not data:
+                    # end of file, or a record cut short by a crash
+                    return entries
+            chunks.append(decompressor.decompress(data))
+            pending = decompressor.unused_data
+            length += len(data) - len(pending)
+            data = b""
+        entries.append((json.loads(b"".join(chunks))["id"], offset, length))
+        offset += length
+
+
+def _load_index(path: str, compression: str = None) -> List[Tuple]:
+    """``[(id, offset, length)]`` for every complete record, rebuilt from the data when the sidecar index is stale."""
+    if not os.path.exists(path):
+        return []
+    size = os.path.getsize(path)
+
+    entries = []
+    if os.path.exists(_index_path(path)):
+        with open(_index_path(path), "rb") as reader:
+            for line in reader:
+                if line.endswith(b"\n"):
+                    entries.append(tuple(json.loads(line)))
+    if (entries[-1][1] + entries[-1][2] if entries else 0) == size:
+        return entries
+
+    with open(path, "rb") as reader:
+        return _scan_gzip(reader) if compression == "gzip" else _scan_plain(reader)
+
+
+class NDJSONSink:
+    """Append-only NDJSON file of ``{"id", "record"}`` lines, written and flushed as each record completes.
+
+    With ``compression="gzip"`` (the default for ``*.gz`` paths) every record is its own gzip
+    member, so the file still decompresses as a whole with ``gunzip`` while each record stays
+    seekable. A ``<path>.idx`` sidecar holds the byte range of every record; on reopen an
+    interrupted trailing record is dropped and a stale index is rebuilt from the data.
+    """
+
+    def __init__(self, path: str, compression: str = None):
+        self.path = path
+        self.compression = compression or guess_format(path)[1]
+        self._lock = threading.Lock()
+
+        entries = _load_index(path, self.compression)
+        self._offset = entries[-1][1] + entries[-1][2] if entries else 0
+        self._ids = {entry[0] for entry in entries}
+        self._writer = open(path, "ab")
+        self._writer.truncate(self._offset)
+        with open(_index_path(path), "wb") as writer:
+            writer.write(b"".join(_json_dumps(list(entry)) + b"\n" for entry in entries))
+        self._index_writer = open(_index_path(path), "ab")
+
+    def write(self, doc_id, record):
+        data = _json_dumps({"id": doc_id, "record": record}) + b"\n"
+        if self.compression:
+            data = COMPRESSIONS[self.compression][0](data)
+        with self._lock:
+            self._writer.write(data)
+            self._writer.flush()
+            self._index_writer.write(_json_dumps([doc_id, self._offset, len(data)]) + b"\n")
+            self._index_writer.flush()
+            self._offset += len(data)
+            self._ids.add(doc_id)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+            self._index_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NDJSONReader:
+    """Random access to an ``NDJSONSink`` file: ``reader[doc_id]`` reads only that record's bytes."""
+
+    def __init__(self, path: str, compression: str = None):
+        self.path = path
+        self.compression = compression or guess_format(path)[1]
+        self._entries = _load_index(path, self.compression)
+        # the latest record wins when an id was written more than once
+        self._by_id = {entry[0]: entry for entry in self._entries}
+        self._reader = open(path, "rb")
+
+    def _read(self, offset: int, length: int) -> dict:
+        self._reader.seek(offset)
+        return loads_result(self._reader.read(length), "json", self.compression)
+
+    def __getitem__(self, doc_id):
+        _, offset, length = self._by_id[doc_id]
+        return self._read(offset, length)["record"]
+
+    def get(self, doc_id, default=None):
+        return self[doc_id] if doc_id in self._by_id else default
+
+    def __contains__(self, doc_id):
+        return doc_id in self._by_id
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def ids(self) -> List:
+        return list(self._by_id)
+
+    def __iter__(self) -> Iterator[Tuple]:
+        """``(id, record)`` pairs in write order."""
+        for _, offset, length in self._entries:
+            line = self._read(offset, length)
+            yield line["id"], line["record"]
+
+    def close(self):
+        self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
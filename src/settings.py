@@ -0,0 +1,78 @@
+import functools
+import os
+
+# every environment setting the pipeline reads: name -> (type, default)
+SETTINGS = {
+    "AWS_ACCESS_KEY_ID": (str, None),
+    "AWS_SECRET_ACCESS_KEY": (str, None),
+    "AZURE_FORMREGONIZER_ENDPOINT": (str, None),
+    "AZURE_FORMREGONIZER_KEY": (str, None),
+    "OPENAI_API_BASE": (str, None),
+    "OPENAI_API_KEY": (str, None),
+    "OPENAI_API_TYPE": (str, None),
+    "OPENAI_API_VERSION": (str, None),
+    "OPENAI_VISION_URL": (str, "https://cogopenaiscgjwddocutil1.openai.azure.com/openai/deployments/gpt-4-vision/chat/completions?api-version=2024-02-15-preview"),
+    "HTTP_POOL_CONNECTIONS": (int, 10),
+    "HTTP_POOL_MAXSIZE": (int, 10),
+    "OCR_CACHE_DIR": (str, None),
+    "OCR_CACHE_MEMORY_ITEMS": (int, 128),
+    "OCR_CACHE_TTL_SECONDS": (int, 30 * 24 * 3600),
+    "OCR_CACHE_MAX_BYTES": (int, 1024 * 1024 * 1024),
+    "LLM_CACHE_DIR": (str, None),
+    "LLM_CACHE_MEMORY_ITEMS": (int, 256),
+    "LLM_CACHE_TTL_SECONDS": (int, 30 * 24 * 3600),
+    "LLM_CACHE_MAX_BYTES": (int, 1024 * 1024 * 1024),
+    # no image token budget unless one is set
+    "VISION_IMAGE_TOKEN_BUDGET": (int, None),
+    "VISION_ENCODE_WORKERS": (int, 4),
+    "VISION_PAYLOAD_CACHE_ITEMS": (int, 256),
+    "METRICS_ENABLED": (bool, False),
+    "METRICS_LOG": (bool, False),
+    # opt-in: pages printed from one template that differ in a few words hash alike too.
+    # Rescans, small rotations, crops and recompression stay within ~6 bits of 64; different pages are 20+ apart
+    "NEAR_DUPLICATE_ENABLED": (bool, False),
+    "NEAR_DUPLICATE_MAX_DISTANCE": (int, 6),
+    # shared by every process that points there; unset keeps the limiter state inside this process
+    "RATE_LIMIT_DIR": (str, None),
+    # quotas differ per account, region and deployment; each limiter stays off until its quota is set
+    "TEXTRACT_MAX_TPS": (float, 0.0),
+    "FORMRECOGNIZER_MAX_TPS": (float, 0.0),
+    "OPENAI_MAX_RPM": (float, 0.0),
+    "OPENAI_MAX_TPM": (float, 0.0),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def load_settings():
+    """Read ``.env`` into the environment once, on the first provider call instead of at import."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def get_setting(name: str, default: str = None) -> str | None:
+    load_settings()
+    return os.environ.get(name, default)
+
+
+def setting(name: str):
+    """A ``SETTINGS`` entry from the environment (after ``.env`` is loaded) as its type, or its default when unset."""
+    kind, default = SETTINGS[name]
+    value = get_setting(name)
+    if not value:
+        return default
+    if kind is bool:
+        return value.lower() in ("1", "true", "yes")
+    return kind(value)
+
+
+def settings_getattr(module: str, names):
+    """Module ``__getattr__`` that keeps settings once read at import available as module constants."""
+    names = frozenset(names)
+
+    def __getattr__(name):
+        if name in names:
+            return setting(name)
+        raise AttributeError(f"module {module!r} has no attribute {name!r}")
+
+    return __getattr__
@@ -0,0 +1,175 @@
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from text_layout import layout_text_batch
+from word_boxes import WordBoxes
+
+TABLE_MIN_ROWS = 3
+TABLE_MIN_COLUMNS = 2
+# horizontal gap, in median word heights, that splits one text line into separate cells
+CELL_GAP_RATIO = 1.2
+# vertical gap, in median word heights, that ends a table
+ROW_GAP_RATIO = 2.0
+# share of a table's rows allowed to cross a column separator (e.g. a long description)
+SPANNING_ROW_RATIO = 0.2
+
+
+class TableRegion(NamedTuple):
+    bands: List[np.ndarray]
+    separators: np.ndarray
+    left: int
+    right: int
+
+
+def _row_bands(top: np.ndarray, bottom: np.ndarray) -> List[np.ndarray]:
+    """Group words into text lines: a word joins the current line when its vertical center falls inside it."""
+    center = (top + bottom) / 2
+    bands = []
+    band = []
+    band_top = band_bottom = None
+    for index in np.argsort(center, kind="stable").tolist():
+        if band and band_top <= center[index] <= band_bottom:
+            band.append(index)
+            band_top, band_bottom = min(band_top, top[index]), max(band_bottom, bottom[index])
+            continue
+        if band:
+            bands.append(np.asarray(band))
+        band, band_top, band_bottom = [index], top[index], bottom[index]
+    if band:
+        bands.append(np.asarray(band))
+    return bands
+
+
+def _segments(band: np.ndarray, left: np.ndarray, right: np.ndarray, gap: float) -> List[tuple]:
+    """Split one line at horizontal gaps wider than ``gap`` into ``(x0, x1)`` segments."""
+    band = band[np.argsort(left[band], kind="stable")]
+    ends = np.maximum.accumulate(right[band])
+    breaks = np.flatnonzero(left[band][1:] - ends[:-1] > gap) + 1
+    starts = np.concatenate(([0], breaks))
+    stops = np.concatenate((breaks, [len(band)]))
+    return [(left[band[start]], ends[stop - 1]) for start, stop in zip(starts.tolist(), stops.tolist())]
+
+
+def _column_separators(segments: List[List[tuple]], min_gap: float) -> np.ndarray:
+    """x positions of the vertical whitespace channels shared by (almost) every row of a candidate table."""
+    x_min = int(min(x0 for row in segments for x0, _ in row))
+    x_max = int(np.ceil(max(x1 for row in segments for _, x1 in row)))
+    coverage = np.zeros(x_max - x_min + 2, dtype=np.int32)
+    for row in segments:
+        for x0, x1 in row:
+            coverage[int(x0) - x_min] += 1
+            coverage[int(np.ceil(x1)) - x_min + 1] -= 1
+    coverage = np.cumsum(coverage)[:-1]
+
+    free = np.concatenate(([False], coverage <= int(len(segments) * SPANNING_ROW_RATIO), [False]))
+    edges = np.diff(free.astype(np.int8))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    # only channels strictly inside the table, not thinly covered margins
+    separators = [
+        (start + stop - 1) / 2 + x_min
+        for start, stop in zip(starts.tolist(), stops.tolist())
+        if start > 0 and stop < len(coverage) and stop - start >= min_gap
+    ]
+    return np.asarray(separators)
+
+
+def find_table_regions(words: List[Dict] | WordBoxes, min_rows: int = TABLE_MIN_ROWS, min_columns: int = TABLE_MIN_COLUMNS) -> List[TableRegion]:
+    """Runs of consecutive multi-cell text lines that share column separators.
+
+    Cheap enough to screen a text-only OCR result before paying for provider table extraction.
+    """
+    if not isinstance(words, WordBoxes):
+        words = WordBoxes.from_dicts(words)
+    if len(words) == 0:
+        return []
+
+    left, top = words.left.astype(np.float64), words.top.astype(np.float64)
+    right, bottom = words.right.astype(np.float64), words.bottom.astype(np.float64)
+    word_height = float(np.median(bottom - top)) or 1.0
+    bands = _row_bands(top, bottom)
+    band_segments = [_segments(band, left, right, CELL_GAP_RATIO * word_height) for band in bands]
+
+    runs = []
+    run = []
+    for band_index, segments in enumerate(band_segments):
+        continues = run and top[bands[band_index]].min() - bottom[bands[run[-1]]].max() <= ROW_GAP_RATIO * word_height
+        if len(segments) >= min_columns and (not run or continues):
+            run.append(band_index)
+            continue
+        if run:
+            runs.append(run)
+        run = [band_index] if len(segments) >= min_columns else []
+    if run:
+        runs.append(run)
+
+    regions = []
+    for run in runs:
+        if len(run) < min_rows:
+            continue
+        separators = _column_separators([band_segments[band_index] for band_index in run], min_gap=CELL_GAP_RATIO * word_height)
+        if len(separators) + 1 < min_columns:
+            continue
+
+        run_bands = [bands[band_index] for band_index in run]
+        filled_rows = sum(len(np.unique(np.searchsorted(separators, (left[band] + right[band]) / 2))) >= min_columns for band in run_bands)
+        if filled_rows < min_rows:
+            continue
+        words_in_table = np.concatenate(run_bands)
+        regions.append(TableRegion(run_bands, separators, int(left[words_in_table].min()), int(np.ceil(right[words_in_table].max()))))
+    return regions
+
+
+def has_tables(words: List[Dict] | WordBoxes) -> bool:
+    return bool(find_table_regions(words))
+
+
+def detect_tables(words: List[Dict] | WordBoxes, min_rows: int = TABLE_MIN_ROWS, min_columns: int = TABLE_MIN_COLUMNS) -> List[Dict]:
+    """Infer table grids from word boxes alone, in the ``aws_ocr.get_data_table`` table dict schema.
+
+    Each text line of a table becomes a row and columns are split at shared whitespace
+    channels. There is no provider confidence, so every cell's score is the share of
+    non-empty cells in its table (0-100), and no merged cells are reported.
+    """
+    if not isinstance(words, WordBoxes):
+        words = WordBoxes.from_dicts(words)
+
+    tables = []
+    for region in find_table_regions(words, min_rows=min_rows, min_columns=min_columns):
+        column_count = len(region.separators) + 1
+        x_bounds = [region.left, *np.round(region.separators).astype(int).tolist(), region.right]
+        band_tops = [int(words.top[band].min()) for band in region.bands]
+        band_bottoms = [int(words.bottom[band].max()) for band in region.bands]
+        y_bounds = [band_tops[0], *[(bottom + top) // 2 for bottom, top in zip(band_bottoms[:-1], band_tops[1:])], band_bottoms[-1]]
+
+        cell_words = []
+        for band in region.bands:
+            centers = (words.left[band].astype(np.float64) + words.right[band]) / 2
+            columns = np.searchsorted(region.separators, centers)
+            cell_words.extend(words.take(band[columns == column]) for column in range(column_count))
+        cell_texts = [text.strip() if len(cell) else "-" for cell, text in zip(cell_words, layout_text_batch(cell_words))]
+        score = str(100 * sum(len(cell) > 0 for cell in cell_words) / len(cell_words))
+
+        rows, scores, polygon = {}, {}, {}
+        for row_position in range(len(region.bands)):
+            row_index = row_position + 1
+            rows[row_index] = cell_texts[row_position * column_count : (row_position + 1) * column_count]
+            scores[row_index] = [score] * column_count
+            y0, y1 = y_bounds[row_position], y_bounds[row_position + 1]
+            polygon[row_index] = [
+                [{"X": x0, "Y": y0}, {"X": x1, "Y": y0}, {"X": x1, "Y": y1}, {"X": x0, "Y": y1}]
+                for x0, x1 in zip(x_bounds[:-1], x_bounds[1:])
+            ]
+
+        tables.append(
+            {
+                "id": f"table-{len(tables) + 1}",
+                "rows": rows,
+                "scores": scores,
+                "merged_cells": {},
+                "polygon": polygon,
+                "row_count": len(rows),
+                "column_count": column_count,
+            }
+        )
+    return tables
@@ -0,0 +1,56 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(TESTS_DIR)
+
+# the pipeline modules import each other by bare name from src/
+sys.path.insert(0, SRC_DIR)
+
+
+def _load(path: str):
+    with open(path, encoding="utf-8") as reader:
+        return json.load(reader)
+
+
+@pytest.fixture
+def recorded():
+    """``recorded(name)`` loads a provider response or processed result recorded in ``src/results``."""
+    return lambda name: _load(os.path.join(SRC_DIR, "results", name))
+
+
+@pytest.fixture
+def test_data():
+    """``test_data(name)`` loads a JSON fixture from ``tests/data``."""
+    return lambda name: _load(os.path.join(TESTS_DIR, "data", name))
+
+
+@pytest.fixture
+def page_size():
+    """Pixel size of the page behind the recorded results."""
+    return (1062, 1484)
+
+
+@pytest.fixture
+def textract_response(recorded):
+    """The recorded Textract ``analyze_document`` response of a page with a table."""
+    return recorded("aws-original-textract-with-table.json")
+
+
+@pytest.fixture
+def random_words():
+    """``random_words(rng, count, size=200)`` word dicts with integer boxes placed at random on a ``size`` square page."""
+
+    def generate(rng: random.Random, count: int, size: int = 200):
+        words = []
+        for index in range(count):
+            left, top = rng.randrange(size), rng.randrange(size)
+            right, bottom = left + rng.randrange(1, 20), top + rng.randrange(1, 12)
+            words.append({"bbox": {"pt1": (left, top), "pt2": (right, bottom), "l": left, "t": top, "r": right, "b": bottom}, "text": f"w{index}"})
+        return words
+
+    return generate
@@ -0,0 +1,44 @@
+import io
+
+from azure.ai.formrecognizer import AnalyzeResult
+from PIL import Image
+
+import azure_ocr
+
+
+def _png(width, height) -> bytes:
+    image_io = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(image_io, "PNG")
+    return image_io.getvalue()
+
+
+class _FakeClient:
+    def __init__(self):
+        self.documents = []
+
+    def begin_analyze_document(self, model_id, document):
+        self.documents.append(document)
+        width, height = Image.open(io.BytesIO(document)).size if document[:5] != b"%PDF-" else (8.5, 11)
+        word = {"content": "total", "polygon": [{"x": 100, "y": 10}, {"x": 200, "y": 10}, {"x": 200, "y": 20}, {"x": 100, "y": 20}], "span": {"offset": 0, "length": 5}, "confidence": 1.0}
+        page = {"page_number": 1, "angle": 0, "width": width, "height": height, "unit": "pixel", "words": [word], "lines": [], "selection_marks": [], "spans": []}
+        result = AnalyzeResult.from_dict({"api_version": "2023-07-31", "model_id": model_id, "content": "total", "pages": [page], "paragraphs": [], "tables": []})
+        return type("Poller", (), {"result": lambda self: result})()
+
+
+def test_pdf_is_sent_unchanged(monkeypatch):
+    client = _FakeClient()
+    monkeypatch.setattr(azure_ocr, "get_document_analysis_client", lambda endpoint, key: client)
+    pdf = b"%PDF-1.7\n%fake\n"
+    azure_ocr.azure_analyze_document(pdf, "prebuilt-read", use_cache=False)
+    assert client.documents == [pdf]
+
+
+def test_downscaled_page_polygons_map_back_to_original_pixels(monkeypatch):
+    client = _FakeClient()
+    monkeypatch.setattr(azure_ocr, "get_document_analysis_client", lambda endpoint, key: client)
+    result = azure_ocr.azure_analyze_document(_png(20000, 100), "prebuilt-read", use_cache=False)
+    sent_width = Image.open(io.BytesIO(client.documents[0])).width
+    assert sent_width == 10000
+    page = result.pages[0]
+    assert (page.width, page.height) == (20000, 100)
+    assert page.words[0].polygon[0].x == 200
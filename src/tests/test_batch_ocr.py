@@ -0,0 +1,90 @@
+import concurrent.futures
+import threading
+import time
+
+import batch_ocr
+import metrics
+
+
+def _ocr(image_data):
+    return {"text": image_data}
+
+
+def _postprocess(response, image_data):
+    return response["text"].upper()
+
+
+def test_small_batches_postprocess_on_the_shared_thread_pool():
+    items = list(batch_ocr.run_batch(["a", "b"], _ocr, _postprocess))
+    assert sorted(item["result"] for item in items) == ["A", "B"]
+    assert isinstance(batch_ocr._executors[("thread", 2)], concurrent.futures.ThreadPoolExecutor)
+    assert ("process", 2) not in batch_ocr._executors
+
+
+def test_large_batches_reuse_one_process_pool():
+    images = [str(index) for index in range(batch_ocr.SMALL_BATCH_ITEMS + 3)]
+    first = list(batch_ocr.run_batch(iter(images), _ocr, _postprocess))
+    executor = batch_ocr._executors[("process", 2)]
+    second = list(batch_ocr.run_batch(images, _ocr, _postprocess))
+    assert batch_ocr._executors[("process", 2)] is executor
+    assert sorted(item["index"] for item in first) == sorted(item["index"] for item in second) == list(range(len(images)))
+    assert all(item["error"] is None for item in first + second)
+
+
+def test_caller_executor_is_used_and_left_running():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        items = list(batch_ocr.run_batch(["a"] * 10, _ocr, _postprocess, postprocess_executor=executor))
+        assert [item["result"] for item in items] == ["A"] * 10
+        assert executor.submit(len, "ok").result() == 2
+
+
+def _postprocess_with_span(response, image_data):
+    with metrics.span("postprocess", "test-provider"):
+        return _postprocess(response, image_data)
+
+
+def _stage_count(stage: str, provider: str) -> int:
+    histograms = metrics.registry.snapshot()["histograms"]
+    return sum(h["count"] for h in histograms if h["labels"] == {"stage": stage, "provider": provider})
+
+
+def test_process_pool_spans_reach_the_parent_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", True)
+    metrics.registry.reset()
+    images = [str(index) for index in range(batch_ocr.SMALL_BATCH_ITEMS + 3)]
+    items = list(batch_ocr.run_batch(images, _ocr, _postprocess_with_span))
+    assert all(item["error"] is None for item in items)
+    assert _stage_count("postprocess", "test-provider") == len(images)
+    metrics.registry.reset()
+
+
+def test_process_pool_workers_do_not_inherit_held_locks():
+    batch_ocr.shutdown_postprocess_executors()
+    executor = batch_ocr.get_postprocess_executor("process", 1)
+    assert executor._mp_context.get_start_method() == "spawn"
+
+    # an OCR thread holds the registry lock while the first worker starts; a forked worker would
+    # copy the lock held and hang in drain()
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_registry_lock():
+        with metrics.registry._lock:
+            locked.set()
+            release.wait(10)
+
+    holder = threading.Thread(target=hold_registry_lock)
+    holder.start()
+    locked.wait(10)
+    try:
+        future = executor.submit(batch_ocr._postprocess_in_process, _postprocess_with_span, True, {"text": "a"}, None)
+        time.sleep(0.5)
+    finally:
+        release.set()
+        holder.join()
+    result, error, records = future.result(timeout=60)
+    assert (result, error) == ("A", None)
+    assert records[1]
+
+
+def teardown_module():
+    batch_ocr.shutdown_postprocess_executors()
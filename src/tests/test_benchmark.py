@@ -0,0 +1,21 @@
+from benchmark import compare_results
+
+
+def _case(min_ms, spread_ms=0.0, reference_ms=1.0):
+    return {"min_ms": min_ms, "median_ms": min_ms + spread_ms, "spread_ms": spread_ms, "reference_ms": reference_ms}
+
+
+def test_machine_slowdown_is_discounted():
+    baseline = {"cases": {"case": _case(10.0, reference_ms=1.0)}}
+    # everything, the reference workload included, ran twice as slow
+    assert compare_results({"cases": {"case": _case(20.0, reference_ms=2.0)}}, baseline) == []
+    regressions = compare_results({"cases": {"case": _case(30.0, reference_ms=2.0)}}, baseline)
+    assert [regression["case"] for regression in regressions] == ["case"]
+    assert regressions[0]["baseline_ms"] == 20.0
+
+
+def test_slowdowns_within_the_noise_are_ignored():
+    baseline = {"cases": {"fast": _case(0.02), "noisy": _case(10.0, spread_ms=2.0)}}
+    current = {"cases": {"fast": _case(0.05), "noisy": _case(15.0, spread_ms=2.0)}}
+    assert compare_results(current, baseline) == []
+    assert [regression["case"] for regression in compare_results({"cases": {"noisy": _case(17.0, spread_ms=2.0)}}, baseline)] == ["noisy"]
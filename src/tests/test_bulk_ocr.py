@@ -0,0 +1,76 @@
+import io
+import os
+import shutil
+
+import pytest
+
+import bulk_ocr
+from fake_providers import ReplayProvider
+from ocr_frontend import aws_provider
+from result_io import NDJSONReader
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE = os.path.join(os.path.dirname(SRC_DIR), "images", "test-1.png")
+
+
+def test_failed_extraction_is_retried_without_repeating_ocr(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for name in ("a.png", "b.png"):
+        shutil.copy(IMAGE, docs / name)
+    replay = ReplayProvider(os.path.join(SRC_DIR, "results", "aws-original-textract-without-table.json"))
+    provider = aws_provider(ocr=replay)
+    output = str(tmp_path / "results.ndjson.gz")
+    attempts = []
+
+    def flaky_extract(text):
+        attempts.append(text)
+        if len(attempts) == 1:
+            raise RuntimeError("completion timed out")
+        return {"chars": len(text)}
+
+    documents = list(bulk_ocr.iter_documents(str(docs)))
+    first = bulk_ocr.run_bulk(documents, output, provider, extract=flaky_extract, workers=1, log=io.StringIO())
+    assert (first["done"], first["failed"], replay.calls) == (2, 1, 2)
+    assert os.path.exists(str(tmp_path / "results.ocr.ndjson.gz"))
+
+    second = bulk_ocr.run_bulk(documents, output, provider, extract=flaky_extract, workers=1, log=io.StringIO())
+    assert (second["skipped"], second["done"], second["failed"]) == (1, 1, 0)
+    assert replay.calls == 2
+    with NDJSONReader(output) as reader:
+        assert sorted(reader.ids()) == ["a.png", "b.png"]
+        assert all(reader[doc_id]["extraction"]["chars"] > 0 for doc_id in reader.ids())
+
+
+class _ClosingProvider:
+    def __init__(self, provider):
+        self.provider = provider
+        self.pages = []
+        self.closed = False
+
+    def __call__(self, image_data):
+        self.pages.append(image_data)
+        return self.provider(image_data)
+
+    def close(self):
+        self.closed = True
+
+
+def test_cli_sends_file_bytes_and_closes_the_provider(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    shutil.copy(IMAGE, docs / "a.png")
+    provider = _ClosingProvider(aws_provider(ocr=ReplayProvider(os.path.join(SRC_DIR, "results", "aws-original-textract-without-table.json"))))
+    monkeypatch.setattr(bulk_ocr, "make_provider", lambda name, use_extract_table=False: provider)
+
+    assert bulk_ocr.main([str(docs), "--output", str(tmp_path / "results.ndjson"), "--provider", "hedged"]) == 0
+    with open(IMAGE, "rb") as reader:
+        # the bytes a direct aws_textract_image call would send, and be cached under
+        assert provider.pages == [reader.read()]
+    assert provider.closed
+
+    provider.closed = False
+    monkeypatch.setattr(bulk_ocr, "run_bulk", lambda *args, **kwargs: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        bulk_ocr.main([str(docs), "--output", str(tmp_path / "results.ndjson")])
+    assert provider.closed
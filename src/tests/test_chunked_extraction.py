@@ -0,0 +1,52 @@
+import aws_ocr
+from azure_openai import build_plaintext_request
+from chunked_extraction import chunk_blocks, estimate_text_tokens, layout_blocks
+from ocr_frontend import normalize_result
+
+# gpt-35-turbo-16k context window; build_plaintext_request asks for max_tokens=4096 of it
+GPT35TURBO_CONTEXT_TOKENS = 16384
+
+
+def test_textract_tables_are_not_sent_twice(textract_response, page_size):
+    result = aws_ocr.get_aws_textract_result(textract_response, *page_size, use_extract_table=True)
+    assert result["tables"]
+    lines = [line for line in result["format_text"].split("\n") if line.strip()]
+    assert layout_blocks(result) == lines
+    assert layout_blocks(normalize_result(result, "aws-textract")) == lines
+
+
+def test_azure_tables_are_appended():
+    table = {"id": "Table 1", "rows": {"0": ["Item", "Qty"], "1": ["Pen", "2"]}, "scores": {}, "merged_cells": {}, "polygon": {}, "row_count": 2, "column_count": 2}
+    result = {"format_text": "Invoice\n", "tables": [table]}
+    assert layout_blocks(result) == ["Invoice", "Item | Qty\nPen | 2"]
+    assert layout_blocks(normalize_result(result, "azure-formrecognizer")) == ["Invoice", "Item | Qty\nPen | 2"]
+    assert layout_blocks(result, include_tables=False) == ["Invoice"]
+
+
+def _thai_pages(recorded, count: int):
+    # the recorded Azure page is about 44% Thai characters
+    text = recorded("azure-textract-with-table.json")["format_text"]
+    return layout_blocks(text * count)
+
+
+def _prompt_text(request: dict) -> str:
+    return request["json"]["messages"][0]["content"][0]["text"]
+
+
+def test_thai_characters_count_as_one_token_each():
+    assert estimate_text_tokens("ใบเสนอราคา") == 10
+    assert estimate_text_tokens("Quotation") == 3
+    assert estimate_text_tokens("Quotation/ใบเสนอราคา") == 14
+
+
+def test_thai_chunks_fit_the_model_context(recorded):
+    chunks = chunk_blocks(_thai_pages(recorded, 100))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        request = build_plaintext_request(chunk)
+        prompt = _prompt_text(request)
+        non_ascii = sum(1 for character in prompt if ord(character) > 127)
+        # pessimistic: a token per Thai character and per 2 ASCII characters
+        worst_case_tokens = non_ascii + (len(prompt) - non_ascii) / 2
+        assert worst_case_tokens + request["json"]["max_tokens"] <= GPT35TURBO_CONTEXT_TOKENS
+
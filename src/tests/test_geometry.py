@@ -0,0 +1,67 @@
+"""``geometry`` indexes against the per-word and per-polygon loops they replaced.
+
+The recorded Textract responses in ``src/results`` are replayed and compared with the
+processed results recorded next to them, which the loop implementation produced.
+"""
+import json
+import random
+
+import pytest
+
+import aws_ocr
+import azure_ocr
+from geometry import PolygonIndex, WordBoxIndex
+
+
+def _json(value):
+    return json.loads(json.dumps(value, ensure_ascii=False))
+
+
+@pytest.mark.parametrize("name, use_extract_table", [("with-table", True), ("without-table", False)])
+def test_textract_replay_matches_recorded_output(recorded, page_size, name, use_extract_table):
+    response = recorded(f"aws-original-textract-{name}.json")
+    expected = recorded(f"aws-textract-{name}.json")
+
+    assert _json(aws_ocr.get_aws_textract_result(response, *page_size, use_extract_table=use_extract_table)) == expected
+    columns = aws_ocr.get_aws_textract_result(response, *page_size, use_extract_table=use_extract_table, as_columns=True)
+    assert _json({**columns, "text_annotations": columns["text_annotations"].to_list()}) == expected
+    if use_extract_table:
+        # the __main__ path: tables from the words already returned
+        words = aws_ocr.get_aws_textannotations_formatedtext(response, *page_size)["text_annotations"]
+        assert _json(aws_ocr.get_data_table(response, words=words, page_width=page_size[0], page_height=page_size[1])) == expected["tables"]
+
+
+def test_word_box_index_matches_brute_force(random_words):
+    rng = random.Random(11)
+    for _ in range(200):
+        words = random_words(rng, rng.randrange(0, 60), size=60)
+        index = WordBoxIndex(words)
+        left, top = rng.randrange(60), rng.randrange(60)
+        right, bottom = left + rng.randrange(0, 40), top + rng.randrange(0, 40)
+        rect = [(left, top), (right, top), (right, bottom), (left, bottom)]
+        expected = [word for word in words if aws_ocr.is_inside(A=rect, B=aws_ocr.word_bbox_coordinates(word))]
+        assert index.words_inside(rect) == expected
+
+
+def _loop_contains_any(polygons, points):
+    """``azure_ocr.is_within_table`` as it was before PolygonIndex."""
+    return any(azure_ocr.is_point_inside_polygon(point, polygon) for polygon in polygons for point in points)
+
+
+def test_polygon_index_matches_ray_casting_on_recorded_tables(recorded):
+    result = recorded("azure-textract-with-table.json")
+    polygons = [[tuple(point) for point in cell[0]] for table in result["tables"] for cells in table["polygon"].values() for cell in cells]
+    index = PolygonIndex(polygons)
+    for word in result["text_annotations"]:
+        bbox = word["bbox"]
+        points = [(bbox["l"], bbox["t"]), (bbox["r"], bbox["t"]), (bbox["r"], bbox["b"]), (bbox["l"], bbox["b"])]
+        assert index.contains_any(points) == _loop_contains_any(polygons, points)
+
+
+def test_polygon_index_matches_ray_casting_on_random_polygons():
+    rng = random.Random(3)
+    for _ in range(300):
+        # a small grid puts many points exactly on edges and vertices
+        polygons = [[(rng.randrange(12), rng.randrange(12)) for _ in range(rng.randrange(3, 7))] for _ in range(rng.randrange(1, 4))]
+        points = [(rng.randrange(12), rng.randrange(12)) for _ in range(4)]
+        assert PolygonIndex(polygons).contains_any(points) == _loop_contains_any(polygons, points)
@@ -0,0 +1,52 @@
+import io
+import os
+
+from PIL import Image
+
+from ingestion import iter_pages, merge_page_results
+from ocr_cache import make_ocr_cache_key
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "images")
+
+
+def _tiff(pages: int) -> bytes:
+    frames = [Image.new("RGB", (40 + page, 30), (page * 60, 0, 0)) for page in range(pages)]
+    data = io.BytesIO()
+    frames[0].save(data, "TIFF", save_all=True, append_images=frames[1:])
+    return data.getvalue()
+
+
+def test_single_page_images_pass_through_unchanged():
+    for name in ("test-1.png", "test-2.jpg"):
+        path = os.path.join(IMAGES_DIR, name)
+        with open(path, "rb") as reader:
+            data = reader.read()
+        assert list(iter_pages(path)) == [data]
+        assert list(iter_pages(data)) == [data]
+        # a page OCRed through a document hits the cache entry of a direct call on the file
+        assert make_ocr_cache_key(next(iter_pages(path)), "aws-textract", "detect_document_text") == make_ocr_cache_key(data, "aws-textract", "detect_document_text")
+
+        assert list(iter_pages(io.BytesIO(data))) == [data]
+
+
+def test_multi_page_tiffs_are_split_into_png_pages():
+    pages = list(iter_pages(_tiff(3)))
+    assert len(pages) == 3
+    sizes = []
+    for page in pages:
+        with Image.open(io.BytesIO(page)) as image:
+            assert image.format == "PNG"
+            sizes.append(image.size)
+    assert sizes == [(40, 30), (41, 30), (42, 30)]
+
+
+def test_merge_page_results_orders_pages_and_errors():
+    items = [
+        {"index": 1, "result": {"format_text": "b\n"}, "error": None, "stage": "postprocess"},
+        {"index": 2, "result": None, "error": ValueError("bad page"), "stage": "ocr"},
+        {"index": 0, "result": {"format_text": "a\n"}, "error": None, "stage": "postprocess"},
+    ]
+    merged = merge_page_results(items)
+    assert merged["page_count"] == 3
+    assert merged["format_text"] == "a\nb\n"
+    assert [error["page_index"] for error in merged["errors"]] == [2]
@@ -0,0 +1,80 @@
+import copy
+
+import pytest
+
+import azure_openai
+import llm_cache
+from fake_providers import StubChatCompletionsServer
+from llm_cache import LLMResponseCache, make_llm_cache_key
+
+COMPLETION = {"choices": [{"index": 0, "message": {"role": "assistant", "content": '{"total": "1,070"}'}, "finish_reason": "stop"}]}
+
+
+def _request(**payload) -> dict:
+    return {
+        "url": "https://example.openai.azure.com/openai/deployments/gpt-35-turbo-16k/chat/completions",
+        "params": {"api-version": "2024-02-15-preview"},
+        "headers": {"api-key": "first"},
+        "json": {"messages": [{"role": "user", "content": "ใบแจ้งหนี้ total?"}], "temperature": 0, "max_tokens": 4096, **payload},
+    }
+
+
+class _Send:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return copy.deepcopy(self.responses[min(self.calls, len(self.responses)) - 1])
+
+
+def test_equivalent_requests_share_a_key():
+    request = _request()
+    key = make_llm_cache_key(request)
+    reordered = {"json": dict(reversed(list(request["json"].items()))), "headers": {"api-key": "second"}, "params": request["params"], "url": request["url"]}
+    assert make_llm_cache_key(reordered) == key
+    assert make_llm_cache_key(_request(temperature=0.0)) == key
+    assert make_llm_cache_key({**request, "params": None}) == make_llm_cache_key({**request, "params": {}})
+
+    assert make_llm_cache_key(_request(max_tokens=1024)) != key
+    assert make_llm_cache_key({**request, "params": {"api-version": "2023-05-15"}}) != key
+    assert make_llm_cache_key(_request(messages=[{"role": "user", "content": "ใบแจ้งหนี้ total"}])) != key
+
+
+def test_only_completions_are_stored():
+    cache = LLMResponseCache(memory_items=8)
+    send = _Send({"error": {"code": "429"}}, {"choices": []}, COMPLETION)
+    assert cache.get_or_request("gpt-35-turbo-16k", _request(), send) == {"error": {"code": "429"}}
+    assert cache.get_or_request("gpt-35-turbo-16k", _request(), send) == {"choices": []}
+    assert cache.get_or_request("gpt-35-turbo-16k", _request(), send) == COMPLETION
+    assert cache.get_or_request("gpt-35-turbo-16k", _request(temperature=0.0), send) == COMPLETION
+    assert send.calls == 3
+    assert cache.engine_stats() == {"gpt-35-turbo-16k": {"hits": 1, "misses": 3, "hit_rate": 0.25}}
+
+
+def test_sampled_and_streamed_requests_bypass_the_cache():
+    cache = LLMResponseCache(memory_items=8)
+    for request in (_request(temperature=0.7), _request(stream=True), {**_request(), "json": {"messages": []}}):
+        send = _Send(COMPLETION)
+        cache.get_or_request("gpt-35-turbo-16k", request, send)
+        cache.get_or_request("gpt-35-turbo-16k", request, send)
+        assert send.calls == 2
+    assert cache.stats()["writes"] == 0 and cache.engine_stats() == {}
+
+
+def test_repeated_extraction_is_sent_once(monkeypatch):
+    monkeypatch.setattr(llm_cache, "_llm_cache", LLMResponseCache(memory_items=8))
+    monkeypatch.setattr(azure_openai, "LLM_MAX_ATTEMPTS", 1)
+    with StubChatCompletionsServer(['{"total": "1,070"}'], throttled_requests=1) as stub:
+        monkeypatch.setenv("OPENAI_API_BASE", stub.base_url)
+        monkeypatch.setenv("OPENAI_API_VERSION", "2024-02-15-preview")
+        # the throttled answer is returned but not kept
+        assert "choices" not in azure_openai.extract_data_from_plaintext("Total 1,070")
+        first = azure_openai.extract_data_from_plaintext("Total 1,070")
+        monkeypatch.setenv("OPENAI_API_KEY", "rotated")
+        assert azure_openai.extract_data_from_plaintext("Total 1,070") == first
+        assert first["choices"][0]["message"]["content"] == '{"total": "1,070"}'
+        assert len(stub.requests) == 2
+        azure_openai.extract_data_from_plaintext("Total 1,070", use_cache=False)
+        assert len(stub.requests) == 3
@@ -0,0 +1,15 @@
+from llm_stream import stream_json_fields
+
+
+def test_malformed_scalar_finishes_with_empty_result():
+    events = list(stream_json_fields(['{"name": "Acme", "total": 12', ".5.1, ", '"date": "2024-01-01"}']))
+    assert [event["type"] for event in events] == ["field", "done"]
+    assert events[0]["field"] == "name"
+    assert events[-1]["result"] is None
+    assert events[-1]["content"].endswith('"2024-01-01"}')
+
+
+def test_complete_object_streams_every_field():
+    events = list(stream_json_fields(['```json\n{"name": "Ac', 'me", "total": 12.5, "items": [1, 2]}\n```']))
+    assert [(event["field"], event["value"]) for event in events[:-1]] == [("name", "Acme"), ("total", 12.5), ("items", [1, 2])]
+    assert events[-1]["result"] == {"name": "Acme", "total": 12.5, "items": [1, 2]}
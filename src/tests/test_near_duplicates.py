@@ -0,0 +1,108 @@
+import io
+import os
+import random
+
+import pytest
+from PIL import Image
+
+import near_duplicates
+import ocr_cache
+from fake_providers import synthetic_analyze_result, synthetic_page_layout
+from near_duplicates import MultiIndexHash, NearDuplicateIndex, page_hash, rescale_analyze_result, reuse_near_duplicate
+from ocr_cache import OCRResultCache, make_ocr_cache_key
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "images")
+
+
+def _distance(first, second) -> int:
+    return bin(first.value ^ second.value).count("1")
+
+
+def _rescan(image: Image.Image, angle: float = 1.0, scale: float = 1.3, quality: int = 60) -> bytes:
+    scanned = image.convert("RGB").rotate(angle, resample=Image.BICUBIC, fillcolor="white").resize((int(image.width * scale), int(image.height * scale)))
+    data = io.BytesIO()
+    scanned.save(data, "JPEG", quality=quality)
+    return data.getvalue()
+
+
+@pytest.fixture
+def near_duplicate_index(monkeypatch):
+    """A fresh process-wide index over a fresh in-memory OCR cache."""
+    monkeypatch.setenv("NEAR_DUPLICATE_ENABLED", "1")
+    index = NearDuplicateIndex(max_distance=6)
+    monkeypatch.setattr(near_duplicates, "_index", index)
+    monkeypatch.setattr(ocr_cache, "_ocr_cache", OCRResultCache(memory_items=16))
+    return index
+
+
+def test_rescans_hash_close_and_other_pages_far():
+    page = Image.open(os.path.join(IMAGES_DIR, "test-1.png"))
+    original = page_hash(page)
+    for angle in (0.5, 1.0, 2.0):
+        rescan = page_hash(_rescan(page, angle=angle))
+        assert _distance(original, rescan) <= 6
+        assert (rescan.width, rescan.height) == (int(page.width * 1.3), int(page.height * 1.3))
+    others = [page_hash(open(os.path.join(IMAGES_DIR, name), "rb").read()) for name in sorted(os.listdir(IMAGES_DIR)) if name != "test-1.png"]
+    assert min(_distance(original, other) for other in others) >= 20
+
+
+def test_multi_index_search_matches_brute_force():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(3000)]
+    # near neighbours of a few values, so every radius has hits
+    values += [value ^ sum(1 << bit for bit in rng.sample(range(64), rng.randrange(1, 12))) for value in values[:300]]
+    hashes = MultiIndexHash()
+    for value in values:
+        hashes.add(value)
+
+    for query in values[:50] + [rng.getrandbits(64) for _ in range(50)]:
+        for max_distance in (0, 3, 6, 10):
+            expected = sorted((bin(query ^ value).count("1"), position) for position, value in enumerate(values) if bin(query ^ value).count("1") <= max_distance)
+            found = hashes.search(query, max_distance)
+            assert sorted((distance, position) for position, distance in found) == expected
+            assert [distance for _, distance in found] == sorted(distance for _, distance in found)
+
+
+def test_reused_azure_result_is_rescaled_to_the_rescan(near_duplicate_index):
+    page = Image.open(os.path.join(IMAGES_DIR, "test-1.png"))
+    first = open(os.path.join(IMAGES_DIR, "test-1.png"), "rb").read()
+    rescan = _rescan(page, scale=2.0)
+    layout = synthetic_page_layout(40, table_cells=6)
+    analyze_result = synthetic_analyze_result(layout)
+    analyze_result["pages"][0]["width"], analyze_result["pages"][0]["height"] = page.size
+    calls = []
+
+    def ocr(image_data):
+        key = make_ocr_cache_key(image_data, "azure-formrecognizer", "prebuilt-layout")
+
+        def compute():
+            calls.append(key)
+            return analyze_result
+
+        return ocr_cache.get_ocr_cache().get_or_compute(key, lambda: reuse_near_duplicate(image_data, key, compute, rescale=rescale_analyze_result))
+
+    assert ocr(first) == analyze_result
+    reused = ocr(rescan)
+    assert len(calls) == 1 and near_duplicate_index.stats()["hits"] == 1
+    assert reused["pages"][0]["width"] == pytest.approx(page.width * 2.0) and reused["pages"][0]["height"] == pytest.approx(page.height * 2.0)
+    word, reused_word = analyze_result["pages"][0]["words"][0], reused["pages"][0]["words"][0]
+    assert [(point["x"] * 2.0, point["y"] * 2.0) for point in word["polygon"]] == [(point["x"], point["y"]) for point in reused_word["polygon"]]
+    assert reused["tables"][0]["cells"][0]["bounding_regions"][0]["polygon"][2]["x"] == analyze_result["tables"][0]["cells"][0]["bounding_regions"][0]["polygon"][2]["x"] * 2.0
+
+
+def test_evicted_response_is_computed_again(near_duplicate_index):
+    page = Image.open(os.path.join(IMAGES_DIR, "test-1.png"))
+    first_key = make_ocr_cache_key(b"first", "aws-textract", "detect_document_text")
+    near_duplicate_index.add(first_key, page_hash(page))
+    # the index outlives the cached response it points at
+    rescan = _rescan(page)
+    rescan_key = make_ocr_cache_key(rescan, "aws-textract", "detect_document_text")
+
+    response = reuse_near_duplicate(rescan, rescan_key, lambda: {"Blocks": ["computed"]})
+    assert response == {"Blocks": ["computed"]}
+    assert near_duplicate_index.stats()["hits"] == 0 and near_duplicate_index.stats()["stale"] == 1
+    assert near_duplicate_index.lookup(page_hash(page), key_prefix="aws-textract:detect_document_text:").key == rescan_key
+
+    # once the new response is cached, the next rescan reuses it
+    ocr_cache.get_ocr_cache().set(rescan_key, response)
+    assert reuse_near_duplicate(_rescan(page, angle=0.5), "aws-textract:detect_document_text:other", lambda: pytest.fail("computed a cached page")) == response
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+import ocr_cache
+from ocr_cache import OCRResultCache, make_ocr_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """``clock.now`` is what the cache sees as ``time.time()``."""
+
+    class Clock:
+        now = 1_700_000_000.0
+
+    monkeypatch.setattr(ocr_cache.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def _response(seed: int, words: int = 50) -> dict:
+    rng = random.Random(seed)
+    return {"Blocks": [{"BlockType": "WORD", "Text": "".join(rng.choice("abcdefghijklmnopqrstuvwxyzใบแจ้งหนี้") for _ in range(12))} for _ in range(words)]}
+
+
+def test_hits_misses_and_fresh_copies(tmp_path, clock):
+    path = str(tmp_path / "ocr.sqlite3")
+    key = make_ocr_cache_key(b"page", "aws-textract", "detect_document_text")
+    assert key != make_ocr_cache_key(b"page", "aws-textract", "analyze_document-tables")
+    cache = OCRResultCache(path)
+    assert cache.get(key) is None
+    cache.set(key, _response(0))
+
+    hit = cache.get(key)
+    assert hit == _response(0)
+    hit["Blocks"].clear()
+    assert cache.get(key) == _response(0)
+
+    # a new process finds it on disk and keeps it in memory from then on
+    reopened = OCRResultCache(path)
+    assert reopened.get(key) == _response(0) and reopened.get(key) == _response(0)
+    assert (reopened.stats()["disk_hits"], reopened.stats()["memory_hits"]) == (1, 1)
+    assert cache.stats()["misses"] == 1 and cache.stats()["hit_rate"] == pytest.approx(2 / 3)
+
+
+def test_memory_hits_expire_with_the_ttl(clock):
+    cache = OCRResultCache(memory_items=8, ttl_seconds=60)
+    cache.set("key", _response(0))
+    clock.now += 60
+    assert cache.get("key") == _response(0)
+    clock.now += 1
+    assert cache.get("key") is None
+    assert cache.stats()["evictions"] == 1 and cache.stats()["memory_items"] == 0
+
+
+def test_entries_read_from_disk_keep_their_age(tmp_path, clock):
+    path = str(tmp_path / "ocr.sqlite3")
+    OCRResultCache(path, ttl_seconds=60).set("key", _response(0))
+    clock.now += 50
+    cache = OCRResultCache(path, ttl_seconds=60)
+    assert cache.get("key") == _response(0)
+    # 61s after it was written, not 11s after it was read back
+    clock.now += 11
+    assert cache.get("key") is None
+    assert cache.stats()["evictions"] == 1 and cache.stats()["disk_items"] == 0
+
+
+def test_size_eviction(tmp_path, clock):
+    memory = OCRResultCache(memory_items=2)
+    for key in ("a", "b", "c"):
+        memory.set(key, _response(0))
+    assert memory.get("a") is None and memory.get("c") is not None
+
+    cache = OCRResultCache(str(tmp_path / "ocr.sqlite3"), memory_items=0)
+    cache.set("a", _response(1))
+    entry_bytes = cache.stats()["disk_bytes"]
+    cache.max_bytes = int(entry_bytes * 2.5)
+    clock.now += 1
+    cache.set("b", _response(2))
+    clock.now += 1
+    assert cache.get("a") == _response(1)
+    clock.now += 1
+    cache.set("c", _response(3))
+    # "b" was the least recently used
+    assert [cache.get(key) is not None for key in ("a", "b", "c")] == [True, False, True]
+    assert cache.stats()["evictions"] == 1 and cache.stats()["disk_bytes"] <= cache.max_bytes
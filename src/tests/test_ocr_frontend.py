@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+import aws_ocr
+import azure_ocr
+from fake_providers import synthetic_analyze_result, synthetic_page_layout, synthetic_textract_response
+from ocr_frontend import HedgedOCR, normalize_result
+
+
+def _provider(launches, name, delay, fail=False):
+    def run(image_data):
+        launches[name] = time.perf_counter()
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(name)
+        return {"text_annotations": [], "format_text": name}
+
+    return run
+
+
+def test_hedge_wait_is_not_restarted_by_a_failed_hedge():
+    launches = {}
+    hedged = HedgedOCR(
+        [("slow", _provider(launches, "slow", 1.0)), ("failing", _provider(launches, "failing", 0.1, fail=True)), ("third", _provider(launches, "third", 0.0))],
+        hedge_delay=0.2,
+    )
+    started = time.perf_counter()
+    result = hedged(b"page")
+    hedged.close()
+    assert result["format_text"] == "third"
+    # the third provider is due 0.2s after the failing one launched, not 0.2s after it failed
+    assert launches["third"] - launches["failing"] < 0.2 + 0.04
+    assert launches["failing"] - started < 0.2 + 0.04
+
+
+def _schema(value):
+    """Key and type structure of a normalized result, with one entry standing for each list or mapping's items."""
+    if isinstance(value, dict):
+        return {key if isinstance(key, str) else type(key).__name__: _schema(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, *{repr(_schema(item)): _schema(item) for item in value}.values())
+    return type(value).__name__
+
+
+def test_providers_share_one_schema():
+    layout = synthetic_page_layout(60, table_cells=12)
+    response = synthetic_textract_response(layout)
+    analyze_result = synthetic_analyze_result(layout)
+    # a merged cell, and a word whose polygon starts at its bottom-right corner as on a page scanned upside down
+    analyze_result["tables"][0]["cells"][6]["column_span"] = 2
+    polygon = analyze_result["pages"][0]["words"][-1]["polygon"]
+    polygon[:] = polygon[2:] + polygon[:2]
+    for block in response["Blocks"]:
+        if block["BlockType"] == "TABLE":
+            block["Relationships"].append({"Type": "MERGED_CELL", "Ids": ["merged"]})
+    response["Blocks"].append({"BlockType": "MERGED_CELL", "Id": "merged", "RowIndex": 2, "ColumnIndex": 1, "RowSpan": 1, "ColumnSpan": 2, "Relationships": []})
+
+    for as_columns in (False, True):
+        aws = normalize_result(aws_ocr.get_aws_textract_result(response, layout["width"], layout["height"], use_extract_table=True, as_columns=as_columns), "aws-textract", as_columns=as_columns)
+        azure = normalize_result(azure_ocr._postprocess_analyze_result(analyze_result, as_columns=as_columns), "azure-formrecognizer", as_columns=as_columns)
+        if as_columns:
+            assert [column.dtype for column in (azure["text_annotations"].left, azure["text_annotations"].bottom)] == [aws["text_annotations"].left.dtype] * 2
+            aws["text_annotations"], azure["text_annotations"] = aws["text_annotations"].to_list(), azure["text_annotations"].to_list()
+        assert _schema({**aws, "provider": ""}) == _schema({**azure, "provider": ""})
+
+        aws_table, azure_table = aws["tables"][0], azure["tables"][0]
+        assert list(azure_table["rows"]) == list(aws_table["rows"]) == [1, 2]
+        assert azure_table["merged_cells"] == aws_table["merged_cells"] == {2: {1: {"row_span": 1, "column_span": 2}}}
+        assert [len(scores) for scores in azure_table["scores"].values()] == [len(cells) for cells in azure_table["rows"].values()]
+        assert azure_table["scores"][1][0] == pytest.approx(99.0)
+
+        for aws_word, azure_word in zip(aws["text_annotations"], azure["text_annotations"]):
+            assert aws_word["text"] == azure_word["text"]
+            for word in (aws_word, azure_word):
+                bbox = word["bbox"]
+                assert bbox["pt1"] == (bbox["l"], bbox["t"]) and bbox["pt2"] == (bbox["r"], bbox["b"])
+            # Textract's relative geometry comes back a pixel short at most
+            assert all(abs(aws_word["bbox"][key] - azure_word["bbox"][key]) <= 1 for key in ("l", "t", "r", "b"))
+        assert len(aws["text_annotations"]) == len(azure["text_annotations"])
@@ -0,0 +1,105 @@
+import multiprocessing
+import time
+
+import pytest
+import requests
+
+import azure_openai
+import clients
+import rate_limit
+from fake_providers import StubChatCompletionsServer
+from rate_limit import AdaptiveRateLimiter, _FileBackend
+
+
+@pytest.fixture
+def fresh_limiters(monkeypatch):
+    for name in ("TEXTRACT_MAX_TPS", "FORMRECOGNIZER_MAX_TPS", "OPENAI_MAX_RPM", "OPENAI_MAX_TPM", "RATE_LIMIT_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+
+
+def _plaintext_request(base_url: str, stream: bool = False) -> dict:
+    return {**azure_openai.build_plaintext_request("text", stream=stream), "url": base_url + "/deployments/gpt-35-turbo-16k/chat/completions"}
+
+
+def test_limiters_are_off_until_a_quota_is_configured(fresh_limiters):
+    assert all(rate_limit.get_rate_limiter(kind) is None for kind in rate_limit.rate_limits())
+    with StubChatCompletionsServer(['{"a": 1}']) as stub:
+        started = time.perf_counter()
+        with azure_openai._post("gpt-35-turbo-16k", _plaintext_request(stub.base_url, stream=True), stream=True) as response:
+            assert response.status_code == 200
+        assert time.perf_counter() - started < 0.5
+
+
+def test_throttling_halves_the_rate_and_successes_win_it_back(fresh_limiters, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_RPM", "6000")
+    with StubChatCompletionsServer(['{"a": 1}'], throttled_requests=2, retry_after=0.05) as stub:
+        request = _plaintext_request(stub.base_url)
+        response = azure_openai._post("gpt-35-turbo-16k", request)
+        assert response.status_code == 200
+        assert len(stub.requests) == 3
+        # every retry waited out the Retry-After
+        assert stub.requests[2]["time"] - stub.requests[0]["time"] >= 0.1
+
+        limiter = rate_limit.get_rate_limiter("openai-requests", "gpt-35-turbo-16k")
+        # both 429s fell within one cooldown, so the rate was halved once, then one success added 5%
+        assert limiter.state()["rate"] == pytest.approx(100 * (rate_limit.RATE_DECREASE + rate_limit.RATE_INCREASE))
+        for _ in range(9):
+            azure_openai._post("gpt-35-turbo-16k", request)
+        assert limiter.state()["rate"] == pytest.approx(100)
+
+
+def test_pooled_adapter_charges_posts_only(fresh_limiters):
+    class CountingLimiter:
+        acquired = 0
+
+        def acquire(self, cost=1.0):
+            self.acquired += 1
+
+        def on_success(self):
+            pass
+
+        def on_throttle(self, retry_after=None):
+            pass
+
+    limiter = CountingLimiter()
+    session = requests.Session()
+    session.mount("http://", clients.PooledHTTPAdapter("formrecognizer", rate_limiter=limiter))
+    with StubChatCompletionsServer(['{"a": 1}']) as stub:
+        session.post(stub.base_url + "/documentModels/prebuilt-read:analyze", json={})
+        # long-running-operation polls; the stub answers GETs with 501
+        session.get(stub.base_url + "/documentModels/prebuilt-read/analyzeResults/1")
+        session.get(stub.base_url + "/documentModels/prebuilt-read/analyzeResults/1")
+    assert limiter.acquired == 1
+
+
+def _acquire_from_file(path: str, count: int):
+    limiter = AdaptiveRateLimiter("shared", 50.0, burst_seconds=0.02, backend=_FileBackend(path))
+    for _ in range(count):
+        limiter.acquire()
+
+
+def _throttle_from_file(path: str):
+    AdaptiveRateLimiter("shared", 50.0, backend=_FileBackend(path)).on_throttle(retry_after=30.0)
+
+
+def test_file_backend_shares_one_bucket_across_processes(tmp_path):
+    path = str(tmp_path / "shared.bucket")
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_acquire_from_file, args=(path, 10)) for _ in range(3)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    elapsed = time.perf_counter() - started
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+    # 30 units through one bucket of 1 at 50 per second; separate buckets would take a third
+    assert elapsed >= 29 / 50
+
+    process = context.Process(target=_throttle_from_file, args=(path,))
+    process.start()
+    process.join(30)
+    state = AdaptiveRateLimiter("shared", 50.0, backend=_FileBackend(path)).state()
+    assert state["rate"] == pytest.approx(50.0 * rate_limit.RATE_DECREASE)
+    assert state["blocked_for"] > 20
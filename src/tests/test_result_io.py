@@ -0,0 +1,97 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import result_io
+from result_io import NDJSONReader, NDJSONSink, read_result, write_result
+
+RECORDS = [("a.png", {"format_text": "ใบแจ้งหนี้\n", "pages": [1]}), ("b.png", {"format_text": "Total 1,070\n"}), ("c/d.pdf", {"page_count": 2})]
+
+
+def _write(path: str, records=RECORDS):
+    with NDJSONSink(path) as sink:
+        for doc_id, record in records:
+            sink.write(doc_id, record)
+
+
+def _index(path: str):
+    with open(path + ".idx", "rb") as reader:
+        return [tuple(json.loads(line)) for line in reader]
+
+
+@pytest.mark.parametrize("name", ["results.ndjson", "results.ndjson.gz"])
+def test_interrupted_record_is_dropped_on_reopen(tmp_path, name):
+    path = str(tmp_path / name)
+    _write(path)
+    complete_size = os.path.getsize(path)
+    # a crash in the middle of the next record: part of its bytes on disk, none in the index
+    record = result_io._json_dumps({"id": "lost", "record": {"format_text": "x" * 1000}}) + b"\n"
+    if name.endswith(".gz"):
+        record = gzip.compress(record)
+    with open(path, "ab") as writer:
+        writer.write(record[: len(record) // 2])
+
+    with NDJSONSink(path) as sink:
+        assert len(sink) == 3 and "lost" not in sink and "b.png" in sink
+        assert os.path.getsize(path) == complete_size
+        sink.write("e.png", {"format_text": "after"})
+    with NDJSONReader(path) as reader:
+        assert list(reader) == RECORDS + [("e.png", {"format_text": "after"})]
+
+
+@pytest.mark.parametrize("name", ["results.ndjson", "results.ndjson.gz"])
+def test_index_sidecar_holds_every_record_range(tmp_path, monkeypatch, name):
+    path = str(tmp_path / name)
+    _write(path)
+    index = _index(path)
+    assert [entry[0] for entry in index] == [doc_id for doc_id, _ in RECORDS]
+    assert index[0][1] == 0 and all(previous[1] + previous[2] == entry[1] for previous, entry in zip(index, index[1:]))
+    assert index[-1][1] + index[-1][2] == os.path.getsize(path)
+
+    # an index that covers the file is trusted without scanning the data
+    monkeypatch.setattr(result_io, "_scan_plain", lambda reader: pytest.fail("scanned a file with a current index"))
+    monkeypatch.setattr(result_io, "_scan_gzip", lambda reader: pytest.fail("scanned a file with a current index"))
+    with NDJSONReader(path) as reader:
+        assert reader["c/d.pdf"] == {"page_count": 2} and reader.get("missing") is None
+    monkeypatch.undo()
+
+    # a lost or half-written index is rebuilt from the data
+    with open(path + ".idx", "wb") as writer:
+        writer.write(result_io._json_dumps(list(index[0])) + b"\n" + result_io._json_dumps(list(index[1]))[:5])
+    with NDJSONReader(path) as reader:
+        assert reader["c/d.pdf"] == {"page_count": 2}
+    os.remove(path + ".idx")
+    with NDJSONSink(path):
+        pass
+    assert _index(path) == index
+
+
+def test_gzip_records_are_separate_members(tmp_path):
+    path = str(tmp_path / "results.ndjson.gz")
+    _write(path, RECORDS + [("a.png", {"format_text": "rerun"})])
+    # the whole file still gunzips as NDJSON
+    with gzip.open(path, "rt", encoding="utf-8") as reader:
+        assert [json.loads(line)["id"] for line in reader] == ["a.png", "b.png", "c/d.pdf", "a.png"]
+    for doc_id, offset, length in _index(path):
+        with open(path, "rb") as reader:
+            reader.seek(offset)
+            assert json.loads(gzip.decompress(reader.read(length)))["id"] == doc_id
+    with NDJSONReader(path) as reader:
+        assert len(reader) == 3 and reader["a.png"] == {"format_text": "rerun"}
+
+
+def test_single_results_round_trip(tmp_path):
+    result = {"format_text": "ใบแจ้งหนี้", "text_annotations": [{"bbox": {"pt1": (1, 2), "l": 1}, "text": "x"}]}
+    expected = {"format_text": "ใบแจ้งหนี้", "text_annotations": [{"bbox": {"pt1": [1, 2], "l": 1}, "text": "x"}]}
+    for name in ("page.json", "page.json.gz"):
+        write_result(str(tmp_path / name), result)
+        assert read_result(str(tmp_path / name)) == expected
+    with open(tmp_path / "page.json.gz", "rb") as reader:
+        assert reader.read(2) == b"\x1f\x8b"
+
+    pytest.importorskip("msgpack")
+    for name in ("page.msgpack", "page.msgpack.gz"):
+        write_result(str(tmp_path / name), result)
+        assert read_result(str(tmp_path / name)) == expected
@@ -0,0 +1,44 @@
+import pytest
+
+import aws_ocr
+import check_import_time
+import metrics
+import ocr_cache
+import rate_limit
+import settings
+
+
+def test_modules_import_within_budget():
+    results = check_import_time.check_modules(repeat=2)
+    problems = {result["module"]: result["problems"] for result in results if result["problems"]}
+    assert problems == {}
+    assert all(result["cumulative_ms"] <= check_import_time.IMPORT_TIME_BUDGET_MS for result in results)
+
+
+def test_settings_are_read_after_import(monkeypatch):
+    monkeypatch.setenv("OCR_CACHE_MEMORY_ITEMS", "7")
+    monkeypatch.setenv("TEXTRACT_MAX_TPS", "2.5")
+    monkeypatch.setenv("METRICS_LOG", "yes")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "key-id")
+    assert ocr_cache.OCRResultCache().memory_items == 7
+    assert rate_limit.rate_limits()["textract"] == (2.5, 1.0)
+    assert settings.setting("METRICS_LOG") is True
+    # settings the provider modules used to read at import stay module constants
+    assert aws_ocr.AWS_ACCESS_KEY_ID == "key-id"
+
+
+def test_unset_settings_fall_back_to_the_registry_default(monkeypatch):
+    monkeypatch.delenv("OCR_CACHE_TTL_SECONDS", raising=False)
+    assert settings.setting("OCR_CACHE_TTL_SECONDS") == settings.SETTINGS["OCR_CACHE_TTL_SECONDS"][1]
+    with pytest.raises(AttributeError):
+        aws_ocr.OCR_CACHE_TTL_SECONDS
+
+
+def test_enable_metrics_overrides_environment(monkeypatch):
+    monkeypatch.setenv("METRICS_ENABLED", "false")
+    monkeypatch.setattr(metrics, "_enabled", None)
+    assert not metrics.metrics_enabled()
+    metrics.enable_metrics()
+    assert metrics.span("ocr_request") is not metrics._NOOP_SPAN
+    metrics.disable_metrics()
+    assert metrics.span("ocr_request") is metrics._NOOP_SPAN
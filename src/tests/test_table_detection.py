@@ -0,0 +1,76 @@
+import os
+
+import aws_ocr
+from ocr_frontend import normalize_result
+from table_detection import detect_tables, has_tables
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "images", "test-1.png")
+
+
+def _center(polygon):
+    return sum(point["X"] for point in polygon) / len(polygon), sum(point["Y"] for point in polygon) / len(polygon)
+
+
+def _contains(polygon, point):
+    xs, ys = [corner["X"] for corner in polygon], [corner["Y"] for corner in polygon]
+    return min(xs) <= point[0] <= max(xs) and min(ys) <= point[1] <= max(ys)
+
+
+def _matched_cells(tables, provider_table):
+    """``{(provider row, provider column): detected text}`` for every detected cell centered in a provider cell."""
+    matches = {}
+    for table in tables:
+        for row_index, cells in table["polygon"].items():
+            for column_index, polygon in enumerate(cells):
+                center = _center(polygon)
+                for provider_row, provider_cells in provider_table["polygon"].items():
+                    for provider_column, provider_polygon in enumerate(provider_cells):
+                        if _contains(provider_polygon, center):
+                            matches[(provider_row, provider_column)] = table["rows"][row_index][column_index]
+    return matches
+
+
+def test_textract_table_is_found_in_the_text_only_words(recorded, textract_response, page_size):
+    provider_table = aws_ocr.get_aws_textract_result(textract_response, *page_size, use_extract_table=True)["tables"][0]
+    words = aws_ocr.get_aws_textract_result(recorded("aws-original-textract-without-table.json"), *page_size)["text_annotations"]
+    tables = detect_tables(words)
+    assert has_tables(words)
+
+    matches = _matched_cells(tables, provider_table)
+    # every cell but the last row's, which Textract reports as one cell merged over four columns
+    assert matches == {(row_index, column_index): text for row_index, cells in provider_table["rows"].items() if row_index < 6 for column_index, text in enumerate(cells)}
+    table = next(table for table in tables if list(table["rows"].values()) == list(provider_table["rows"].values())[:5])
+    assert table["column_count"] == provider_table["column_count"]
+    assert table["merged_cells"] == {} and all(len(table["scores"][row_index]) == table["column_count"] for row_index in table["rows"])
+
+
+def test_azure_table_cells_are_found(recorded):
+    result = normalize_result(recorded("azure-textract-with-table.json"), "azure-formrecognizer")
+    provider_table = result["tables"][0]
+    matches = _matched_cells(detect_tables(result["text_annotations"]), provider_table)
+
+    # the amounts under "Unit"; the two-line header row and the total row below the ruled lines are not found
+    assert {key: text for key, text in matches.items() if key[1] == 1} == {(row_index, 1): provider_table["rows"][row_index][1] for row_index in (2, 3, 4)}
+    for row_index in (3, 4):
+        # words of one cell are laid out without the spaces Azure puts between them
+        assert "".join(provider_table["rows"][row_index][0].split()).startswith("".join(matches[(row_index, 0)].split()))
+
+
+def test_table_engines_use_the_detector(monkeypatch, recorded, textract_response):
+    calls = []
+
+    def request(image_data, use_extract_table=False):
+        calls.append(use_extract_table)
+        return textract_response if use_extract_table else recorded("aws-original-textract-without-table.json")
+
+    monkeypatch.setattr(aws_ocr, "_aws_textract_request", request)
+    with open(IMAGE, "rb") as reader:
+        image_data = reader.read()
+
+    local = aws_ocr.aws_textract_tables(image_data, table_engine="local", use_cache=False)
+    assert calls == [False]
+    assert [table["rows"] for table in local["tables"]] == [table["rows"] for table in detect_tables(local["text_annotations"])]
+    # the page has a table, so prescreening goes on to pay for the provider's
+    prescreen = aws_ocr.aws_textract_tables(image_data, table_engine="prescreen", use_cache=False)
+    assert calls == [False, False, True]
+    assert prescreen["tables"][0]["rows"][6] == ["-", "-", "-", "-", "2103"]
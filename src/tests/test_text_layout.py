@@ -0,0 +1,51 @@
+"""``text_layout`` against the pandas line grouping it replaced.
+
+``data/aws-pretty-text.json`` holds the pandas ``sort_words_to_pretty_text`` output for the
+processed Textract results recorded in ``src/results``.
+"""
+import random
+
+import pytest
+
+import aws_ocr
+from text_layout import layout_text
+
+def test_pretty_text_matches_baseline(recorded, test_data):
+    expected = test_data("aws-pretty-text.json")
+    for key, text in expected.items():
+        name, _, thresholds = key.partition(":")
+        words = recorded(f"aws-textract-{name}.json")["text_annotations"]
+        kwargs = {}
+        if thresholds:
+            height, width = thresholds.split(":")
+            kwargs = {"space_height_threshold": int(height), "space_width_threshold": int(width)}
+        assert aws_ocr.sort_words_to_pretty_text(words, **kwargs) == text, key
+
+
+def _pandas_pretty_text(words_with_boxes, space_height_threshold=5, space_width_threshold=4):
+    """``sort_words_to_pretty_text`` as it was before text_layout."""
+    pd = pytest.importorskip("pandas")
+    botoms = sorted(set([t["bbox"]["b"] for t in words_with_boxes]))
+    text_df = pd.DataFrame([{"text": t["text"], "left": t["bbox"]["l"], "right": t["bbox"]["r"], "top": t["bbox"]["t"], "bottom": t["bbox"]["b"]} for t in words_with_boxes])
+    used_botoms = []
+    line_message = ""
+    for btm in botoms:
+        lines = text_df[~text_df.index.isin(used_botoms) & (text_df["bottom"] <= btm + space_height_threshold) & (text_df["bottom"] >= btm - space_height_threshold)]
+        if not lines.empty:
+            used_botoms.extend(lines.index)
+            lines = lines.sort_values(by="left")
+            prev_word = lines.iloc[0]
+            line_message += prev_word["text"]
+            for _, word in lines[1:].iterrows():
+                join_text = " " if word["left"] - prev_word["right"] > space_width_threshold else ""
+                line_message += join_text + word["text"]
+                prev_word = word
+            line_message += "\n"
+    return line_message
+
+
+def test_layout_text_matches_pandas_on_random_pages(random_words):
+    rng = random.Random(7)
+    for _ in range(200):
+        words = random_words(rng, rng.randrange(1, 40))
+        assert layout_text(words) == _pandas_pretty_text(words)
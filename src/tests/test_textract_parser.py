@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from textract_parser import iter_textract_blocks, parse_textract_response, parse_textract_stream
+
+
+def _thai_blocks():
+    words = ["ใบแจ้งหนี้", "บริษัท", "จำกัด", "1,250.00", "ภาษีมูลค่าเพิ่ม"]
+    return [
+        {"BlockType": "WORD", "Id": f"word-{index}", "Text": text, "Confidence": 99.5 - index, "Geometry": {"Polygon": [{"X": 0.1 * index, "Y": 1e-3}]}}
+        for index, text in enumerate(words)
+    ]
+
+
+def test_small_chunks_give_the_same_blocks(textract_response):
+    data = json.dumps(textract_response).encode("utf-8")
+    for chunk_size in (1, 2, 3, 7, 64, 4096):
+        assert list(iter_textract_blocks(io.BytesIO(data), chunk_size=chunk_size)) == textract_response["Blocks"]
+
+
+def test_multibyte_characters_split_across_chunks():
+    blocks = _thai_blocks()
+    data = json.dumps({"Blocks": blocks}, ensure_ascii=False).encode("utf-8")
+    # Thai characters are three bytes in UTF-8, so these sizes cut them at every offset
+    for chunk_size in (1, 2, 4, 5):
+        assert list(iter_textract_blocks(io.BytesIO(data), chunk_size=chunk_size)) == blocks
+    assert list(iter_textract_blocks(io.StringIO(data.decode("utf-8")), chunk_size=3)) == blocks
+
+
+def test_blocks_key_need_not_come_first(textract_response):
+    blocks = _thai_blocks()
+    response = {
+        "DocumentMetadata": {"Pages": 1},
+        "JobStatus": "SUCCEEDED",
+        "Warnings": [{"ErrorCode": "X", "Pages": [1, 2]}],
+        "NextToken": None,
+        "Blocks": blocks,
+        "AnalyzeDocumentModelVersion": "1.0",
+        "ResponseMetadata": {"HTTPStatusCode": 200, "RetryAttempts": 0},
+    }
+    data = json.dumps(response, ensure_ascii=False, indent=2).encode("utf-8")
+    for chunk_size in (1, 5, 64):
+        assert list(iter_textract_blocks(io.BytesIO(data), chunk_size=chunk_size)) == blocks
+    assert list(iter_textract_blocks(io.BytesIO(json.dumps({"DocumentMetadata": {"Pages": 0}}).encode()), chunk_size=4)) == []
+
+
+def test_bare_block_arrays():
+    blocks = _thai_blocks()
+    data = json.dumps(blocks, ensure_ascii=False).encode("utf-8")
+    for chunk_size in (1, 3, 1024):
+        assert list(iter_textract_blocks(io.BytesIO(data), chunk_size=chunk_size)) == blocks
+    assert list(iter_textract_blocks(io.BytesIO(b" [ ] "), chunk_size=1)) == []
+    with pytest.raises(ValueError):
+        list(iter_textract_blocks(io.BytesIO(b'"Blocks"')))
+
+
+def test_streamed_page_matches_the_loaded_one(tmp_path, textract_response, page_size):
+    path = tmp_path / "response.json"
+    path.write_text(json.dumps(textract_response), encoding="utf-8")
+    loaded = parse_textract_response(textract_response, *page_size)
+    streamed = parse_textract_stream(str(path), *page_size)
+    assert streamed.format_text == loaded.format_text
+    assert streamed.words.to_list() == loaded.words.to_list()
+    assert [block["Id"] for block in streamed.table_blocks] == [block["Id"] for block in loaded.table_blocks]
@@ -0,0 +1,94 @@
+import os
+from collections import OrderedDict
+
+import pytest
+from PIL import Image
+
+import vision_payload
+from image_prep import JPEG_QUALITY
+from vision_payload import VISION_MAX_JPEG_QUALITY, build_vision_content, estimate_image_tokens, fit_page_to_budget, page_jpeg_quality
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "images")
+
+
+@pytest.fixture
+def payload_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(vision_payload, "_payload_cache", cache)
+    return cache
+
+
+def _pages(*names):
+    return [Image.open(os.path.join(IMAGES_DIR, name)) for name in names]
+
+
+def test_image_token_estimate():
+    # 768x768 after the shortest-side step: 2x2 tiles
+    assert estimate_image_tokens(1024, 1024) == 85 + 170 * 4
+    # 2048 cap, then shortest side 768: 768x1536 is 2x3 tiles
+    assert estimate_image_tokens(2048, 4096) == 85 + 170 * 6
+    assert estimate_image_tokens(300, 200) == 85 + 170
+
+
+@pytest.mark.parametrize("size", [(1062, 1484), (2480, 3508), (4000, 1000), (600, 600)])
+@pytest.mark.parametrize("budget", [None, 2000, 765, 500, 100])
+def test_pages_are_fitted_as_large_as_the_budget_allows(size, budget):
+    width, height = fit_page_to_budget(*size, budget)
+    capped = fit_page_to_budget(*size)
+    assert max(capped) <= 2048 and abs(capped[0] / capped[1] - size[0] / size[1]) < 0.01
+    assert abs(width / height - size[0] / size[1]) < 0.01
+    if budget is None or estimate_image_tokens(*capped) <= budget:
+        assert (width, height) == capped
+        return
+    assert estimate_image_tokens(width, height) <= max(budget, 85 + 170)
+    # one more pixel of width costs another tile
+    assert estimate_image_tokens(width + 1, round(capped[1] * (width + 1) / capped[0])) > max(budget, 85 + 170)
+
+
+def test_shrunk_pages_are_encoded_at_a_higher_quality():
+    assert page_jpeg_quality(1062, 1484, 1062, 1484) == JPEG_QUALITY
+    qualities = [page_jpeg_quality(1062, 1484, *fit_page_to_budget(1062, 1484, budget)) for budget in (765, 500, 100)]
+    assert JPEG_QUALITY < qualities[0] < qualities[1] <= qualities[2] <= VISION_MAX_JPEG_QUALITY
+    assert page_jpeg_quality(1062, 1484, 1062, 1484, jpeg_quality=95) == 95
+
+
+def test_budget_is_split_across_pages(payload_cache):
+    _, full_stats = build_vision_content(_pages("test-1.png", "test-2.jpg"), image_token_budget=0)
+    content, stats = build_vision_content(_pages("test-1.png", "test-2.jpg"), image_token_budget=1000)
+    assert full_stats["jpeg_qualities"] == [JPEG_QUALITY] * 2
+    assert stats["pages"] == 2 and len(content) == 2 and content[0]["type"] == "image_url"
+    assert stats["estimated_image_tokens"] <= 1000 < full_stats["estimated_image_tokens"]
+    # test-2.jpg (640x480) already fits its 500 tokens and is sent as it is
+    assert stats["page_sizes"][1] == (640, 480) and stats["jpeg_qualities"][1] == JPEG_QUALITY
+    assert stats["page_sizes"][0] == fit_page_to_budget(1062, 1484, 500) and stats["jpeg_qualities"][0] > JPEG_QUALITY
+    # the quality raised on the smaller pages costs less than the pixels saved
+    assert stats["image_bytes"] < full_stats["image_bytes"]
+    assert stats["payload_bytes"] == sum(len(part["image_url"]["url"]) for part in content)
+    for (width, height), part in zip(stats["page_sizes"], content):
+        assert part["image_url"]["url"].startswith("data:image/jpeg;base64,")
+        assert estimate_image_tokens(width, height) <= 500
+
+
+def test_encoded_pages_are_cached_by_page_hash(payload_cache, monkeypatch):
+    encodes = []
+    encode_image = vision_payload.encode_image
+    monkeypatch.setattr(vision_payload, "encode_image", lambda image, **kwargs: encodes.append(image.size) or encode_image(image, **kwargs))
+
+    first, first_stats = build_vision_content(_pages("test-1.png", "test-2.jpg"), image_token_budget=1000)
+    # freshly decoded copies of the same pages
+    again, stats = build_vision_content(_pages("test-1.png", "test-2.jpg"), image_token_budget=1000)
+    assert again == first and stats["cached_pages"] == 2 and len(encodes) == 2
+    assert {key: value for key, value in stats.items() if key != "cached_pages"} == {key: value for key, value in first_stats.items() if key != "cached_pages"}
+
+    # another budget is another size, and an edited page another hash
+    build_vision_content(_pages("test-1.png"), image_token_budget=800)
+    edited = _pages("test-1.png")[0].convert("RGB")
+    edited.putpixel((0, 0), (255, 0, 0))
+    _, stats = build_vision_content([edited], image_token_budget=500)
+    assert stats["cached_pages"] == 0 and len(encodes) == 4
+
+    monkeypatch.setenv("VISION_PAYLOAD_CACHE_ITEMS", "2")
+    build_vision_content(_pages("test-3.jpg"), image_token_budget=500)
+    assert len(payload_cache) == 2
+    _, stats = build_vision_content(_pages("test-2.jpg"), image_token_budget=1000)
+    assert stats["cached_pages"] == 0
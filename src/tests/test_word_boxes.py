@@ -0,0 +1,37 @@
+import json
+
+import aws_ocr
+import azure_ocr
+from word_boxes import WordBoxes
+
+
+def test_textract_annotations_are_plain_json(textract_response, page_size):
+    result = aws_ocr.get_aws_textract_result(textract_response, *page_size, use_extract_table=True)
+    words = result["text_annotations"]
+    assert isinstance(words, list) and isinstance(words[0], dict)
+    json.dumps(result)
+
+    # callers extend the list in place and rebuild columns from it
+    count = len(words)
+    words.append({"bbox": {"pt1": (5, 6), "pt2": (45, 26), "l": 5, "t": 6, "r": 45, "b": 26}, "text": "เพิ่ม"})
+    assert len(words) == count + 1
+    assert words[-1]["bbox"]["l"] == 5 and words[-1]["bbox"]["b"] == 26 and words[-1]["text"] == "เพิ่ม"
+    columns = WordBoxes.from_dicts(words)
+    assert [len(column) for column in (columns.left, columns.top, columns.right, columns.bottom, columns.text_start, columns.text_end)] == [count + 1] * 6
+    assert [columns.left[-1], columns.top[-1], columns.right[-1], columns.bottom[-1]] == [5, 6, 45, 26]
+    assert columns.text(count) == "เพิ่ม" and columns.texts()[:count] == [word["text"] for word in words[:count]]
+
+
+def test_textract_columns_are_opt_in(textract_response, page_size):
+    columns = aws_ocr.get_aws_textract_result(textract_response, *page_size, as_columns=True)["text_annotations"]
+    assert isinstance(columns, WordBoxes)
+    assert json.loads(json.dumps(columns.to_list())) == json.loads(json.dumps(aws_ocr.get_aws_textract_result(textract_response, *page_size)["text_annotations"]))
+
+
+def test_azure_whole_number_coordinates_stay_float():
+    polygon = [{"x": 10.0, "y": 20.0}, {"x": 30.0, "y": 20.0}, {"x": 30.0, "y": 40.0}, {"x": 10.0, "y": 40.0}]
+    response = {"readResult": {"blocks": [{"lines": [{"text": "hello", "words": [{"text": "hello", "boundingPolygon": polygon}]}]}]}}
+    for as_columns in (False, True):
+        words = azure_ocr.get_azure_textannotations_formatedtext(response, as_columns=as_columns)["text_annotations"]
+        bbox = words[0]["bbox"]
+        assert [type(bbox[key]) for key in ("l", "t", "r", "b")] == [float] * 4
@@ -0,0 +1,81 @@
+from typing import Dict, List
+
+import numpy as np
+from word_boxes import WordBoxes
+
+
+def _word_arrays(word_sets: List[List[Dict] | WordBoxes]):
+    texts = []
+    columns = {"l": [], "r": [], "b": []}
+    for words in word_sets:
+        if not len(words):
+            continue
+        if isinstance(words, WordBoxes):
+            texts.extend(words.texts())
+            columns["l"].append(words.left)
+            columns["r"].append(words.right)
+            columns["b"].append(words.bottom)
+        else:
+            texts.extend(t["text"] for t in words)
+            for key, column in columns.items():
+                column.append(np.asarray([t["bbox"][key] for t in words]))
+
+    # int64/float64 like the dtypes pandas infers, so ties on "left" sort the same way
+    left, right, bottom = [np.concatenate(column) for column in columns.values()]
+    left, right, bottom = [array.astype(np.int64) if array.dtype.kind in "iu" else array for array in (left, right, bottom)]
+    return texts, left, right, bottom
+
+
+def _join_line(line: np.ndarray, texts: List[str], left: np.ndarray, right: np.ndarray, space_width_threshold) -> str:
+    """Join the words of one line, left to right, inserting a space on wide gaps."""
+    # restore input order before sorting so ties on "left" resolve like pandas sort_values
+    line = np.sort(line)
+    line = line[np.argsort(left[line], kind="quicksort")]
+    gaps = (left[line[1:]] - right[line[:-1]] > space_width_threshold).tolist()
+    indices = line.tolist()
+    parts = [texts[indices[0]]]
+    for index, gap in zip(indices[1:], gaps):
+        if gap:
+            parts.append(" ")
+        parts.append(texts[index])
+    parts.append("\n")
+    return "".join(parts)
+
+
+def layout_text_batch(word_sets: List[List[Dict] | WordBoxes], space_height_threshold=5, space_width_threshold=4) -> List[str]:
+    """Lay out several word sets (e.g. every table cell of a page) in one pass.
+
+    Words are sorted once by (set, bottom). Each distinct bottom ``b`` closes a line made of
+    the words not taken yet whose bottom is at most ``b + space_height_threshold``, so the
+    line boundaries of a set come from one vectorized ``searchsorted`` over its bottoms.
+    """
+    sizes = [len(words) for words in word_sets]
+    results = [""] * len(word_sets)
+    if not sum(sizes):
+        return results
+
+    texts, left, right, bottom = _word_arrays(word_sets)
+    group = np.repeat(np.arange(len(sizes)), sizes)
+    order = np.lexsort((bottom, group))
+    sorted_bottom = bottom[order]
+    group_bounds = np.concatenate(([0], np.cumsum(sizes)))
+
+    for set_index in range(len(word_sets)):
+        set_start, set_end = int(group_bounds[set_index]), int(group_bounds[set_index + 1])
+        set_bottoms = sorted_bottom[set_start:set_end]
+        if not len(set_bottoms):
+            continue
+        line_ends = np.searchsorted(set_bottoms, np.unique(set_bottoms) + space_height_threshold, side="right")
+        line_ends = np.unique(line_ends).tolist()
+        line_starts = [0] + line_ends[:-1]
+        results[set_index] = "".join(
+            _join_line(order[set_start + start : set_start + end], texts, left, right, space_width_threshold)
+            for start, end in zip(line_starts, line_ends)
+        )
+
+    return results
+
+
+def layout_text(words_with_boxes: List[Dict] | WordBoxes, space_height_threshold=5, space_width_threshold=4) -> str:
+    """Lay out one word set as plain text, one output line per visual line."""
+    return layout_text_batch([words_with_boxes], space_height_threshold, space_width_threshold)[0]
@@ -0,0 +1,156 @@
+import codecs
+import json
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, TextIO
+
+from word_boxes import WordBoxes
+
+STREAM_CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\r\n"
+DELIMITERS = WHITESPACE + ",:]}"
+
+
+class ParsedTextract(NamedTuple):
+    words: WordBoxes
+    format_text: str
+    blocks_map: Dict[str, Dict]
+    table_blocks: List[Dict]
+
+
+def parse_textract_blocks(blocks: Iterable[Dict], page_width=0, page_height=0, with_tables=True) -> ParsedTextract:
+    """Build words, reading-order text, the id map and the TABLE blocks in one pass over ``blocks``.
+
+    Blocks are read, never copied or modified. With ``with_tables=False`` no id map is kept, so
+    streamed blocks can be dropped as soon as they are parsed.
+    """
+    left, top, right, bottom, texts = [], [], [], [], []
+    lines = []
+    blocks_map = {}
+    table_blocks = []
+
+    for block in blocks:
+        block_type = block.get("BlockType")
+        if with_tables:
+            blocks_map[block.get("Id")] = block
+
+        if block_type == "WORD":
+            try:
+                bounding_box = block["Geometry"]["BoundingBox"]
+                word_left = int(bounding_box["Left"] * page_width)
+                word_top = int(bounding_box["Top"] * page_height)
+                word_right = word_left + int(bounding_box["Width"] * page_width)
+                word_bottom = word_top + int(bounding_box["Height"] * page_height)
+                text = block["Text"]
+            except (KeyError, TypeError):
+                continue
+            left.append(word_left)
+            top.append(word_top)
+            right.append(word_right)
+            bottom.append(word_bottom)
+            texts.append(text)
+
+        elif block_type == "LINE":
+            bounding_box = block["Geometry"]["BoundingBox"]
+            lines.append((bounding_box["Top"], bounding_box["Left"], block["Text"]))
+
+        elif block_type == "TABLE" and with_tables:
+            table_blocks.append(block)
+
+    lines.sort(key=lambda line: (line[0], line[1]))
+    format_text = "".join("{}\n".format(line[2]) for line in lines)
+    return ParsedTextract(WordBoxes.from_columns(left, top, right, bottom, texts), format_text, blocks_map, table_blocks)
+
+
+def parse_textract_response(response: Dict, page_width=0, page_height=0, with_tables=True) -> ParsedTextract:
+    return parse_textract_blocks(response.get("Blocks", []), page_width=page_width, page_height=page_height, with_tables=with_tables)
+
+
+class _JSONStream:
+    """Pull-based reader that decodes one JSON value at a time from a file-like object."""
+
+    def __init__(self, reader: BinaryIO | TextIO, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.reader.read(self.chunk_size)
+        self.eof = not chunk
+        if isinstance(chunk, (bytes, bytearray)):
+            chunk = self.text_decoder.decode(chunk, final=self.eof)
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or ``""`` at the end of the stream."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if char == "" or char not in chars:
+            raise ValueError("Malformed Textract JSON: expected one of {!r}, got {!r}".format(chars, char))
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number is only complete once a delimiter follows it, possibly in the next chunk
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in DELIMITERS):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_textract_blocks(source: str | BinaryIO | TextIO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Dict]:
+    """Stream the ``Blocks`` of a Textract response from a path or readable file/socket without loading it whole.
+
+    Accepts a full response object or a bare JSON array of blocks; only one block is held
+    in memory at a time besides whatever the consumer keeps.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as reader:
+            yield from iter_textract_blocks(reader, chunk_size=chunk_size)
+        return
+
+    stream = _JSONStream(source, chunk_size=chunk_size)
+    if stream.expect("{[") == "{":
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.expect(":")
+            if key == "Blocks":
+                break
+            stream.value()
+            if stream.expect(",}") == "}":
+                return
+        else:
+            return
+        stream.expect("[")
+
+    if stream.peek() == "]":
+        return
+    while True:
+        yield stream.value()
+        if stream.expect(",]") == "]":
+            return
+
+
+def parse_textract_stream(source: str | BinaryIO | TextIO, page_width=0, page_height=0, with_tables=True) -> ParsedTextract:
+    return parse_textract_blocks(iter_textract_blocks(source), page_width=page_width, page_height=page_height, with_tables=with_tables)
@@ -0,0 +1,142 @@
+import base64
+import concurrent.futures
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+from PIL import Image
+from image_prep import JPEG_QUALITY, PROVIDER_LIMITS, encode_image
+from settings import setting
+
+# GPT-4 Vision "high" detail pricing: fit 2048x2048, shortest side to 768, then 170 tokens per 512px tile + 85
+VISION_BASE_TOKENS = 85
+VISION_TILE_TOKENS = 170
+VISION_TILE_SIZE = 512
+# a page shrunk to fit its token budget is encoded at a higher JPEG quality, up to this one
+VISION_MAX_JPEG_QUALITY = 90
+
+_payload_cache = OrderedDict()
+_payload_cache_lock = threading.Lock()
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / VISION_TILE_SIZE) * math.ceil(height / VISION_TILE_SIZE)
+    return VISION_BASE_TOKENS + VISION_TILE_TOKENS * tiles
+
+
+def fit_page_to_budget(width: int, height: int, page_token_budget: int = None) -> Tuple[int, int]:
+    """Largest page size within the model's 2048px cap whose estimated tokens fit ``page_token_budget``."""
+    scale = min(1.0, PROVIDER_LIMITS["gpt-4-vision"]["max_side"] / max(width, height))
+    width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    if page_token_budget is None:
+        return width, height
+
+    # one tile is the least a page can cost
+    page_token_budget = max(page_token_budget, VISION_BASE_TOKENS + VISION_TILE_TOKENS)
+    if estimate_image_tokens(width, height) <= page_token_budget:
+        return width, height
+
+    def size(scaled_width: int) -> Tuple[int, int]:
+        return scaled_width, max(1, round(height * scaled_width / width))
+
+    # tokens never fall as the page grows, so search for the widest page within the budget
+    low, high = 1, width
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_image_tokens(*size(middle)) <= page_token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return size(low)
+
+
+def page_jpeg_quality(width: int, height: int, fitted_width: int, fitted_height: int, jpeg_quality: int = JPEG_QUALITY) -> int:
+    """JPEG quality for a ``width`` x ``height`` page sent at its fitted size.
+
+    Tokens depend on the size alone, so a page shrunk to fit its budget spends part of the
+    bytes it saved on quality: the quality rises from ``jpeg_quality`` towards
+    ``VISION_MAX_JPEG_QUALITY`` with the share of the area that was cut.
+    """
+    area_cut = 1 - (fitted_width * fitted_height) / (width * height)
+    return max(jpeg_quality, round(jpeg_quality + (VISION_MAX_JPEG_QUALITY - jpeg_quality) * area_cut))
+
+
+def _page_hash(image: Image.Image) -> str:
+    page_hash = hashlib.sha256("{}:{}x{}".format(image.mode, image.width, image.height).encode("utf-8"))
+    page_hash.update(image.tobytes())
+    return page_hash.hexdigest()
+
+
+def _encode_page(image: Image.Image, page_token_budget: int, jpeg_quality: int) -> dict:
+    # the quality trade is against the page as the model's 2048px cap would send it
+    capped_width, capped_height = fit_page_to_budget(image.width, image.height)
+    width, height = fit_page_to_budget(image.width, image.height, page_token_budget)
+    jpeg_quality = page_jpeg_quality(capped_width, capped_height, width, height, jpeg_quality)
+    cache_key = (_page_hash(image), width, height, jpeg_quality)
+    with _payload_cache_lock:
+        page = _payload_cache.get(cache_key)
+        if page is not None:
+            _payload_cache.move_to_end(cache_key)
+            return {**page, "cached": True}
+
+    if (width, height) != image.size:
+        image = image.resize((width, height), Image.LANCZOS)
+    prepared = encode_image(image, provider="gpt-4-vision", jpeg_quality=jpeg_quality)
+    page = {
+        "url": "data:image/jpeg;base64,{}".format(base64.b64encode(prepared.data).decode("utf-8")),
+        "width": prepared.width,
+        "height": prepared.height,
+        "bytes": len(prepared.data),
+        "tokens": estimate_image_tokens(prepared.width, prepared.height),
+        "jpeg_quality": jpeg_quality,
+    }
+    with _payload_cache_lock:
+        _payload_cache[cache_key] = page
+        while len(_payload_cache) > setting("VISION_PAYLOAD_CACHE_ITEMS"):
+            _payload_cache.popitem(last=False)
+    return {**page, "cached": False}
+
+
+def build_vision_content(
+    images: List[Image.Image],
+    image_token_budget: int = None,
+    jpeg_quality: int = JPEG_QUALITY,
+    max_workers: int = None,
+) -> Tuple[List[dict], dict]:
+    """Encode pages in parallel into ``image_url`` message parts that fit ``image_token_budget``.
+
+    The budget is split evenly across pages, and each page is sent at the largest size that
+    fits its share, at a JPEG quality raised by ``page_jpeg_quality`` when it had to shrink.
+    Encoded pages are cached by pixel hash, so a
+    retry or a second prompt over the same pages skips the encode. Returns the message parts
+    and the request's payload stats. ``None`` arguments fall back to ``VISION_IMAGE_TOKEN_BUDGET``
+    and ``VISION_ENCODE_WORKERS``.
+    """
+    if image_token_budget is None:
+        image_token_budget = setting("VISION_IMAGE_TOKEN_BUDGET")
+    if max_workers is None:
+        max_workers = setting("VISION_ENCODE_WORKERS")
+    page_token_budget = image_token_budget // len(images) if image_token_budget and images else None
+    # lazily opened images are not safe to load from several threads at once
+    for image in images:
+        image.load()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = list(executor.map(lambda image: _encode_page(image, page_token_budget, jpeg_quality), images))
+
+    content = [{"type": "image_url", "image_url": {"url": page["url"]}} for page in pages]
+    stats = {
+        "pages": len(pages),
+        "payload_bytes": sum(len(page["url"]) for page in pages),
+        "image_bytes": sum(page["bytes"] for page in pages),
+        "estimated_image_tokens": sum(page["tokens"] for page in pages),
+        "cached_pages": sum(page["cached"] for page in pages),
+        "page_sizes": [(page["width"], page["height"]) for page in pages],
+        "jpeg_qualities": [page["jpeg_quality"] for page in pages],
+    }
+    return content, stats
@@ -0,0 +1,174 @@
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+def _coordinate_array(values) -> np.ndarray:
+    values = np.asarray(values)
+    # int32 for integer pixel coordinates (Textract); float coordinates (Azure) stay float even when whole
+    if values.dtype.kind in "iu" and (not len(values) or np.abs(values).max() < 2**31):
+        return values.astype(np.int32)
+    return values.astype(np.float64)
+
+
+class BBoxView(Mapping):
+    """Read-only ``{"pt1", "pt2", "l", "t", "r", "b"}`` view of one word's box."""
+
+    __slots__ = ("_boxes", "_row")
+
+    def __init__(self, boxes: "WordBoxes", row: int):
+        self._boxes = boxes
+        self._row = row
+
+    def __getitem__(self, key):
+        boxes, row = self._boxes, self._row
+        if key == "l":
+            return boxes.left[row].item()
+        if key == "t":
+            return boxes.top[row].item()
+        if key == "r":
+            return boxes.right[row].item()
+        if key == "b":
+            return boxes.bottom[row].item()
+        if key == "pt1":
+            return (self["l"], self["t"])
+        if key == "pt2":
+            return (self["r"], self["b"])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("pt1", "pt2", "l", "t", "r", "b"))
+
+    def __len__(self):
+        return 6
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class WordBoxView(Mapping):
+    """Read-only ``{"bbox", "text"}`` view of one word, shaped like the legacy text annotation dict."""
+
+    __slots__ = ("_boxes", "_row")
+
+    def __init__(self, boxes: "WordBoxes", row: int):
+        self._boxes = boxes
+        self._row = row
+
+    def __getitem__(self, key):
+        if key == "bbox":
+            return BBoxView(self._boxes, self._row)
+        if key == "text":
+            return self._boxes.text(self._row)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("bbox", "text"))
+
+    def __len__(self):
+        return 2
+
+    def __repr__(self):
+        return repr({"bbox": dict(self["bbox"]), "text": self["text"]})
+
+
+class WordBoxes(Sequence):
+    """Columnar ``text_annotations``: coordinate arrays plus one packed string table.
+
+    Returned by the OCR functions only with ``as_columns=True``; their default stays the plain
+    JSON-native list of dicts, which ``to_list`` rebuilds. Indexing returns a lazy dict-like
+    ``WordBoxView`` so code reading ``word["bbox"]["l"]`` keeps working. Slices share the
+    coordinate arrays and ``take``/``filter`` share the string table, so neither copies the
+    words' text.
+    """
+
+    __slots__ = ("left", "top", "right", "bottom", "text_table", "text_start", "text_end")
+
+    def __init__(self, left, top, right, bottom, text_table: str, text_start, text_end):
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+        self.text_table = text_table
+        self.text_start = text_start
+        self.text_end = text_end
+
+    @classmethod
+    def from_columns(cls, left: List, top: List, right: List, bottom: List, texts: List[str]) -> "WordBoxes":
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        text_end = np.cumsum(lengths)
+        if not len(text_end) or text_end[-1] < 2**31:
+            lengths, text_end = lengths.astype(np.int32), text_end.astype(np.int32)
+        return cls(
+            _coordinate_array(left),
+            _coordinate_array(top),
+            _coordinate_array(right),
+            _coordinate_array(bottom),
+            "".join(texts),
+            text_end - lengths,
+            text_end,
+        )
+
+    @classmethod
+    def from_dicts(cls, words: Iterable[Dict]) -> "WordBoxes":
+        words = list(words)
+        return cls.from_columns(
+            [word["bbox"]["l"] for word in words],
+            [word["bbox"]["t"] for word in words],
+            [word["bbox"]["r"] for word in words],
+            [word["bbox"]["b"] for word in words],
+            [word["text"] for word in words],
+        )
+
+    def __len__(self):
+        return len(self.left)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return WordBoxes(self.left[index], self.top[index], self.right[index], self.bottom[index], self.text_table, self.text_start[index], self.text_end[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("word index out of range")
+        return WordBoxView(self, index)
+
+    def take(self, indices) -> "WordBoxes":
+        indices = np.asarray(indices, dtype=np.int64)
+        return WordBoxes(self.left[indices], self.top[indices], self.right[indices], self.bottom[indices], self.text_table, self.text_start[indices], self.text_end[indices])
+
+    def filter(self, mask) -> "WordBoxes":
+        return self.take(np.flatnonzero(mask))
+
+    def text(self, row: int) -> str:
+        return self.text_table[self.text_start[row] : self.text_end[row]]
+
+    def texts(self) -> List[str]:
+        table = self.text_table
+        return [table[start:end] for start, end in zip(self.text_start.tolist(), self.text_end.tolist())]
+
+    def to_list(self) -> List[Dict]:
+        """Plain legacy ``[{"bbox": {...}, "text": ...}]`` dicts, e.g. for JSON output."""
+        return [
+            {"bbox": {"pt1": (l, t), "pt2": (r, b), "l": l, "t": t, "r": r, "b": b}, "text": text}
+            for l, t, r, b, text in zip(self.left.tolist(), self.top.tolist(), self.right.tolist(), self.bottom.tolist(), self.texts())
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.left, self.top, self.right, self.bottom, self.text_start, self.text_end)
+        return sum(array.nbytes for array in arrays) + len(self.text_table.encode("utf-8"))
+
+    def __repr__(self):
+        return "WordBoxes({} words)".format(len(self))
+
+
+def json_default(value):
+    """``json.dumps(..., default=json_default)`` hook for results holding ``WordBoxes``."""
+    if isinstance(value, WordBoxes):
+        return value.to_list()
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")